@@ -1,38 +1,82 @@
 
 # import our avro libraries
-import avro.schema
-from avro.datafile import DataFileReader, DataFileWriter
-from avro.io import DatumReader, DatumWriter
+import io
+import os
+import json
+from fastavro import parse_schema, schemaless_reader, schemaless_writer
 
-# set the schema of interest
-schema = avro.schema.parse(open("slackSchema.avsc", "rb").read())
+# set the schema of interest, relative to this file so the module can be
+# imported from the producer and the consumer
+SCHEMA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'slackSchema.avsc')
+schema = parse_schema(json.load(open(SCHEMA_PATH, "rb")))
+
+# the fields of a slack message produced to kafka and the name of
+# each one in our avro schema
+FIELDS = [
+    ('user', 'user_id'),
+    ('type', 'record_type'),
+    ('text', 'text'),
+    ('channel', 'channel'),
+    ('ts', 'timestamp'),
+    ('team', 'team'),
+    ('message_url', 'message_url'),
+    ('uuid', 'uuid'),
+]
+MESSAGE_KEYS = sorted(key for key, _ in FIELDS)
+
+
+class AvroCodec(object):
+
+    """Binary avro codec for the slack messages sent through kafka.
+
+    The schema is parsed once and messages are encoded into a reused
+    buffer. Instances are not thread safe, use one codec per thread.
+    """
+
+    def __init__(self, schema=schema):
+        self.schema = schema
+        self.buffer = io.BytesIO()
+
+    @staticmethod
+    def accepts(message):
+        """Whether the message has exactly the fields of our schema"""
+        return sorted(message.keys()) == MESSAGE_KEYS
+
+    def encode(self, message):
+        """Serializes a message dictionary to avro binary
+
+        Raises a ValueError if the message does not fit our schema
+        (eg. a status change from the RTM api)
+        """
+        if not self.accepts(message):
+            raise ValueError(
+                'Message does not fit the avro schema: {}'.format(message))
+        record = dict((name, message[key]) for key, name in FIELDS)
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        schemaless_writer(self.buffer, self.schema, record)
+        return self.buffer.getvalue()
+
+    def decode(self, raw):
+        """Deserializes avro binary to a message dictionary with the
+        same keys the producer sent"""
+        record = schemaless_reader(io.BytesIO(raw), self.schema)
+        return dict((key, record[name]) for key, name in FIELDS)
 
 
 # a method to parse the data from Slack's RTM api and serialize it given a single message
+_codec = None
 def avroSerialize(message):
-    """takes as input a message loops through each part of the message, 
-    and attempts to serialize it and return the new AVRO serialized message"""
-    
-    # set up a writer to serialize data
-    writer = DatumWriter(schema)
-    
-    # we set up a try loop because the RTM may return messages
-    # that are not actual messages that fit our Avro schema
-    try: 
-            
-        # set up a new converted message
-        new_message = {}
-        new_message['user_id'] = message['user']
-        new_message['record_type'] = message['type']
-        new_message['text'] = message['text']
-        new_message['channel'] = message['channel']
-        new_message['time_stamp'] = message['ts']
-
-        # serialize the message and return it
-        return writer.write(new_message)
-    
-    # if we fail to write successfully, it's probably that we were
-    # attempting to write a message that we don't care about, like
-    # a status change. if this happens, we'll pass
-    except:
-        pass
\ No newline at end of file
+    """takes as input a message and returns the new AVRO serialized
+    message, or None if the message does not fit our schema"""
+    global _codec
+    if _codec is None:
+        _codec = AvroCodec()
+
+    # the RTM may return messages that are not actual messages that
+    # fit our Avro schema, like a status change. if this happens, we'll pass
+    try:
+        return _codec.encode(message)
+    except ValueError:
+        pass
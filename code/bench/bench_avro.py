@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the kafka message encoding: avro codec vs the previous json text
+
+Run from the `code` folder:
+
+    python bench/bench_avro.py [--messages N]
+"""
+import os
+import sys
+import json
+import uuid
+import argparse
+import timeit
+
+CODE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CODE_PATH, 'Avro'))
+
+from avroSerializer import AvroCodec
+
+
+MESSAGE = {
+    u'user': u'U123ABC45',
+    u'type': u'message',
+    u'text': u'hey folks, does anyone know how the classifier thresholds work? é',
+    u'channel': u'general',
+    u'ts': u'1476123456.000100',
+    u'team': u'T0ABCDEF',
+    u'message_url': u'https://team.slack.com/archives/general/p1476123456000100',
+    u'uuid': unicode(uuid.uuid1()),
+}
+
+
+def best_time(func, number, repeat=3):
+    """Best time per call (in microseconds) over `repeat` runs of `number` calls"""
+    return min( timeit.repeat(func, number=number, repeat=repeat) ) / number * 1e6
+
+
+def main(n_messages):
+    codec = AvroCodec()
+    raw_avro = codec.encode(MESSAGE)
+    raw_json = json.dumps(MESSAGE)
+    assert codec.decode(raw_avro) == json.loads(raw_json)
+
+    print 'payload   avro {:6d} B    json {:6d} B'.format(len(raw_avro), len(raw_json))
+    print 'encode    avro {:6.1f} us   json {:6.1f} us'.format(best_time(lambda: codec.encode(MESSAGE), n_messages),
+                                                          best_time(lambda: json.dumps(MESSAGE), n_messages))
+    print 'decode    avro {:6.1f} us   json {:6.1f} us'.format(best_time(lambda: codec.decode(raw_avro), n_messages),
+                                                          best_time(lambda: json.loads(raw_json), n_messages))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the avro and json encodings of a slack message')
+    parser.add_argument('--messages', type=int, default=20000, help='Messages encoded and decoded per run')
+    args = parser.parse_args()
+    main(args.messages)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the SimpleCleaner over the validation corpus: translate pass vs the previous regex substitutions
+
+The previous cleaner (three regex substitutions, stopwords scanned in a list) is reproduced in `regex_clean`, and
+both cleaners are checked to give the same output before timing them. Run from the `code` folder:
+
+    python bench/bench_cleaner.py [--repeat N]
+"""
+import io
+import os
+import sys
+import argparse
+import timeit
+
+CODE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(CODE_PATH)
+
+from nlp.grammar.tokenizer import SimpleCleaner
+from nlp.text.stopwords import STOPWORDS
+
+VALIDATION_PATH = os.path.join(os.path.dirname(CODE_PATH), 'data', 'validation', 'validation1.txt')
+
+
+def regex_clean(text, patterns=SimpleCleaner.PATTERNS):
+    """Previous SimpleCleaner: three regex substitutions and a scan of the stopword list per token"""
+    text = patterns['user'].sub('', text.lower() )
+    text = patterns['symbols_remove'].sub('', text)
+    text = patterns['symbols_space'].sub(' ', text)
+    return ' '.join( filter(lambda x: x not in STOPWORDS, text.split()) )
+
+
+def load_texts(path=VALIDATION_PATH):
+    """Texts of the validation corpus (one `timestamp<TAB>text` message per line)"""
+    with io.open(path, encoding='utf-8') as f:
+        return [ line.rstrip('\n').split('\t', 1)[-1] for line in f ]
+
+
+def main(repeat):
+    cleaner = SimpleCleaner()
+    texts = load_texts() * repeat
+    assert [ regex_clean(t) for t in texts ] == cleaner.clean_many(texts)
+
+    timings = [ ('regex', lambda: [ regex_clean(t) for t in texts ]),
+                ('translate', lambda: [ cleaner(t) for t in texts ]),
+                ('clean_many', lambda: cleaner.clean_many(texts)) ]
+    print '{} messages'.format(len(texts))
+    for name, func in timings:
+        print '{:12s} {:6.1f} us/message'.format(name, min(timeit.repeat(func, number=1, repeat=3)) / len(texts) * 1e6)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the SimpleCleaner over the validation corpus')
+    parser.add_argument('--repeat', type=int, default=20, help='Times the validation corpus is cleaned per run')
+    args = parser.parse_args()
+    main(args.repeat)
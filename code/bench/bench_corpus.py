@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the Corpus construction on synthetic windows of growing size: single pass vs the previous
+reduce-concatenation
+
+The previous construction (documents flattened with `reduce`, dictionary built afterwards) is reproduced in
+`reduce_from_window`, and both constructions are checked to give the same corpus. Run from the `code` folder:
+
+    python bench/bench_corpus.py [--n-grams N] [--sizes 5000 10000 20000 40000]
+"""
+import os
+import sys
+import random
+import argparse
+import timeit
+from collections import Counter
+
+CODE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(CODE_PATH)
+
+from gensim import corpora
+from nlp.text.corpus import from_window, get_ngrams
+
+
+class SyntheticMessage(object):
+    def __init__(self, text):
+        self.text = text
+
+
+def synthetic_window(n_messages, n_topics=10, vocabulary_size=3000, seed=0):
+    """Window of `n_topics` topics with random messages of 1 to 15 words"""
+    rnd = random.Random(seed)
+    vocabulary = [ 'w{}'.format(i) for i in xrange(vocabulary_size) ]
+    return [ [ SyntheticMessage(' '.join( rnd.choice(vocabulary) for _ in xrange(rnd.randint(1, 15)) ))
+               for _ in xrange(n_messages // n_topics) ]
+             for _ in xrange(n_topics) ]
+
+
+def reduce_from_window(window, n_grams=1):
+    """Previous construction: (dictionary, bag-of-words, token counter) with the documents flattened by `reduce`"""
+    if n_grams == 1:
+        documents = [ ' '.join( map(lambda msg: msg.text, tpc) ).lower().split() for tpc in window ]
+    else:
+        documents = [ reduce(lambda x,y: x+y, map(lambda msg: get_ngrams(msg.text.lower(), n_grams), tpc) ) for tpc in window ]
+    token_count = Counter( reduce(lambda x,y: x+y, documents) )
+    dictionary = corpora.Dictionary(documents)
+    return dictionary, [ dictionary.doc2bow(tpc) for tpc in documents ], token_count
+
+
+def main(sizes, n_grams):
+    print 'messages    reduce    single pass   (per 1000 messages)'
+    for size in sizes:
+        window = synthetic_window(size)
+        dictionary, bow, token_count = reduce_from_window(window, n_grams=n_grams)
+        corpus = from_window(window, n_grams=n_grams)
+        assert (corpus.dictionary.token2id, corpus.corpus, corpus.token_count) == (dictionary.token2id, bow, token_count)
+
+        t_reduce = min( timeit.repeat(lambda: reduce_from_window(window, n_grams=n_grams), number=1, repeat=3) )
+        t_single = min( timeit.repeat(lambda: from_window(window, n_grams=n_grams), number=1, repeat=3) )
+        print '{:8d} {:8.3f} s {:8.3f} s     ({:.3f} s / {:.3f} s)'.format(size, t_reduce, t_single,
+                                                                          t_reduce / size * 1000, t_single / size * 1000)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the Corpus construction on synthetic windows')
+    parser.add_argument('--n-grams', type=int, default=2, help='Size of the n-grams of the corpus')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 10000, 20000, 40000], help='Messages per window')
+    args = parser.parse_args()
+    main(args.sizes, args.n_grams)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the runner on a synthetic multi-channel dataset: channels in sequence vs spread across a process pool
+
+The Cassandra extractor is replaced by a synthetic one (random messages over the last six weeks of every channel),
+the GloVe table by a random table of the synthetic vocabulary and the uploads by a count of the wordclouds, so only
+the classification and the rendering are measured. Run from the `code/nlp` folder (as `runners.py`):
+
+    python ../bench/bench_runner.py [--channels N] [--messages N] [--processes 1 2 4] [--incremental]
+"""
+import os
+import sys
+import random
+import shutil
+import argparse
+import tempfile
+import timeit
+import multiprocessing
+
+import numpy as np
+
+CODE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(CODE_PATH)
+sys.path.append(os.path.join(CODE_PATH, 'nlp'))
+
+import runners
+from nlp.geometry.repr import GloVe
+from nlp.models.similarity_calculation import MessageSimilarity
+from nlp.text.extractor import CassandraExtractor
+from nlp.text.message import Message
+
+
+class SyntheticGloVe(GloVe):
+    """GloVe table of the synthetic vocabulary: the words of a subject are random vectors around a common direction"""
+    def __init__(self, subjects, dim=100, noise=.5, seed=0):
+        self.mmap = False
+        self.terms, self.vectors = None, None
+        rnd = np.random.RandomState(seed)
+        self.vocab = { self.UNKNOWN: rnd.randn(dim) }
+        for words in subjects:
+            direction = rnd.randn(dim)
+            self.vocab.update( (w, direction + noise * rnd.randn(dim)) for w in words )
+
+
+class SyntheticExtractor(object):
+    """Streams random messages of every channel, spread over the last six weeks
+
+    Each channel talks about a few subjects, every subject having its own words
+    """
+    TIME_CALLS = CassandraExtractor.TIME_CALLS
+    SPAN = 6 * 7 * 24 * 3600
+
+    def __init__(self, channels, n_messages, n_subjects=8, subject_words=40, seed=0):
+        rnd = random.Random(seed)
+        vocabulary = [ 'w{}'.format(i) for i in xrange(n_subjects * subject_words) ]
+        self.subjects = [ vocabulary[s * subject_words:(s + 1) * subject_words] for s in xrange(n_subjects) ]
+        now = CassandraExtractor.TIME_CALLS['hour'](0)
+
+        self.messages = {}
+        for channel in channels:
+            timestamps = sorted( now - rnd.random() * self.SPAN for _ in xrange(n_messages) )
+            self.messages[channel] = [ (ts, ' '.join( rnd.sample(rnd.choice(self.subjects), rnd.randint(5, 15)) ))
+                                       for ts in timestamps ]
+
+    def get_messages(self, type_of_query, periods=1, channel=None, min_words=5):
+        since = self.TIME_CALLS[type_of_query](periods)
+        for i, (ts, text) in enumerate(self.messages[channel]):
+            if ts > since:
+                yield Message(i, text, 'U0000000', team='T0000000', url='https://synthetic/{}/{}'.format(channel, i),
+                              timestamp=ts)
+
+
+# Wordclouds "uploaded" by the current run
+UPLOADED = []
+
+
+def upload_window(team, channel, duration, duration_unit, vizes):
+    """Counts the wordclouds instead of uploading them"""
+    UPLOADED.append(len(vizes))
+    return len(vizes)
+
+
+def run_serial(teams, channels, extractor, msg_sim, incremental):
+    for team in teams:
+        for channel in channels:
+            runners.run_channel(extractor, msg_sim, team, channel, incremental=incremental)
+
+
+def main(n_channels, n_messages, processes, incremental):
+    teams = ['T0000000']
+    channels = [ 'c{}'.format(c) for c in xrange(n_channels) ]
+    extractor = SyntheticExtractor(channels, n_messages)
+    msg_sim = MessageSimilarity(representation=SyntheticGloVe(extractor.subjects))
+
+    runners.upload_window = upload_window
+    runners.init_worker = lambda: runners.WORKER.update(casdb=extractor)
+
+    print '{} channels x {} messages, {} cores'.format(n_channels, n_messages, multiprocessing.cpu_count())
+    timings = []
+    for n_processes in processes:
+        # Every run renders its wordclouds from scratch
+        runners.CLOUD_CACHE_FOLDER = tempfile.mkdtemp()
+        del UPLOADED[:]
+        try:
+            if n_processes == 1:
+                run = lambda: run_serial(teams, channels, extractor, msg_sim, incremental)
+            else:
+                run = lambda: runners.run_parallel(teams, channels, msg_sim, n_processes, incremental=incremental)
+            timings.append( timeit.timeit(run, number=1) )
+        finally:
+            shutil.rmtree(runners.CLOUD_CACHE_FOLDER, True)
+
+        print '{:3d} processes {:8.2f} s   speedup {:.2f}   ({} wordclouds)'.format(n_processes, timings[-1],
+                                                                              timings[0] / timings[-1], sum(UPLOADED))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the runner on a synthetic multi-channel dataset')
+    parser.add_argument('--channels', type=int, default=16, help='Synthetic channels')
+    parser.add_argument('--messages', type=int, default=300, help='Messages of every channel (over six weeks)')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Pool sizes to time (1 runs the channels in sequence, the first one is the reference)')
+    parser.add_argument('--incremental', action='store_true', help='Classify the longest horizon once per channel')
+    args = parser.parse_args()
+    main(args.channels, args.messages, args.processes, args.incremental)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the summarization engines on synthetic windows: SparseTFIDF vs the gensim-based TFIDF
+
+Each engine is built on the same window and asked for the top terms of every topic (n-grams and unigrams), as the
+wordclouds of a window do. Run from the `code` folder:
+
+    python bench/bench_tfidf.py [--topics N] [--sizes 5000 20000 80000]
+"""
+import os
+import sys
+import random
+import argparse
+import timeit
+
+CODE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(CODE_PATH)
+
+from nlp.models.summarization import TFIDF, SparseTFIDF
+
+
+class SyntheticMessage(object):
+    def __init__(self, text):
+        self.text = text
+
+
+def synthetic_window(n_messages, n_topics=50, vocabulary_size=3000, topic_vocabulary_size=600, seed=0):
+    """Window of `n_topics` topics with random messages of 1 to 15 distinct words
+
+    Each topic draws its words from its own slice of the vocabulary (overlapping with the neighbouring topics), so no
+    word is in every topic and every n-gram has a scored word, as TFIDF needs
+    """
+    rnd = random.Random(seed)
+    vocabulary = [ 'w{}'.format(i) for i in xrange(vocabulary_size) ]
+    step = vocabulary_size // n_topics
+    topic_vocabularies = [ [ vocabulary[(t * step + i) % vocabulary_size] for i in xrange(topic_vocabulary_size) ]
+                           for t in xrange(n_topics) ]
+    return [ [ SyntheticMessage(' '.join( rnd.sample(words, rnd.randint(1, 15)) )) for _ in xrange(n_messages // n_topics) ]
+             for words in topic_vocabularies ]
+
+
+def summarize(engine, window, n_grams=2, top=10, top_unigrams=5):
+    """Top n-grams and top unigrams of every topic of the window"""
+    model = engine(window, n_grams=n_grams)
+    return [ (model.get_top_terms(d, top=top), model.get_top_terms(d, top=top_unigrams, unigram=True))
+             for d in xrange(len(window)) ]
+
+
+def main(sizes, n_topics):
+    print 'messages      TFIDF  SparseTFIDF'
+    for size in sizes:
+        window = synthetic_window(size, n_topics=n_topics)
+        t_gensim = min( timeit.repeat(lambda: summarize(TFIDF, window), number=1, repeat=3) )
+        t_sparse = min( timeit.repeat(lambda: summarize(SparseTFIDF, window), number=1, repeat=3) )
+        print '{:8d} {:8.2f} s {:10.2f} s'.format(size, t_gensim, t_sparse)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the summarization engines on synthetic windows')
+    parser.add_argument('--topics', type=int, default=50, help='Topics per window')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 20000, 80000], help='Messages per window')
+    args = parser.parse_args()
+    main(args.sizes, args.topics)
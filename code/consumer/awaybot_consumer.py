@@ -20,14 +20,21 @@
 from kafka import KafkaClient, KafkaConsumer
 from cassandra import ConsistencyLevel
 from cassandra.cluster import Cluster
-from cassandra.query import SimpleStatement
+from cassandra.query import SimpleStatement, BatchStatement, BatchType
+from collections import defaultdict
 import logging
 import logging.handlers
 import time
 import json
+import os
 import sys
 import uuid
 
+# For our internal toolbox imports
+path_to_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(path_to_here, '..', 'Avro'))
+from avroSerializer import AvroCodec
+
 
 logger = logging.getLogger('awaybot_consumer_logger')
 logger.setLevel(logging.DEBUG)
@@ -56,7 +63,15 @@ class AwaybotConsumer:
 
     """A class for consuming messages from awaybot kafka cluster."""
 
-    def __init__(self, kafka_ip, kafka_topic, cassandra_ip, keyspace):
+    MESSAGE_KEYS = sorted(
+        [
+            u'text', u'ts', u'user',
+            u'team', u'type',
+            u'channel', u'uuid', u'message_url'
+        ])
+
+    def __init__(self, kafka_ip, kafka_topic, cassandra_ip, keyspace,
+                 group_id=None):
         """
         Constructor for AwaybotConsumer class
 
@@ -73,7 +88,13 @@ class AwaybotConsumer:
             The format of the list is ['host', 'host', ...]
         keyspace: str
             The cassandra keyspace where we will insert data to
+        group_id: str
+            The kafka consumer group. Offsets are only committed (once
+            the writes are acknowledged) if a group is supplied.
+            Default: None
         """
+        self.group_id = group_id
+        self.codec = AvroCodec()
         try:
             logger.info(
                 "Initializing cassandra connection"
@@ -92,27 +113,30 @@ class AwaybotConsumer:
                 " with parameters:\n\tip: {}\n\topic: {}".format(
                     kafka_ip, kafka_topic))
             self.consumer = KafkaConsumer(
-                kafka_topic, bootstrap_servers=kafka_ip)
+                kafka_topic, bootstrap_servers=kafka_ip,
+                group_id=group_id, enable_auto_commit=False)
         except:
             logging.error(
                 "Failed to connect to kafka cluster", exc_info=True)
             sys.exit()
 
 
-if __name__ == "__main__":
-    try:
-        logger.info("Starting __main__, simple test for awaybot_consumer.py")
+    def createTable(self, table_name):
+        """
+        Function that creates the messages table (if it does not exist)
+        and prepares the insert statement for it.
 
-        ac = AwaybotConsumer(
-            "54.197.178.209:9092",
-            "test_topic",
-            ['54.175.189.47'],
-            'test_keyspace')
-        logger.info("Connected to kafka and cassandra clusters!")
-        # for msg in ac.consumer:
-        #     print msg
-        ac.session.execute("""
-            CREATE TABLE IF NOT EXISTS awaybot_messages (
+        Parameters:
+        -----------
+        table_name: str
+            The name of the cassandra table the messages are written to
+
+        Returns:
+        ----------
+        None
+        """
+        self.session.execute("""
+            CREATE TABLE IF NOT EXISTS {} (
                 uuid text,
                 message_text text,
                 ts text,
@@ -123,32 +147,152 @@ if __name__ == "__main__":
                 message_url text,
                 PRIMARY KEY (channel, ts)
             )
-            """)
-        prepared_msg = ac.session.prepare("""
-            INSERT INTO awaybot_messages (uuid, message_text, ts,
+            """.format(table_name))
+        self.prepared_msg = self.session.prepare("""
+            INSERT INTO {} (uuid, message_text, ts,
                 user, team, type, channel, message_url)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """)
-        for msg in ac.consumer:
-            msg = json.loads(msg.value)
-            if sorted(
-                [
-                    u'text', u'ts', u'user',
-                    u'team', u'type',
-                    u'channel', u'uuid', u'message_url'
-                ]
-                    ) == sorted(msg.keys()):
-
-                ac.session.execute(
-                    prepared_msg, 
-                    (msg['uuid'], msg['text'],
-                     msg['ts'], msg['user'], 
-                     msg['team'], msg['type'],
-                     msg['channel'], msg['message_url']))
-                # logger.info(
-                #     'Consume Message:\n{}'.format(msg['uuid']))
-                logger.info(msg)
-            
+            """.format(table_name))
+        return
+
+
+    def writeMessages(self, messages, batch_size=50, max_in_flight=32):
+        """
+        Function that writes the messages to cassandra and waits until
+        every write is acknowledged. Messages are grouped by partition
+        (channel) into unlogged batches, which are sent concurrently.
+
+        Parameters:
+        -----------
+        messages: list
+            List of message dictionaries (as produced by AwaybotProducer)
+        batch_size: int
+            Maximum amount of messages per batch
+            Default: 50
+        max_in_flight: int
+            Maximum amount of batches waiting for acknowledgement
+            Default: 32
+
+        Returns:
+        ----------
+        None
+
+        Raises:
+        ----------
+        Exception
+            If any of the writes failed
+        """
+        partitions = defaultdict(list)
+        for msg in messages:
+            partitions[msg['channel']].append(msg)
+
+        futures = []
+        for channel_messages in partitions.itervalues():
+            for i in xrange(0, len(channel_messages), batch_size):
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+                for msg in channel_messages[i:i + batch_size]:
+                    batch.add(
+                        self.prepared_msg,
+                        (msg['uuid'], msg['text'],
+                         msg['ts'], msg['user'],
+                         msg['team'], msg['type'],
+                         msg['channel'], msg['message_url']))
+
+                # Bound the amount of batches in flight
+                if len(futures) >= max_in_flight:
+                    futures.pop(0).result()
+                futures.append(self.session.execute_async(batch))
+
+        for future in futures:
+            future.result()
+        return
+
+
+    def decodeRecord(self, value):
+        """
+        Function that deserializes the value of a kafka record. Records
+        are avro encoded, json records sent by older producers are
+        still accepted.
+
+        Parameters:
+        -----------
+        value: str
+            The raw value of the kafka record
+
+        Returns:
+        ----------
+        dict
+            The message
+        """
+        if value.startswith('{'):
+            return json.loads(value)
+        return self.codec.decode(value)
+
+
+    def consume(self, table_name, batch_size=500, timeout_ms=1000,
+                max_in_flight=32):
+        """
+        Function that consumes the kafka messages in micro-batches and
+        writes them to cassandra. The records of each poll are written in
+        slices of `batch_size` and kafka offsets are committed only after
+        the writes of every slice were acknowledged.
+
+        Parameters:
+        -----------
+        table_name: str
+            The name of the cassandra table the messages are written to
+        batch_size: int
+            Maximum amount of kafka records written per micro-batch
+            Default: 500
+        timeout_ms: int
+            Maximum time (in ms) to wait for records on each poll
+            Default: 1000
+        max_in_flight: int
+            Maximum amount of cassandra batches waiting for acknowledgement
+            Default: 32
+
+        Returns:
+        ----------
+        None
+        """
+        self.createTable(table_name)
+        while True:
+            # kafka-python 1.3.1 has no max_records, every fetched record
+            # is returned and the position moves past all of them
+            records = self.consumer.poll(timeout_ms=timeout_ms)
+            if not records:
+                continue
+            records = [record for partition_records in records.itervalues()
+                       for record in partition_records]
+
+            consumed = 0
+            for start in xrange(0, len(records), batch_size):
+                messages = []
+                for record in records[start:start + batch_size]:
+                    msg = self.decodeRecord(record.value)
+                    if self.MESSAGE_KEYS == sorted(msg.keys()):
+                        messages.append(msg)
+                self.writeMessages(messages, max_in_flight=max_in_flight)
+                consumed += len(messages)
+
+            if self.group_id is not None:
+                self.consumer.commit()
+            logger.info('Consumed {} messages ({} records)'.format(
+                consumed, len(records)))
+
+
+if __name__ == "__main__":
+    try:
+        logger.info("Starting __main__, simple test for awaybot_consumer.py")
+
+        ac = AwaybotConsumer(
+            "54.197.178.209:9092",
+            "test_topic",
+            ['54.175.189.47'],
+            'test_keyspace',
+            group_id='awaybot_consumer')
+        logger.info("Connected to kafka and cassandra clusters!")
+        ac.consume('awaybot_messages')
 
     except:
         logging.error(
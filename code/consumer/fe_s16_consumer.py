@@ -38,43 +38,7 @@ ac = AwaybotConsumer(
     "54.197.178.209:9092",
     "fe_s16_topic",
     ['54.175.189.47'],
-    'test_keyspace')
+    'test_keyspace',
+    group_id='fe_s16_consumer')
 logger.info("Connected to kafka and cassandra clusters!")
-ac.session.execute("""
-    CREATE TABLE IF NOT EXISTS fe_s16_messages (
-        uuid text,
-        message_text text,
-        ts text,
-        user text,
-        team text,
-        type text,
-        channel text,
-        message_url text,
-        PRIMARY KEY (channel, ts)
-    )
-    """)
-prepared_msg = ac.session.prepare("""
-    INSERT INTO fe_s16_messages (uuid, message_text, ts,
-        user, team, type, channel, message_url)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """)
-for msg in ac.consumer:
-    msg = json.loads(msg.value)
-    if sorted(
-        [
-            u'text', u'ts', u'user',
-            u'team', u'type',
-            u'channel', u'uuid', u'message_url'
-        ]
-    ) == sorted(msg.keys()):
-
-        ac.session.execute(
-            prepared_msg,
-            (msg['uuid'], msg['text'],
-             msg['ts'], msg['user'],
-             msg['team'], msg['type'],
-             msg['channel'], msg['message_url']))
-        # logger.info(
-        #     'Consume Message:\n{}'.format(msg['uuid']))
-        logger.info(msg)
-
+ac.consume('fe_s16_messages')
@@ -23,6 +23,10 @@ from scipy.stats import entropy
 def cosine(repr1, repr2):
     """Calculate the `cosine similarity<https://en.wikipedia.org/wiki/Cosine_similarity>`_ between two object representations
 
+    Note
+    ----
+    Representations may also be matrices (one representation per row), the similarities are then computed row-wise (with broadcasting)
+
     Parameters
     ----------
     repr1 : list[float]
@@ -32,10 +36,11 @@ def cosine(repr1, repr2):
 
     Returns
     -------
-    float
+    float or np.array(float)
         Distance/Similarity between the two object representations
     """
-    return (np.array(repr1) * np.array(repr2)).sum() / (np.linalg.norm(repr1) * np.linalg.norm(repr2))
+    repr1, repr2 = np.asarray(repr1), np.asarray(repr2)
+    return (repr1 * repr2).sum(axis=-1) / (np.linalg.norm(repr1, axis=-1) * np.linalg.norm(repr2, axis=-1))
 
 
 def jensen_shannon(repr1, repr2):
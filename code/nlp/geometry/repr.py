@@ -37,14 +37,19 @@ The default gloVe lookup-corpora are available for download from the following l
 
 The original *zipped* corpora may be downloaded from [stanfordnlp](http://nlp.stanford.edu/data/wordvecs/)
 
+Loading a text lookup-corpus takes a few (10~30) seconds, since every line is parsed. A lookup-corpus can be converted once with
+`convert_glove` into a binary store (a sorted term index plus a contiguous float32 matrix), which `GloVe(..., mmap=True)` memory-maps
+almost instantly. The memory-mapped pages are shared by every process that loads the same store.
+
 """
+import six
 from six import with_metaclass  # for python compatibility
 from abc import ABCMeta, abstractmethod
 
 from gensim.models import word2vec as w2v
 import numpy as np
 
-from os.path import abspath
+from os.path import abspath, isfile
 from glob import glob
 
 
@@ -54,6 +59,10 @@ __pos = __path.index('slack-pack')
 PATH_TO_CORPORA = __path[:__pos + 10] + '/code/nlp/data/corpora/'  # len('slack-pack') --> 10
 PATH_TO_MODELS = __path[:__pos + 10] + '/code/nlp/data/models/'  # len('slack-pack') --> 10
 
+# Extensions of the binary (memory-mappable) lookup-corpora
+TERMS_EXT = '.terms.npy'
+VECTORS_EXT = '.vectors.npy'
+
 
 def list_corpora():
     """Lists the corpora available
@@ -63,7 +72,7 @@ def list_corpora():
     list[str]
         List of corpora available
     """
-    non_zips = filter( lambda x: not (x.endswith('.zip') or x.endswith('.gz') or x.endswith('.md')), glob(PATH_TO_CORPORA + '*') )
+    non_zips = filter( lambda x: not (x.endswith('.zip') or x.endswith('.gz') or x.endswith('.md') or x.endswith('.npy')), glob(PATH_TO_CORPORA + '*') )
     return map(lambda x: x.split('/')[-1], non_zips)
 
 
@@ -79,6 +88,101 @@ def list_models():
     return map(lambda x: x.split('/')[-1], non_mds)
 
 
+def get_binary_paths(file_name):
+    """Paths to the binary store (term index and vector matrix) of a GloVe lookup-corpus
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the (text) lookup-corpus, e.g. 'glove.6B.100d.txt'
+
+    Returns
+    -------
+    tuple(str, str)
+        Paths to the sorted term index and to the float32 vector matrix
+    """
+    base_name = PATH_TO_CORPORA + (file_name[:-4] if file_name.endswith('.txt') else file_name)
+    return (base_name + TERMS_EXT, base_name + VECTORS_EXT)
+
+
+def has_binary(file_name):
+    """Checks if the lookup-corpus has already been converted into a binary store
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the (text) lookup-corpus, e.g. 'glove.6B.100d.txt'
+
+    Returns
+    -------
+    bool
+        True if both the term index and the vector matrix are available
+    """
+    return all( map(isfile, get_binary_paths(file_name)) )
+
+
+def convert_glove(file_name, unknown='<unk>'):
+    """Converts a text GloVe lookup-corpus into a binary store that can be memory-mapped
+
+    The store is made of two numpy files next to the lookup-corpus: the sorted term index (`TERMS_EXT`) and
+    a contiguous float32 matrix (`VECTORS_EXT`) in which row `i` is the representation of the `i`-th term of the index.
+    The text file is read twice (terms first, vectors later) so the vectors never need to fit in memory at once.
+
+    Note
+    ----
+    If the lookup-corpus has no `unknown` term, one is added with the mean of all the vectors
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the (text) lookup-corpus, e.g. 'glove.6B.100d.txt'
+    unknown : str, optional
+        Term used to represent terms that are not in the lookup-corpus (defaults to '<unk>')
+
+    Returns
+    -------
+    tuple(str, str)
+        Paths to the sorted term index and to the float32 vector matrix
+    """
+    terms_path, vectors_path = get_binary_paths(file_name)
+
+    # First pass: gather the terms and the dimension of the vectors
+    terms = []
+    with open(PATH_TO_CORPORA + file_name, 'rb') as f:
+        for line in iter(f.readline, ''):
+            _terms = line.split()
+            terms.append(_terms[0])
+    dim = len(_terms) - 1
+
+    add_unknown = unknown not in set(terms)
+    if add_unknown:
+        terms.append(unknown)
+
+    # Sort the term index and obtain the row of each term (in file order) in the sorted matrix
+    terms = np.array(terms)
+    order = np.argsort(terms, kind='mergesort')
+    rows = np.empty_like(order)
+    rows[order] = np.arange(len(order))
+
+    # Second pass: write each vector straight into its row of the on-disk matrix
+    vectors = np.lib.format.open_memmap(vectors_path, mode='w+', dtype=np.float32, shape=(len(terms), dim))
+    vector_sum = np.zeros(dim, dtype=np.float64)
+    with open(PATH_TO_CORPORA + file_name, 'rb') as f:
+        for i, line in enumerate(iter(f.readline, '')):
+            vectors[rows[i]] = np.array(line.split()[1:], dtype=np.float32)
+            vector_sum += vectors[rows[i]]
+
+    if add_unknown:
+        vectors[rows[-1]] = vector_sum / (len(terms) - 1)
+
+    vectors.flush()
+    del vectors
+
+    np.save(terms_path, terms[order])
+
+    return (terms_path, vectors_path)
+
+
 class Representation(with_metaclass(ABCMeta, object)):
     """ Abstract class for a geometric representation of words
 
@@ -106,6 +210,47 @@ class Representation(with_metaclass(ABCMeta, object)):
     def __str__(self):
         pass
 
+    @abstractmethod
+    def gather(self, words):
+        pass
+
+    def embed_batch(self, texts):
+        """Geometric representation of a batch of documents
+
+        All the words of all the documents are looked up at once (`gather`) and each document is represented by
+        the mean of its word vectors, obtained with a single segment-sum over the gathered matrix. Documents without
+        words get their representation from `__call__`, one call each
+
+        Parameters
+        ----------
+        texts : list[str]
+            Messages to obtain a representation from
+
+        Returns
+        -------
+        np.array(float)
+            Matrix (n_texts x dim) with the geometric representation of each of the texts
+        """
+        words = [ text.lower().split() for text in texts ]
+        lengths = np.array( map(len, words), dtype=np.int64 )
+        flat_words = [ w.strip() for ws in words for w in ws ]
+
+        # The representation of a document without words is not a mean: it depends on the representation (and may
+        # change on every call, e.g. a random vector), so it is obtained for each of them as `__call__` would
+        empty_rows = np.flatnonzero(lengths == 0)
+        empty_representations = [ self.__call__('') for _ in empty_rows ] or [ self.__call__('') ]
+        representations = np.empty( (len(texts), len(empty_representations[0])), dtype=np.float64 )
+        if len(empty_rows):
+            representations[empty_rows] = empty_representations
+
+        if flat_words:
+            nonempty = lengths > 0
+            offsets = np.cumsum(lengths) - lengths  # first word of each document
+            sums = np.add.reduceat( self.gather(flat_words), offsets[nonempty], axis=0, dtype=np.float64 )
+            representations[nonempty] = sums / lengths[nonempty, None]
+
+        return representations
+
 
 class Word2Vec(Representation):
     """Trained object of `word2vec<https://code.google.com/archive/p/word2vec/>`_ as implemented by `gensim<https://radimrehurek.com/gensim/models/word2vec.html>`_
@@ -151,6 +296,28 @@ class Word2Vec(Representation):
         finally:
             return representation
 
+    def gather(self, words):
+        """Geometric representation of each of the words (stacked)
+
+        Parameters
+        ----------
+        words : list[str]
+            terms to lookup
+
+        Returns
+        -------
+        np.array(float)
+            Matrix (n_words x dim) with the representation of each word, not found terms get a random vector
+        """
+        rows = np.array([ self.model.vocab[w].index if w in self.model.vocab else -1 for w in words ], dtype=np.int64)
+        matrix = self.model.syn0[rows]
+
+        # Not found terms are represented with a random vector (to minimize probability of chance collision)
+        not_found = rows < 0
+        matrix[not_found] = np.random.ranf( (not_found.sum(), self.model.vector_size) )
+
+        return matrix
+
 
     # NOTE: research other aggregation methods (other than mean)
     def __call__(self, message_text):
@@ -192,14 +359,32 @@ class GloVe(Representation):
     ----------
     file_name : str or IOBuffer
         Path to the lookup-corpus from which to load the representation
+    mmap : bool, optional
+        Memory-map the binary store of the lookup-corpus instead of parsing the text file (defaults to False).
+        The binary store needs to be generated first with `convert_glove`
 
     Attributes
     ----------
     vocab : dict
-        dictionary with all the glove-trained representations of each term
+        dictionary with all the glove-trained representations of each term (None if memory-mapped)
+    terms : np.array(str)
+        sorted term index of the binary store (None unless memory-mapped)
+    vectors : np.memmap(float32)
+        matrix with the representation of each term in `terms` (None unless memory-mapped)
     """
-    def __init__(self, file_name):
-        self.vocab = self.load_model(self.PATH_TO_CORPORA + file_name)
+    UNKNOWN = '<unk>'
+
+    def __init__(self, file_name, mmap=False):
+        self.mmap = mmap
+        self.vocab, self.terms, self.vectors = None, None, None
+
+        if self.mmap:
+            self.terms, self.vectors = self.load_binary(file_name)
+            self.unknown_row = int(self.get_rows([self.UNKNOWN], unknown_row=-1)[0])
+            if self.unknown_row < 0:
+                raise KeyError('The binary store of {} has no {} term'.format(file_name, self.UNKNOWN))
+        else:
+            self.vocab = self.load_model(self.PATH_TO_CORPORA + file_name)
 
 
     def load_model(self, file_name):
@@ -224,6 +409,55 @@ class GloVe(Representation):
 
         return repr_dict
 
+    @staticmethod
+    def load_binary(file_name):
+        """Memory-maps the binary store of a given GloVe model (see `convert_glove`)
+
+        Parameters
+        ----------
+        file_name : str
+            name of the (text) gloVe model whose binary store will be loaded
+
+        Returns
+        -------
+        tuple(np.array(str), np.memmap(float32))
+            Sorted term index and the matrix with the representation of each term
+
+        Raises
+        ------
+        IOError
+            If the lookup-corpus has not been converted yet
+        """
+        if not has_binary(file_name):
+            raise IOError('No binary store found for {}, generate it with `convert_glove`'.format(file_name))
+
+        terms_path, vectors_path = get_binary_paths(file_name)
+        return (np.load(terms_path, mmap_mode='r'), np.load(vectors_path, mmap_mode='r'))
+
+    def get_rows(self, words, unknown_row=None):
+        """Looks up the row of each word in the sorted term index (binary store only)
+
+        Parameters
+        ----------
+        words : list[str]
+            terms to lookup
+        unknown_row : int, optional
+            row assigned to the terms not found (defaults to the row of the unknown term)
+
+        Returns
+        -------
+        np.array(int)
+            Row of each of the words in `vectors`
+        """
+        unknown_row = self.unknown_row if unknown_row is None else unknown_row
+        if not len(words):
+            return np.zeros(0, dtype=np.int64)
+
+        query = np.array([ w.encode('utf-8') if isinstance(w, six.text_type) else w for w in words ])
+        positions = np.minimum( np.searchsorted(self.terms, query), len(self.terms) - 1 )
+
+        return np.where(self.terms[positions] == query, positions, unknown_row)
+
     def __getitem__(self, item):
         """Geometric representation of the object
 
@@ -237,13 +471,36 @@ class GloVe(Representation):
         np.array(float)
             Geometric representation of the term
         """
+        if self.mmap:
+            return np.array( self.vectors[ self.get_rows([item])[0] ] )
+
         try:
             representation = self.vocab[item]
         except KeyError:
-            representation = self.vocab['<unk>']
+            representation = self.vocab[self.UNKNOWN]
         finally:
             return representation
 
+    def gather(self, words):
+        """Geometric representation of each of the words (stacked)
+
+        Parameters
+        ----------
+        words : list[str]
+            terms to lookup
+
+        Returns
+        -------
+        np.array(float)
+            Matrix (n_words x dim) with the representation of each word
+        """
+        # Memory-mapped: look up all the rows at once and gather them from the matrix
+        if self.mmap:
+            return self.vectors[ self.get_rows(words) ]
+
+        unknown = self.vocab[self.UNKNOWN]
+        return np.array([ self.vocab.get(w, unknown) for w in words ])
+
 
     # NOTE: research other aggregation methods (other than mean)
     def __call__(self, message_text):
@@ -268,7 +525,7 @@ class GloVe(Representation):
             representation /= len(words)
         # If no words were specified
         else:
-            representation = self.vocab['<unk>']
+            representation = self.__getitem__(self.UNKNOWN)
 
         return representation
 
@@ -12,6 +12,8 @@
 """
 
 import nltk
+from nltk.tag import map_tag
+from nltk.tag.perceptron import PerceptronTagger
 from sets import Set
 
 class SentenceGrammarAnalyzer:
@@ -19,6 +21,10 @@ class SentenceGrammarAnalyzer:
 
     Some message are replies based on their opening sentence, e.g. messages starting with words such as `OK`
 
+    Only the tag of the first token is used: the messages are tagged in batches (see `are_replies`) and only their
+    `LEADING_TOKENS` first tokens, which are all the context the perceptron tagger uses to tag the first token.
+    The universal tag is mapped from the UPenn tag instead of tagging twice
+
     Attributes
     ----------
     message : |message|
@@ -31,8 +37,12 @@ class SentenceGrammarAnalyzer:
         Set of reply-message starting POS-tags
     REPLY_STARTERS : list[str]
         List of reply-message starters
+    LEADING_TOKENS : int
+        Number of leading tokens tagged per message
     tokenizer :
         Tokenizer for processing the message
+    tagger : `PerceptronTagger`
+        NLTK's default POS tagger (loaded once, on first use)
 
     Parameters
     ----------
@@ -46,10 +56,12 @@ class SentenceGrammarAnalyzer:
     REPLY_POS_VALID_UNIVERSAL_TAGS = Set(['CONJ'])
         # check http://www.ling.upenn.edu/courses/Fall_2003/ling001/penn_treebank_pos.html for a good list
     REPLY_POS_VALID_UPENN_TAGS = Set(['WDT', 'DT'])
-    REPLY_STARTERS = Set(['ok', 'ok.', 'k', 'k.' 'mine', 'his', 'hers', 'theirs', 'ours'])
+    REPLY_STARTERS = Set(['ok', 'ok.', 'k', 'k.', 'mine', 'his', 'hers', 'theirs', 'ours'])
+    LEADING_TOKENS = 3
 
     def __init__(self, tokenizer):
         self.tokenizer = tokenizer
+        self.tagger = None
 
     def is_reply(self, message):
         """Summary
@@ -60,21 +72,49 @@ class SentenceGrammarAnalyzer:
             Assessment of message being a starter: (Boolean, Reason)
 
         """
-        stemmedTokens = self.tokenizer(message)
-
-        if len(stemmedTokens) <= 1:
-            return (True, 'stemmed length of ' + str(len(stemmedTokens)))
+        return self.are_replies([message])[0]
 
-        tokens = self.tokenizer.tokenize(message)
-        universalTags = nltk.pos_tag(tokens, tagset='universal')
+    def are_replies(self, messages):
+        """Assess whether each of the messages is a reply, tagging all of them in a single batch
 
-        if universalTags[0][1] in SentenceGrammarAnalyzer.REPLY_POS_VALID_UNIVERSAL_TAGS:
-            return (True, 'universal tag ' + universalTags[0][1])
+        Parameters
+        ----------
+        messages : list[str]
+            Texts of the messages to be analyzed
 
-        upennTags = nltk.pos_tag(tokens)
-        if upennTags[0][1] in SentenceGrammarAnalyzer.REPLY_POS_VALID_UPENN_TAGS:
-            return (True, 'upenn tag ' + upennTags[0][1])
-        if tokens[0].lower() in SentenceGrammarAnalyzer.REPLY_STARTERS:
-            return (True, 'reply starter ' + tokens[0].lower())
-        return (False, 'not a reply')
+        Returns
+        -------
+        list[tuple(bool, str)]
+            Assessment of each message being a starter: (Boolean, Reason)
+        """
+        results = [None] * len(messages)
+        to_tag = []
+        for m, message in enumerate(messages):
+            tokens = self.tokenizer.tokenize(message)
+            # same count as the stemmed tokens (stemming keeps the number of tokens)
+            n_valid = len([ w for w in tokens if w.isalnum() and w not in self.tokenizer.stopWords ])
+
+            if n_valid <= 1:
+                results[m] = (True, 'stemmed length of ' + str(n_valid))
+            elif tokens[0].lower() in SentenceGrammarAnalyzer.REPLY_STARTERS:
+                results[m] = (True, 'reply starter ' + tokens[0].lower())
+            else:
+                to_tag.append( (m, tokens[:self.LEADING_TOKENS]) )
+
+        if to_tag:
+            if self.tagger is None:
+                self.tagger = PerceptronTagger()
+            tagged = self.tagger.tag_sents( [ tokens for _, tokens in to_tag ] )
+
+            for (m, _), tags in zip(to_tag, tagged):
+                upenn_tag = tags[0][1]
+                universal_tag = map_tag('en-ptb', 'universal', upenn_tag)
+                if universal_tag in SentenceGrammarAnalyzer.REPLY_POS_VALID_UNIVERSAL_TAGS:
+                    results[m] = (True, 'universal tag ' + universal_tag)
+                elif upenn_tag in SentenceGrammarAnalyzer.REPLY_POS_VALID_UPENN_TAGS:
+                    results[m] = (True, 'upenn tag ' + upenn_tag)
+                else:
+                    results[m] = (False, 'not a reply')
+
+        return results
 
@@ -14,12 +14,22 @@
 from nltk.stem.snowball import SnowballStemmer
 from nltk import word_tokenize
 from nlp.text.stopwords import STOPWORDS
+from collections import OrderedDict
+import string
 import re
 
 
+# Symbols removed and symbols wrapped in whitespace by default by the SimpleCleaner
+SYMBOLS_REMOVE = u'.,/\\<>!?*+"\'&`´#@\u2019'
+SYMBOLS_SPACE = u':;_()[]{}'
+
+
 class SimpleCleaner(object):
     """A light-weight text cleaner: removes stopwords, usernames and symbols (some are removed some are wrapped in spaces)
 
+    With the default symbols, both symbol substitutions are applied in a single `translate` pass (after removing the
+    usernames) and stopwords are looked up in a frozenset; custom symbol patterns fall back to regex substitutions
+
     Parameters
     ----------
     remove_stopwords : bool, optional
@@ -32,17 +42,29 @@ class SimpleCleaner(object):
         Username pattern (defaults to `<@U-------->` or `<@u-------->`, where `-` is any alphanumeric)
     """
     PATTERNS = { 'user': re.compile('<@[Uu]\w{8}>'),
-                 'symbols_remove': re.compile(ur'[\.,/\\<>\!\?\*\+"\'&`´#@\u2019]', re.UNICODE),
-                 'symbols_space': re.compile('[:;_\(\)\[\]\{\}]') }
+                 'symbols_remove': re.compile(u'[{}]'.format(re.escape(SYMBOLS_REMOVE)), re.UNICODE),
+                 'symbols_space': re.compile(u'[{}]'.format(re.escape(SYMBOLS_SPACE))) }
+
+    STOPWORDS = frozenset(STOPWORDS)
+
+    # Translation tables of the default symbols: for unicode text (code point -> replacement) and
+    # for byte strings (table, deleted characters), where only the symbols below 256 can match
+    UNICODE_TABLE = dict( [ (ord(c), None) for c in SYMBOLS_REMOVE ] + [ (ord(c), u' ') for c in SYMBOLS_SPACE ] )
+    BYTES_TABLE = (string.maketrans(SYMBOLS_SPACE.encode('latin-1'), ' ' * len(SYMBOLS_SPACE)),
+                   ''.join( chr(ord(c)) for c in SYMBOLS_REMOVE if ord(c) < 256 ))
 
     def __init__(self, remove_stopwords=True, user=None, symbols_to_remove=None, symbols_to_space=None):
         self.remove_stopwords = remove_stopwords
+        self.PATTERNS = dict(self.PATTERNS)
+        self.translate = True
         if (user is not None) and hasattr(user, 'sub'):
             self.PATTERNS['user'] = user
         if (symbols_to_remove is not None) and hasattr(symbols_to_remove, 'sub'):
             self.PATTERNS['symbols_remove'] = symbols_to_remove
+            self.translate = False
         if (symbols_to_space is not None) and hasattr(symbols_to_space, 'sub'):
             self.PATTERNS['symbols_space'] = symbols_to_space
+            self.translate = False
 
     def __call__(self, text):
         """ Fully processes a message
@@ -58,22 +80,96 @@ class SimpleCleaner(object):
             Processed message
         """
         text = self.PATTERNS['user'].sub('', text.lower() )
-        text = self.PATTERNS['symbols_remove'].sub('', text)
-        text = self.PATTERNS['symbols_space'].sub(' ', text)
+
+        if not self.translate:
+            text = self.PATTERNS['symbols_remove'].sub('', text)
+            text = self.PATTERNS['symbols_space'].sub(' ', text)
+        elif isinstance(text, unicode):
+            text = text.translate(self.UNICODE_TABLE)
+        else:
+            text = text.translate(*self.BYTES_TABLE)
 
         if self.remove_stopwords:
-            return ' '.join( filter(lambda x: x not in STOPWORDS, text.split()) )
+            stopwords = self.STOPWORDS
+            return ' '.join( [ w for w in text.split() if w not in stopwords ] )
         else:
             return text
 
+    def clean_many(self, texts):
+        """ Processes a batch of messages
+
+        Parameters
+        ----------
+        texts : iterable of str
+            Messages to be processed
+
+        Returns
+        -------
+        list[str]
+            Processed messages
+        """
+        return [ self(text) for text in texts ]
+
+
+class LRUCache(object):
+    """A bounded mapping that evicts the least recently used entries
+
+    Attributes
+    ----------
+    max_size : int
+        Maximum number of entries
+    hits : int
+        Number of lookups that found their key
+    misses : int
+        Number of lookups that did not find their key
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """Value of the key (marking it as the most recently used), `default` if missing
+        """
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Stores the value of the key, evicting the least recently used entry if full
+        """
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
 
 class MessageTokenizer(object):
     """A Message tokenizer performing tokenization, stemming and stopword removal
 
+    Stems are memoized per token, and the tokens per message text (repeated messages are not tokenized again),
+    both in bounded LRU caches
+
     Attributes
     ----------
-    cache : dict
-        Cache with the tokenized/stemmed words (applying _memoization_)
+    cache : LRUCache
+        Cache with the stemmed words (applying _memoization_)
+    message_cache : LRUCache
+        Cache with the tokens of the message texts
     stemmer : callable
         `Word stemmer <https://en.wikipedia.org/wiki/Stemming>`_, defaults to the NLTK's SnowballStemmer
     stopWords : list[int]
@@ -87,10 +183,19 @@ class MessageTokenizer(object):
 
     """
 
-    def __init__(self):
+    def __init__(self, cache_size=100000, message_cache_size=10000):
+        """
+        Parameters
+        ----------
+        cache_size : int, optional
+            Maximum number of memoized stems (defaults to 100000)
+        message_cache_size : int, optional
+            Maximum number of memoized message texts (defaults to 10000)
+        """
         self.stopWords = []  # stopwords.words("english")
         self.stemmer = SnowballStemmer('english')
-        self.cache = {}
+        self.cache = LRUCache(cache_size)
+        self.message_cache = LRUCache(message_cache_size)
         self.userRe = re.compile('<@[Uu]\w{8}>')
 
     def __call__(self, message):
@@ -106,8 +211,41 @@ class MessageTokenizer(object):
         |message|
             Processed message
         """
-        return [ self.stemmer.stem(t) for t in self.getValidTokens(message) ]
+        tokens = self.message_cache.get(message)
+        if tokens is None:
+            tokens = tuple( self.stem(t) for t in self.getValidTokens(message) )
+            self.message_cache.put(message, tokens)
+        return list(tokens)
+
+    def stem(self, word):
+        """Stems the word (memoized)
+
+        Parameters
+        ----------
+        word : str
+            Token to be stemmed
+
+        Returns
+        -------
+        str
+            Stem of the token
+        """
+        stem = self.cache.get(word)
+        if stem is None:
+            stem = self.stemmer.stem(word)
+            self.cache.put(word, stem)
+        return stem
+
+    def cache_info(self):
+        """Hit/miss counters and sizes of the stem and message caches
 
+        Returns
+        -------
+        dict
+            {'stems': (hits, misses, size), 'messages': (hits, misses, size)}
+        """
+        return { 'stems': (self.cache.hits, self.cache.misses, len(self.cache)),
+                 'messages': (self.message_cache.hits, self.message_cache.misses, len(self.message_cache)) }
 
     def tokenize(self, message):
         """Tokenizes the message text and removes the usernames
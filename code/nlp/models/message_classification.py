@@ -17,14 +17,18 @@
 """
 
 import nltk
+import numpy as np
 import pendulum as pm
 import warnings
+from itertools import islice
 # For our internal toolbox imports
 import os, sys
 path_to_here = os.path.abspath('.')
 sys.path.append(path_to_here[:path_to_here.index('code')+4])
 
+from nlp.geometry import dist as gd
 from nlp.grammar.grammar_analyzer import SentenceGrammarAnalyzer
+from nlp.grammar.tokenizer import MessageTokenizer
 from nlp.text.topic import Topic
 from nlp.text.window import Window
 from nlp.models.similarity_calculation import MessageSimilarity
@@ -102,16 +106,16 @@ class SimpleClassifier(object):
                 # We will sequentially try to append to each topic ...
                 #    as time goes by it is harder to append to a topic
 
-                low_th = low_threshold
-                high_th = high_threshold
                 topic_scores = []  # in case no topic is close
+                n_topics = min(len(self.window), max_active_topics)
 
-                for t in xrange( min(len(self.window), max_active_topics) ):
-                    tp_len = len(self.window[t])
-                    distances = map(lambda x: self.message_similarity(msg.text, x.text), self.window[t])
+                # Score the message against all the active topics at once (thresholds get harder for older topics)
+                topics_distances, topics_score = self.score_topics(msg, n_topics, low_threshold, high_threshold, low_step, high_step)
 
-                    # Assign a non-linear score (very close messages score higher)
-                    score = sum([ 0 if d < low_th else 1 if d < high_th else 3 for d in distances ])
+                for t in xrange(n_topics):
+                    tp_len = len(self.window[t])
+                    distances = topics_distances[t]
+                    score = topics_score[t]
 
                     # Very small topics (< 3) should be easy to append to,
                     #   since the odds of a message being of this topic whould be quite high
@@ -155,11 +159,7 @@ class SimpleClassifier(object):
                                 print '\t inserted to #{} : {}\n'.format(t, reason)
                             break
 
-                    topic_scores.append( (tp_len,score) )  # append score to topic_scores
-
-                    # else try with next topic --> harder
-                    low_th += low_step if low_th+low_step < high_th else high_step
-                    high_th += high_step
+                    topic_scores.append( (tp_len,score) )  # append score to topic_scores --> else try with next topic
                 else:
                     # If no topic was suitable --> Start new topic
                     self.window.activate_topic( Topic(msg, 'No similar topics (to 0) scores:({})'.format(topic_scores)) )
@@ -172,6 +172,72 @@ class SimpleClassifier(object):
             pass
         return self.window
 
+    def score_topics(self, message, n_topics, low_threshold=.4, high_threshold=.7, low_step=.05, high_step=.02):
+        """Scores the message against each of the most-recent topics of the window
+
+        Each message of a topic scores 0 if its similarity is below the low threshold, 1 if below the high threshold and 3 otherwise.
+        Thresholds increase with each older topic (as time goes by it is harder to append to a topic).
+
+        Note
+        ----
+        With the cosine distance, all the topics are scored with a single matrix-vector product against the topics'
+        normalized embeddings (see |topic| `get_embeddings`). Any other similarity is computed message by message.
+
+        Parameters
+        ----------
+        message : |message|
+            Message to be scored
+        n_topics : int
+            Amount of (most-recent) topics to score
+        low_threshold : float, optional
+            Low similarity threshold of the most recent topic
+        high_threshold : float, optional
+            High similarity threshold of the most recent topic
+        low_step : float, optional
+            Increase of the low threshold for each older topic (unless it would reach the high threshold)
+        high_step : float, optional
+            Increase of the high threshold for each older topic
+
+        Returns
+        -------
+        tuple(list[list[float]], list[int])
+            Similarities of the message to each of the messages of each topic, and the score of each topic
+        """
+        low_ths, high_ths = [], []
+        low_th, high_th = low_threshold, high_threshold
+        for t in xrange(n_topics):
+            low_ths.append(low_th)
+            high_ths.append(high_th)
+            low_th += low_step if low_th+low_step < high_th else high_step
+            high_th += high_step
+
+        topics = [ self.window[t] for t in xrange(n_topics) ]
+
+        # Generic similarity: compare message to message
+        if getattr(self.message_similarity, 'dist', None) is not gd.cosine:
+            distances = [ map(lambda x: self.message_similarity(message, x), tp) for tp in topics ]
+            scores = [ sum([ 0 if d < lo else 1 if d < hi else 3 for d in ds ]) for ds, lo, hi in zip(distances, low_ths, high_ths) ]
+            return distances, scores
+
+        # Cosine similarity: dot product of the normalized message representation with every normalized topic message
+        processor, cleaner = self.message_similarity.processor, self.message_similarity.cleaner
+        vector = np.asarray( self.message_similarity.represent(message), dtype=np.float64 )
+        sizes = np.array([ len(tp) for tp in topics ])
+        offsets = np.cumsum(sizes) - sizes
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vector = vector / np.linalg.norm(vector)
+            all_distances = np.concatenate([ tp.get_embeddings(processor, cleaner=cleaner) for tp in topics ]).dot(vector)
+
+            # Assign a non-linear score (very close messages score higher)
+            points = np.where( all_distances < np.repeat(low_ths, sizes), 0,
+                               np.where(all_distances < np.repeat(high_ths, sizes), 1, 3) )
+
+        scores = np.add.reduceat(points, offsets).tolist()
+        distances = [ all_distances[o:o + size].tolist() for o, size in zip(offsets, sizes) ]
+
+        return distances, scores
+
 
     def classify_stream_time(self, message_stream, max_messages=20, max_active_topics=5, autom_message_seconds=10,
                              low_threshold=.4, high_threshold=.7, low_step=.05, high_step=.02, verbose=True):
@@ -316,7 +382,7 @@ class MessageClassifier(object):
 
     Attributes
     ----------
-    gram_analyzer : |sentgram|
+    grammar_analyzer : |sentgram|
         Grammar analyzer for identifying if a message is a reply (not to be specified)
     sim_calc : |simcalc|
         For message-topic similarity calculation
@@ -326,18 +392,20 @@ class MessageClassifier(object):
         Window with |topic|s
 
     """
-    def __init__(self, window, similarity_threshold, similar_topic_calculator, reply_analysis=False):
+    REPLY_BATCH_SIZE = 256
+
+    def __init__(self, window, similarity_threshold, similar_topic_calculator, reply_analysis=True):
         self.window = window
         self.sim_threshold = similarity_threshold
         self.sim_calc = similar_topic_calculator
 
         # Initialize a grammar analyzer to check if the message is a reply
         if reply_analysis:
-            self.gram_analyzer = SentenceGrammarAnalyzer(self.sim_calc.tokenizer)
+            self.grammar_analyzer = SentenceGrammarAnalyzer(self.sim_calc.tokenizer or MessageTokenizer())
         else:
             self.grammar_analyzer = None
 
-    def classify(self, message, processor=None):
+    def classify(self, message, processor=None, reply=None):
         """Predict the topic to be appended to along with the reason for the given message
 
         Parameters
@@ -346,6 +414,8 @@ class MessageClassifier(object):
             Message to be classified
         processor : callable, optional
             Message processor that returns the text's representation
+        reply : tuple(bool, str), optional
+            Pre-computed reply assessment of the message (see |sentgram|)
 
         Returns
         -------
@@ -365,7 +435,7 @@ class MessageClassifier(object):
 
         # Check if the message is a reply
         if self.grammar_analyzer is not None:
-            (is_reply, reason) = self.gram_analyzer.is_reply(message.text)
+            (is_reply, reason) = reply if reply is not None else self.grammar_analyzer.is_reply(message.text)
             if is_reply:  # we already know topics is not empty
                 self.window.insert_message(message, 'grammatically ' + reason)  # will insert to the latest active channel
                 return
@@ -401,10 +471,20 @@ class MessageClassifier(object):
 
         counter = 0  # initialize message counter
 
-        # Process each of the messages in the stream
-        for message in message_stream:
-            counter += 1
-            self.classify(message, processor=proc)
+        # Process each of the messages in the stream, assessing the replies of each batch of messages at once
+        message_stream = iter(message_stream)
+        while True:
+            batch = list( islice(message_stream, self.REPLY_BATCH_SIZE) )
+            if not batch:
+                break
+            if self.grammar_analyzer is not None:
+                replies = self.grammar_analyzer.are_replies( [ message.text for message in batch ] )
+            else:
+                replies = [None] * len(batch)
+
+            for message, reply in zip(batch, replies):
+                counter += 1
+                self.classify(message, processor=proc, reply=reply)
 
         print('  ... Finished classifying {} messages'.format(counter))
 
@@ -15,6 +15,7 @@
 
 import sys
 import math
+import uuid
 import numpy as np
 import gensim
 
@@ -26,6 +27,7 @@ sys.path.append(path_to_here[:path_to_here.index('code')+4])
 from nlp.geometry import dist as gd
 from nlp.geometry.repr import GloVe
 from nlp.geometry.repr import list_corpora as list_representations
+from nlp.geometry.repr import has_binary
 from nlp.grammar.tokenizer import SimpleCleaner
 
 
@@ -40,6 +42,20 @@ def list_distances():
     return filter( lambda x: (not x.startswith('__')) and (x not in  ['np', 'entropy']) , dir(gd) )
 
 
+def get_processor_token():
+    """Unique token for the processors of a similarity object (kept for its whole life)
+
+    Unlike `id()`, the token is never reused once the object is garbage-collected (nor by other processes), so a new
+    processor cannot match the `repr_id` cached in a |message| by an old one
+
+    Returns
+    -------
+    str
+        Random unique token
+    """
+    return uuid.uuid4().hex
+
+
 class MessageSimilarity(object):
     """Callable object that calculates message-to-message similarity
 
@@ -51,6 +67,12 @@ class MessageSimilarity(object):
         Callable object that calculates a multi-dimensional distance (for the geometric embeddings of each message)
     repr : callable
         Callable object that returns geometric representation of the passed text
+    processor : callable
+        Message processor (representation of the cleaned text) with a stable `processor_id`, used to cache the
+        cleaned text and representation of each |message|
+    processor_token : str
+        Unique token of this object included in the `processor_id` (so that cached representations are never reused
+        by another processor)
     """
     def __init__(self, cleaner=None, representation=None, distance=None):
 
@@ -61,7 +83,7 @@ class MessageSimilarity(object):
             self.repr = self.get_repr()  # default
         else:
             if hasattr(representation, '__call__'):
-                self.repr = cleaner
+                self.repr = representation
             else:
                 self.repr = self.get_repr(representation)
 
@@ -70,10 +92,13 @@ class MessageSimilarity(object):
             self.dist = self.get_dist()  # default
         else:
             if hasattr(distance, '__call__'):
-                self.dist = cleaner
+                self.dist = distance
             else:
                 self.dist = self.get_dist(distance)
 
+        self.processor_token = get_processor_token()
+        self.processor = self.get_processor()
+
     @staticmethod
     def get_dist(dist_id='cosine'):
         """Load the distance callable and return it
@@ -103,6 +128,10 @@ class MessageSimilarity(object):
     def get_repr(repr_id='glove.6B.100d.txt'):
         """Load the representation callable and return it
 
+        Note
+        ----
+        If the lookup-corpus was converted into a binary store (`nlp.geometry.repr.convert_glove`) it will be memory-mapped instead
+
         Parameters
         ----------
         repr_id : str, optional
@@ -119,38 +148,64 @@ class MessageSimilarity(object):
         ValueError
             If the specified geometric representation is not found
         """
-        print ' -- Loading GloVe, this might take a few (10~30) seconds... -- \n'
+        mmap = has_binary(repr_id)
+        if not mmap:
+            print ' -- Loading GloVe, this might take a few (10~30) seconds... -- \n'
         try:
-            glove = GloVe(repr_id)
+            glove = GloVe(repr_id, mmap=mmap)
         except:
             raise ValueError('Fail on loading the representation... Check if the representation is available with `list_representations()`')
 
         return glove
 
+    def get_processor(self):
+        """Produces the message processor: the geometric representation of the (already cleaned) text
+
+        Returns
+        -------
+        callable
+            Message processing function, with an additional attribute `processor_id` with the cleaner and representation specifications
+        """
+        def processor(clean_text):
+            return self.repr(clean_text)
+        processor.processor_id = 'c:{c!s}#r:{r!s}#{token}'.format(c=self.cleaner, r=self.repr, token=self.processor_token)
+        return processor
+
+    def represent(self, message):
+        """Geometric representation of a message
+
+        Parameters
+        ----------
+        message : |message| or str
+            Message (its cleaned text and representation will be cached) or text
+
+        Returns
+        -------
+        |nparray|
+            Geometric representation of the cleaned message text
+        """
+        if hasattr(message, 'process'):
+            message.process(self.processor, cleaner=self.cleaner)
+            return message.text_repr
+
+        return self.repr( self.cleaner(message) )
+
     def __call__(self, m1, m2):
         """Similarity between two texts
 
         Parameters
         ----------
-        m1 : str
-            Text #1
-        m2 : str
-            Text #2
+        m1 : |message| or str
+            Message or text #1
+        m2 : |message| or str
+            Message or text #2
 
         Returns
         -------
         float
             Similarity between texts
         """
-        # tokenize
-        text1 = self.cleaner(m1)
-        text2 = self.cleaner(m2)
-
-        # get geometric representation
-        rep1 = self.repr(text1)
-        rep2 = self.repr(text2)
-
-        return self.dist(rep1, rep2)
+        return self.dist( self.represent(m1), self.represent(m2) )
 
 
 class SimilarTopicCalculator:
@@ -183,6 +238,7 @@ class SimilarTopicCalculator:
         if (tokenizer is not None) and not hasattr(tokenizer, '__call__'):
             raise AttributeError('tokenizer needs to be a callable object or None')
         self.tokenizer = tokenizer
+        self.processor_token = get_processor_token()
 
     @property
     def has_tokenizer(self):
@@ -198,6 +254,10 @@ class SimilarTopicCalculator:
     def get_similarities(self, window, message):
         """Calculates the similarity of the |message| with the |topic|s in the |window|
 
+        Note
+        ----
+        The centroids of the |topic|s are maintained incrementally, and with the cosine similarity they are all scored at once
+
         Parameters
         ----------
         window : |window|
@@ -210,45 +270,31 @@ class SimilarTopicCalculator:
         list[float]
             List of the similarities of the |message| with each of the |topic|s in the |window|
         """
-        similarities = []
-
-        for topic in window.topics:
-
-            # get centroid of the topic
-            centroid = self.calculate_centroid(topic)
+        proc = self.get_processor()  # obtain processor in case necessary
+        centroids = np.array([ self.calculate_centroid(topic, proc) for topic in window.topics ])
 
-            # get similarity with centroid
-            similarities.append( self.similarity(centroid, message.text_repr) )
+        if self.similarity is gd.cosine:
+            return gd.cosine(centroids, message.text_repr).tolist()
 
-        return similarities
+        return [ self.similarity(centroid, message.text_repr) for centroid in centroids ]
 
-    def calculate_centroid(self, topic):  # NOTE: might want to implement top 5% later...
+    def calculate_centroid(self, topic, processor=None):  # NOTE: might want to implement top 5% later...
         """Calculate the centroid of the topic based on the message representations
 
         Parameters
         ----------
         topic : |topic|
             Topic to calculate the centroid
+        processor : callable, optional
+            Message processor (obtained with `get_processor` if not specified)
 
         Returns
         -------
         |nparray|
             Geometric centroid of the geometric representations
         """
-        proc = self.get_processor()  # obtain processor in case necessary
-        pre_centroid = np.zeros_like( topic.start_message.text_repr )
-
-        for topic_message in topic.messages:
-            # check if message was processed, process if necessary
-            if not topic_message.is_processed:
-                topic_message.process( proc )
-
-            # update centroid based on the text_repr
-            pre_centroid += topic_message.text_repr
-
-        pre_centroid /= len(topic)
-
-        return pre_centroid
+        proc = processor if processor is not None else self.get_processor()
+        return topic.get_centroid(proc)
 
     def get_processor(self):
         """Produces a message processor according to the specified similarity_calculator
@@ -256,7 +302,7 @@ class SimilarTopicCalculator:
         Returns
         -------
         callable
-            Message processing function. The processor will have an internal additional attribute `__id` with the processor specifications
+            Message processing function. The processor will have an additional attribute `processor_id` with the processor specifications
         """
         def processor(message_text):
             """Proccesses the message according to
@@ -274,7 +320,7 @@ class SimilarTopicCalculator:
             if self.has_tokenizer:
                 message = self.tokenizer(message_text)  # the tokenizer is a callable object
             return self.representation(message_text)  # the representation is a callable object
-            processor.__id = 't:{tok!s}#r:{rep!s}'.format(tok=self.tokenizer, rep=self.representation)
+        processor.processor_id = 't:{tok!s}#r:{rep!s}#{token}'.format(tok=self.tokenizer, rep=self.representation, token=self.processor_token)
         return processor
 
 
@@ -14,6 +14,8 @@
 
 """
 
+import numpy as np
+from scipy import sparse
 from gensim.models.tfidfmodel import TfidfModel
 # import pandas as pd   # remove the necessity of using pandas (make it lighter!!)
 
@@ -22,7 +24,7 @@ import os, sys
 path_to_here = os.path.abspath('.')
 sys.path.append(path_to_here[:path_to_here.index('code')+4])
 
-from nlp.text.corpus import Corpus
+from nlp.text.corpus import from_window
 from nlp.grammar.tokenizer import SimpleCleaner
 
 
@@ -58,16 +60,12 @@ class TFIDF(object):
         self.window = window
         self.n_grams = n_grams
 
-        # Generate corpus from window
-        cleaner = cleaner if cleaner is not None else lambda x: x
-
-        # Initialize unigram corpus
-        self.uni_corpus = Corpus([ ' '.join( map(lambda msg: cleaner(msg.text), tpc) ).lower().split() for tpc in window ])
+        # Initialize unigram corpus from window
+        self.uni_corpus = from_window(window, cleaner=cleaner)
 
         # If necessary, create n_gram_corpus
         if self.n_grams > 1:
-            _process = lambda msg: self.get_ngrams( cleaner( msg.text.lower() ), self.n_grams)
-            self.n_gram_corpus = Corpus([ reduce(lambda x,y: x+y, map(_process, tpc) ) for tpc in window ])
+            self.n_gram_corpus = from_window(window, cleaner=cleaner, n_grams=self.n_grams)
         else:
             self.n_gram_corpus = None
 
@@ -165,3 +163,273 @@ class TFIDF(object):
         word_list =  text.split()
         ngram_list = map(lambda x: ' '.join(x), zip(*[word_list[i:] for i in xrange(n_grams)]))
         return ngram_list
+
+
+class SparseTFIDF(TFIDF):
+    """TF-IDF engine holding the whole window as a single sparse topic x term matrix
+
+    Scores match :class:`TFIDF` (gensim's default ``tf * log2(N / df)`` weighting with L2-normalized topics), but they
+    are computed once for every topic with `scipy.sparse` operations and the top terms of all the topics are ranked
+    in one vectorized pass, so repeated calls to `get_top_terms` are only lookups.
+
+    Note
+    ----
+    Terms without a score are left out: unigrams found in every topic, same-word n-grams and n-grams without any
+    scored word. :class:`TFIDF` pairs its terms and scores by position instead, so in those cases it shifts the
+    scores of the following terms (or fails, for an n-gram without any scored word).
+
+    Attributes
+    ----------
+    uni_corpus : |corpus|
+        Corpus with one document per topic
+    n_gram_corpus : |corpus|
+        Additional corpus with one document per topic containing n-gram's as base tokens (``None`` if `n_grams` is 1)
+    idf : numpy.ndarray
+        Inverse document frequency of each of the terms in the unigram dictionary
+    uni_scores : scipy.sparse.csr_matrix
+        TF-IDF score of every unigram term (columns) for every topic (rows)
+    n_gram_scores : scipy.sparse.csr_matrix
+        Score of every n-gram term (columns) for every topic (rows), the highest normalized TF-IDF of its words
+    """
+    # Weights below this value are dropped (as gensim does)
+    EPS = 1e-12
+    # Maximum number of cells of the topic x term matrix made dense at once when ranking the terms
+    BLOCK_SIZE = 2 ** 20
+
+    def __init__(self, window, cleaner=None, n_grams=1):
+        """Generate a SparseTFIDF model object
+
+        Parameters
+        ----------
+        window : |window|
+            Window containing messages already classified into several topics
+        cleaner : callable, optional
+            Function that gets a str and returns a str back (meant for cleaning and removing stopwords)
+        n_grams : int, optional
+            Number of words to be grouped together and considered a unit token for the corpus (defaults to 1)
+        """
+        self.window = window
+        self.n_grams = n_grams
+
+        # Initialize unigram corpus from window and score it
+        self.uni_corpus = from_window(window, cleaner=cleaner)
+        self.uni_terms = self.term_array(self.uni_corpus.dictionary)
+        counts = self.bow_matrix(self.uni_corpus.corpus, len(self.uni_terms))
+        self.idf = self.inverse_document_frequency(counts)
+        self.uni_scores = self.tfidf_matrix(counts, self.idf)
+
+        # If necessary, create and score n_gram_corpus
+        if self.n_grams > 1:
+            self.n_gram_corpus = from_window(window, cleaner=cleaner, n_grams=self.n_grams)
+            self.n_gram_terms = self.term_array(self.n_gram_corpus.dictionary)
+            self.n_gram_scores = self.n_gram_matrix()
+        else:
+            self.n_gram_corpus = None
+            self.n_gram_terms = None
+            self.n_gram_scores = None
+
+        self._top_terms = {}
+
+    def get_score(self, document_id, unigram=False):
+        """Generates the TF-IDF score table for each of the terms in the document
+
+        Parameters
+        ----------
+        document_id : int
+            Index of topic to obtain the TF-IDF score
+
+        Returns
+        -------
+        list[tuples(str, float)]
+            List with the (term, score) tuples of the terms in the document, sorted by term id
+        """
+        scores, terms = self._scores(unigram)
+        start, end = scores.indptr[document_id], scores.indptr[document_id + 1]
+        return zip(terms[scores.indices[start:end]].tolist(), scores.data[start:end].tolist())
+
+    def get_top_terms(self, document_id, top=10, unigram=False):
+        """Obtain the top terms from a document
+
+        Parameters
+        ----------
+        document_id : int
+            Index of topic to obtain the TF-IDF score
+        top : int, optional
+            Number of top terms to obtain (defaults to 10)
+
+        Returns
+        -------
+        list[tuples(str, float)]
+            List with the (term, score) tuples
+        """
+        return list(self.top_terms(top=top, unigram=unigram)[document_id])
+
+    def top_terms(self, top=10, unigram=False):
+        """Obtain the top terms of every document (computed once for each `top` and cached)
+
+        Parameters
+        ----------
+        top : int, optional
+            Number of top terms to obtain (defaults to 10)
+
+        Returns
+        -------
+        list[list[tuples(str, float)]]
+            List with the (term, score) tuples of each of the documents
+        """
+        key = ((self.n_grams == 1) or unigram, top)
+        if key not in self._top_terms:
+            scores, terms = self._scores(unigram)
+            self._top_terms[key] = [ zip(terms[cols].tolist(), values.tolist())
+                                     for cols, values in self.rank_rows(scores, top) ]
+        return self._top_terms[key]
+
+    def _scores(self, unigram):
+        """Score matrix and term array to use"""
+        if (self.n_grams == 1) or unigram:
+            return self.uni_scores, self.uni_terms
+        return self.n_gram_scores, self.n_gram_terms
+
+    def n_gram_matrix(self):
+        """Scores every n-gram of the n-gram corpus
+
+        The score of an n-gram is the highest TF-IDF weight of its words when they are taken as a document of their
+        own, so it is computed once for every n-gram in the dictionary. Same-word n-grams (and those without any
+        scored word) are dropped.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Score of every n-gram term (columns) for every topic (rows)
+        """
+        # Count of the words of each n-gram term (in the unigram dictionary)
+        token2id = self.uni_corpus.dictionary.token2id
+        words_in_terms = [ term.split() if term is not None else [] for term in self.n_gram_terms ]
+        word_ids = [ [ token2id[w] for w in words if w in token2id ] if len(set(words)) > 1 else []
+                     for words in words_in_terms ]
+        indptr = np.zeros(len(word_ids) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([ len(ids) for ids in word_ids ])
+        indices = np.fromiter((i for ids in word_ids for i in ids), dtype=np.int32, count=indptr[-1])
+        words = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(word_ids), len(self.uni_terms)))
+        words.sum_duplicates()
+
+        term_scores = np.zeros(words.shape[0])
+        if words.shape[1]:
+            term_scores = self.tfidf_matrix(words, self.idf).max(axis=1).toarray().ravel()
+
+        n_gram_scores = self.bow_matrix(self.n_gram_corpus.corpus, len(self.n_gram_terms))
+        n_gram_scores.data = term_scores[n_gram_scores.indices]
+        n_gram_scores.eliminate_zeros()
+        return n_gram_scores
+
+    @staticmethod
+    def term_array(dictionary):
+        """Array with the term of each id of the dictionary (to look up several terms at once)"""
+        n_terms = max(dictionary.token2id.itervalues()) + 1 if len(dictionary) else 0
+        terms = np.empty(n_terms, dtype=object)
+        terms[dictionary.token2id.values()] = dictionary.token2id.keys()
+        return terms
+
+    @staticmethod
+    def bow_matrix(bows, n_terms):
+        """Stacks gensim's bag of words into a sparse count matrix
+
+        Parameters
+        ----------
+        bows : list[list[tuple(int, int)]]
+            (term id, count) pairs of each document
+        n_terms : int
+            Number of terms (columns) of the matrix
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Count of every term (columns) in every document (rows)
+        """
+        indptr = np.zeros(len(bows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([ len(bow) for bow in bows ])
+        indices = np.fromiter((term for bow in bows for term, _ in bow), dtype=np.int32, count=indptr[-1])
+        data = np.fromiter((count for bow in bows for _, count in bow), dtype=np.float64, count=indptr[-1])
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(bows), n_terms))
+        matrix.sort_indices()
+        return matrix
+
+    @staticmethod
+    def inverse_document_frequency(counts):
+        """Computes ``log2(N / df)`` for every term (column) of a count matrix"""
+        document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+        return np.log2(float(counts.shape[0]) / np.maximum(document_frequency, 1))
+
+    @classmethod
+    def tfidf_matrix(cls, counts, idf):
+        """Weights a count matrix by the inverse document frequency and normalizes its rows to unit length
+
+        Parameters
+        ----------
+        counts : scipy.sparse.csr_matrix
+            Count of every term (columns) in every document (rows)
+        idf : numpy.ndarray
+            Inverse document frequency of every term
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            TF-IDF score of every term (columns) in every document (rows)
+        """
+        scores = counts.copy()
+        scores.data = scores.data * idf[scores.indices]
+        norms = np.sqrt(scores.multiply(scores).sum(axis=1).A.ravel())
+        norms[norms == 0] = 1.
+        scores.data /= np.repeat(norms, np.diff(scores.indptr))
+        scores.data[np.abs(scores.data) <= cls.EPS] = 0.
+        scores.eliminate_zeros()
+        return scores
+
+    @classmethod
+    def rank_rows(cls, matrix, top):
+        """Finds the `top` highest non-zero entries of every row of a sparse matrix
+
+        Rows are made dense in blocks of at most `BLOCK_SIZE` cells. The `top`-th highest value of every row of the
+        block is found at once with `numpy.partition`, and every entry reaching it (including all the ties at the
+        cut-off) is sorted by value and then by column index before truncating, so the result is the same as a
+        stable sort of each sparse row.
+
+        Parameters
+        ----------
+        matrix : scipy.sparse.csr_matrix
+            Matrix to rank
+        top : int
+            Number of entries to keep for each row
+
+        Returns
+        -------
+        list[tuple(numpy.ndarray, numpy.ndarray)]
+            Columns and values of the top entries of each row, highest first
+        """
+        n_rows, n_cols = matrix.shape
+        top = min(top, n_cols)
+        if top <= 0:
+            return [ (np.array([], dtype=int), np.array([])) for _ in xrange(n_rows) ]
+
+        ranked = []
+        step = max(1, cls.BLOCK_SIZE // n_cols)
+        for start in xrange(0, n_rows, step):
+            block = matrix[start:start + step].toarray()
+            block_rows = np.arange(block.shape[0])
+            if top < n_cols:
+                cut_off = -np.partition(-block, top - 1, axis=1)[:, top - 1]
+            else:
+                cut_off = np.zeros(block.shape[0])
+
+            # Candidates of every row, sorted by row, value and column
+            rows, cols = np.nonzero((block >= cut_off[:, None]) & (block > 0))
+            values = block[rows, cols]
+            order = np.lexsort((cols, -values, rows))
+            rows, cols, values = rows[order], cols[order], values[order]
+
+            # Keep the first `top` candidates of every row
+            keep = np.arange(len(rows)) - np.searchsorted(rows, block_rows)[rows] < top
+            rows, cols, values = rows[keep], cols[keep], values[keep]
+            bounds = np.searchsorted(rows, np.append(block_rows, block.shape[0]))
+            ranked.extend( (cols[bounds[r]:bounds[r + 1]], values[bounds[r]:bounds[r + 1]]) for r in block_rows )
+        return ranked
@@ -2,6 +2,8 @@
 import os
 import sys
 import logging
+import argparse
+import multiprocessing
 path_to_here = os.path.abspath('.')
 NLP_PATH = path_to_here[:path_to_here.index('slack-pack') + 10] + '/code/'
 sys.path.append(NLP_PATH)
@@ -11,9 +13,9 @@ from nlp.text import extractor as xt
 from nlp.models.message_classification import SimpleClassifier
 from nlp.utils.model_output_management import OutputHelper
 from nlp.models.similarity_calculation import MessageSimilarity
-from nlp.models.summarization import TFIDF as Model
+from nlp.models.summarization import SparseTFIDF as Model
 from nlp.grammar import tokenizer as nt
-from nlp.viz.cloud import Wordcloud
+from nlp.viz.cloud import Wordcloud, PNGCache
 
 logger = logging.getLogger('runner_log')
 logger.setLevel(logging.DEBUG)
@@ -38,130 +40,366 @@ logger.addHandler(ch)
 logger.addHandler(fh)
 
 FONT_PATH = NLP_PATH + 'nlp/data/font/Ranga-Regular.ttf'
-IMG_FOLDER = NLP_PATH + 'nlp/data/img/'
+# Rendered wordclouds, reused across runs when a topic's top terms haven't changed
+CLOUD_CACHE_FOLDER = NLP_PATH + 'nlp/data/img/cache/'
+
+CASSANDRA_IPS = ['54.175.189.47']
+CASSANDRA_KEYSPACE = 'test_keyspace'
+CASSANDRA_TABLE = 'awaybot_messages'
+
+# Maximum amount of messages classified for a horizon
+MAX_MESSAGES = 10000
+
+# Summarized horizons: (type_of_query, duration_unit, periods, min_topic_length, max_messages)
+HORIZONS = [ ('hour', 'hours', p, 3, MAX_MESSAGES) for p in xrange(1, 13, 1) ] + \
+           [ ('day', 'days', p, 3 if p < 4 else 5, MAX_MESSAGES) for p in xrange(1, 8, 1) ] + \
+           [ ('week', 'weeks', p, 5 if p < 2 else 10, MAX_MESSAGES) for p in xrange(1, 7, 1) ]
+
+CLASSIFIER_PARAMS = dict(low_threshold=.4, high_threshold=.7, low_step=.05, high_step=.02, verbose=False)
+
+# State of each worker process (set by `init_worker`)
+WORKER = {}
+
+
+def render_window(team, channel, classified_window, duration, duration_unit, min_topic_length):
+    """Generates the wordclouds of the topics in the classified window
+
+    Parameters
+    ----------
+    team : str
+        Slack team
+    channel : str
+        Slack channel
+    classified_window : :class:`nlp.text.window.Window`
+        Window with the classified topics
+    duration : int
+        Number of periods of the horizon
+    duration_unit : str
+        Unit of the periods of the horizon ('hours', 'days', 'weeks')
+    min_topic_length : int
+        Minimum amount of messages of a topic to generate its wordcloud
+
+    Returns
+    -------
+    list[tuple(str, str, str)]
+        (png, starter_message_url, team) of each of the generated wordclouds, `png` being the bytes of the image
+    """
+    if len(classified_window) == 0:
+        return []
+
+    # Create a model using the corpus
+    uni_model = Model(window=classified_window, cleaner=nt.SimpleCleaner(), n_grams=2)
+
+    cache = PNGCache(CLOUD_CACHE_FOLDER)
+    vizes = []
+    for t, topic in enumerate(classified_window):  # one(?) per topic
+        if len(topic) >= min_topic_length:
+            # Generate the viz out of the model (or reuse the cached image of the same content)
+            try:
+                viz = Wordcloud(model=uni_model, document_id=t, max_words=(10, 5), font=FONT_PATH, multi_plot=True)
+                png = viz.to_png(title='Topic {}'.format(len(vizes) + 1), cache=cache)
+            except:
+                logger.warning("Failed to generate word cloud for", exc_info=True)
+                continue
+            logger.info('topic {} for {} duration {} {} has length {}'.format(t, channel, duration, duration_unit, len(topic)))
+            vizes.append( (png, topic.start_message.url, topic.start_message.team) )
+
+    return vizes
+
+
+def upload_window(team, channel, duration, duration_unit, vizes):
+    """Uploads the wordclouds of a horizon (or records that it has none)
+
+    Parameters
+    ----------
+    team : str
+        Slack team
+    channel : str
+        Slack channel
+    duration : int
+        Number of periods of the horizon
+    duration_unit : str
+        Unit of the periods of the horizon ('hours', 'days', 'weeks')
+    vizes : list[tuple(str, str, str)]
+        (png, starter_message_url, team) of each of the wordclouds (see `render_window`)
+
+    Returns
+    -------
+    int
+        Number of wordclouds uploaded
+    """
+    image_loader = OutputHelper()
+    if vizes:
+        for png, message_url, message_team in vizes:
+            # Call image_loader with: png + starter_message_url + team + channel + duration + duration_unit
+            image_loader.add_viz(None, message_url, message_team, channel, duration, duration_unit, viz_data=png)
+        image_loader.upload()
+    else:
+        # Create a sdb item that records '0' images for that particular channel and duration
+        image_loader.updateImageCount(team, channel, duration, duration_unit)
+    logger.info(
+        'Updloaded {} Images for channel {} and '
+        'duration: {} {}'.format(len(vizes), channel, duration, duration_unit))
+    return len(vizes)
+
+
+def summarize_window(team, channel, classified_window, duration, duration_unit, min_topic_length):
+    """Generates the wordclouds of the topics in the classified window and uploads them (along with the topic count)
+
+    Parameters
+    ----------
+    team : str
+        Slack team
+    channel : str
+        Slack channel
+    classified_window : :class:`nlp.text.window.Window`
+        Window with the classified topics
+    duration : int
+        Number of periods of the horizon
+    duration_unit : str
+        Unit of the periods of the horizon ('hours', 'days', 'weeks')
+    min_topic_length : int
+        Minimum amount of messages of a topic to generate its wordcloud
+
+    Returns
+    -------
+    int
+        Number of wordclouds uploaded
+    """
+    vizes = render_window(team, channel, classified_window, duration, duration_unit, min_topic_length)
+    return upload_window(team, channel, duration, duration_unit, vizes)
+
+
+def classify_horizons(casdb, msg_sim, channel):
+    """Classifies every horizon of the channel, querying and classifying each horizon from scratch
+
+    Parameters
+    ----------
+    casdb : :class:`nlp.text.extractor.CassandraExtractor`
+        Extractor of the messages
+    msg_sim : :class:`nlp.models.similarity_calculation.MessageSimilarity`
+        Message similarity shared by all the classifiers
+    channel : str
+        Slack channel
+
+    Yields
+    ------
+    tuple(int, str, int, :class:`nlp.text.window.Window`)
+        (duration, duration_unit, min_topic_length, classified_window) of each horizon
+    """
+    for type_of_query, duration_unit, p, min_topic_length, max_messages in HORIZONS:
+        msg_stream = casdb.get_messages(type_of_query=type_of_query, periods=p, channel=channel, min_words=5)
+        classifier = SimpleClassifier(message_similarity=msg_sim)
+        classified_window = classifier.classify_stream(msg_stream, max_messages=max_messages, **CLASSIFIER_PARAMS)
+        yield (p, duration_unit, min_topic_length, classified_window)
+
+
+def snapshot_stream(message_stream, window, boundaries, snapshots, caps=None, ends=None):
+    """Streams the messages (oldest first) taking a snapshot of the window right before the first message after each boundary
+
+    With `caps`, a second snapshot is taken (in `ends`) once the capped amount of messages after a boundary has been
+    streamed, and the messages that no boundary still needs (every boundary before them reached its cap) are skipped
+
+    Parameters
+    ----------
+    message_stream : iterable of :class:`nlp.text.message.Message`
+        Chronological stream of messages (being classified into `window`)
+    window : :class:`nlp.text.window.Window`
+        Window into which the messages are classified
+    boundaries : list[float]
+        Timestamps at which to take the snapshots
+    snapshots : list
+        Output list, the snapshot of each boundary is stored at the boundary's index
+    caps : list[int], optional
+        Maximum amount of messages streamed after each boundary (no maximum by default)
+    ends : list, optional
+        Output list, the snapshot taken when each boundary reached its cap (None if it never did)
+
+    Yields
+    ------
+    :class:`nlp.text.message.Message`
+        Next message in the stream
+    """
+    del snapshots[:]
+    snapshots.extend( [None] * len(boundaries) )
+    if ends is not None:
+        del ends[:]
+        ends.extend( [None] * len(boundaries) )
+    if caps is None:
+        caps = [ float('inf') ] * len(boundaries)
+    pending = sorted( range(len(boundaries)), key=lambda b: boundaries[b] )
+    counts = {}  # messages streamed after each of the boundaries still below its cap
+
+    for message in message_stream:
+        # The previous message was the last one of these boundaries
+        full = [ b for b, count in counts.iteritems() if count >= caps[b] ]
+        if full:
+            snapshot = window.snapshot()
+            for b in full:
+                del counts[b]
+                if ends is not None:
+                    ends[b] = snapshot
+
+        while pending and message.timestamp.timestamp > boundaries[pending[0]]:
+            b = pending.pop(0)
+            snapshots[b] = window.snapshot()
+            counts[b] = 0
+
+        if not counts:
+            continue
+        for b in counts:
+            counts[b] += 1
+        yield message
+
+    # Boundaries after the last message: nothing is newer
+    for b in pending:
+        snapshots[b] = window.snapshot()
+
+
+def classify_horizons_incremental(casdb, msg_sim, channel):
+    """Classifies the longest horizon of the channel in a single chronological pass and obtains every horizon from it
+
+    A snapshot of the window is taken at each horizon boundary, each horizon is then made of the messages
+    that were classified after its snapshot (one query and one classification pass per channel). As when they are
+    classified separately, each horizon is capped to its first `max_messages` messages, and the messages beyond the cap
+    of every horizon containing them are not classified
+
+    Parameters
+    ----------
+    casdb : :class:`nlp.text.extractor.CassandraExtractor`
+        Extractor of the messages
+    msg_sim : :class:`nlp.models.similarity_calculation.MessageSimilarity`
+        Message similarity shared by all the classifiers
+    channel : str
+        Slack channel
+
+    Yields
+    ------
+    tuple(int, str, int, :class:`nlp.text.window.Window`)
+        (duration, duration_unit, min_topic_length, classified_window) of each horizon
+    """
+    boundaries = [ casdb.TIME_CALLS[type_of_query](p) for type_of_query, _, p, _, _ in HORIZONS ]
+    caps = [ max_messages for _, _, _, _, max_messages in HORIZONS ]
+    type_of_query, _, periods, _, _ = HORIZONS[ boundaries.index(min(boundaries)) ]
+
+    classifier = SimpleClassifier(message_similarity=msg_sim)
+    snapshots, ends = [], []
+    msg_stream = snapshot_stream(casdb.get_messages(type_of_query=type_of_query, periods=periods, channel=channel, min_words=5),
+                                 classifier.window, boundaries, snapshots, caps=caps, ends=ends)
+    # Every streamed message counts towards the cap of a horizon
+    classified_window = classifier.classify_stream(msg_stream, max_messages=sum(caps), **CLASSIFIER_PARAMS)
+
+    for (_, duration_unit, p, min_topic_length, _), snapshot, end in zip(HORIZONS, snapshots, ends):
+        yield (p, duration_unit, min_topic_length, classified_window.since(snapshot, until=end))
+
+
+def run_channel(casdb, msg_sim, team, channel, incremental=False):
+    """Classifies and summarizes every horizon of the channel
+
+    Parameters
+    ----------
+    casdb : :class:`nlp.text.extractor.CassandraExtractor`
+        Extractor of the messages
+    msg_sim : :class:`nlp.models.similarity_calculation.MessageSimilarity`
+        Message similarity shared by all the classifiers
+    team : str
+        Slack team
+    channel : str
+        Slack channel
+    incremental : bool, optional
+        Classify the longest horizon once and obtain the rest from it (defaults to False)
+    """
+    classify = classify_horizons_incremental if incremental else classify_horizons
+    for duration, duration_unit, min_topic_length, classified_window in classify(casdb, msg_sim, channel):
+        summarize_window(team, channel, classified_window, duration, duration_unit, min_topic_length)
+
+
+def init_worker():
+    """Initializes a worker process with its own Cassandra connection (connections cannot be shared across processes)
+
+    Note
+    ----
+    The message similarity (and its embedding table) is inherited from the parent process on fork, memory-mapped
+    GloVe tables (see `nlp.geometry.repr.convert_glove`) keep sharing the same physical pages
+    """
+    WORKER['casdb'] = xt.CassandraExtractor(cluster_ips=CASSANDRA_IPS,
+                                            session_keyspace=CASSANDRA_KEYSPACE,
+                                            table_name=CASSANDRA_TABLE)
+
+
+def render_channel(job):
+    """Classifies every horizon of a channel and generates its wordclouds (run within a worker process)
+
+    Parameters
+    ----------
+    job : tuple(str, str, bool)
+        (team, channel, incremental)
+
+    Returns
+    -------
+    tuple(str, str, list[tuple(int, str, list)])
+        (team, channel, [(duration, duration_unit, vizes), ...]) to be uploaded by the parent process
+    """
+    team, channel, incremental = job
+    classify = classify_horizons_incremental if incremental else classify_horizons
+
+    horizons = []
+    for duration, duration_unit, min_topic_length, classified_window in classify(WORKER['casdb'], WORKER['msg_sim'], channel):
+        vizes = render_window(team, channel, classified_window, duration, duration_unit, min_topic_length)
+        horizons.append( (duration, duration_unit, vizes) )
+
+    return (team, channel, horizons)
+
+
+def run_parallel(teams, channels, msg_sim, processes, incremental=False):
+    """Spreads the (team, channel) jobs across a pool of processes and uploads the results as they are gathered
+
+    Parameters
+    ----------
+    teams : iterable of str
+        Slack teams
+    channels : iterable of str
+        Slack channels
+    msg_sim : :class:`nlp.models.similarity_calculation.MessageSimilarity`
+        Message similarity shared (through fork) by all the workers
+    processes : int
+        Number of worker processes
+    incremental : bool, optional
+        Classify the longest horizon once and obtain the rest from it (defaults to False)
+    """
+    WORKER['msg_sim'] = msg_sim  # set before forking, so that every worker inherits it
+    jobs = [ (team, channel, incremental) for team in teams for channel in channels ]
+
+    pool = multiprocessing.Pool(processes, initializer=init_worker)
+    try:
+        for team, channel, horizons in pool.imap_unordered(render_channel, jobs):
+            for duration, duration_unit, vizes in horizons:
+                upload_window(team, channel, duration, duration_unit, vizes)
+    finally:
+        pool.close()
+        pool.join()
+
+
 if __name__ == "__main__":
-    casdb = xt.CassandraExtractor(cluster_ips=['54.175.189.47'],
-                              session_keyspace='test_keyspace',
-                              table_name='awaybot_messages')
+    parser = argparse.ArgumentParser(description='Classifies and summarizes the messages of every channel')
+    parser.add_argument('--incremental', action='store_true',
+                        help='classify the longest horizon once per channel and summarize every horizon from it')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes the (team, channel) jobs are spread across (defaults to 1)')
+    args = parser.parse_args()
+
+    casdb = xt.CassandraExtractor(cluster_ips=CASSANDRA_IPS,
+                                  session_keyspace=CASSANDRA_KEYSPACE,
+                                  table_name=CASSANDRA_TABLE)
     teams = casdb.list_teams()
     channels=casdb.list_channels()
     msg_sim = MessageSimilarity()
-    for team in teams:
-        for channel in channels:
-            for p in xrange(1, 13, 1):
-                msg_stream = casdb.get_messages(type_of_query='hour', periods=p, channel=channel, min_words=5)
-                classifier = SimpleClassifier(message_similarity=msg_sim)
-                classified_window = classifier.classify_stream(msg_stream, low_threshold=.4, high_threshold=.7, low_step=.05, high_step=.02, max_messages=10000, verbose=False)
-                image_loader = OutputHelper()
-                if len(classified_window) == 0:
-                    # Create a sdb item that records '0' images for that particular channel and duration
-                    image_loader.updateImageCount(team, channel, p, 'hours')
-                    continue
-
-                # Create a model using the corpus
-                uni_model = Model(window=classified_window, cleaner=nt.SimpleCleaner(), n_grams=2)
-                # bigram_model = Model(window=classified_window, cleaner=nt.SimpleCleaner(), n_grams=2)  # if we wanted a bigram model
-
-                viz_topics = 0
-                for t, topic in enumerate(classified_window):  # one(?) per topic
-                    if len(topic) >= 3:
-                        # Generate the viz out of the model
-                        try:
-                            viz = Wordcloud(model=uni_model, document_id=t, max_words=(10, 5), font=FONT_PATH, multi_plot=True)
-                        except:
-                            logger.warning("Failed to generate word cloud for",exc_info=True)
-                            continue
-                        viz_topics += 1
-                        logger.info('topic {} for {} duration {} hour(s) has length {}'.format(t, channel, p, len(topic)))
-                        viz_path = IMG_FOLDER + 'cloud_topic_{}_{}_{}_{}.png'.format(channel, 'hours', p, viz_topics)
-                        viz.save_png(viz_path, title='Topic {}'.format(viz_topics))
-
-                        # Call image_loader with: img_path + starter_message_url + team + channel + duration + duration_unit
-                        image_loader.add_viz(viz_path, topic.start_message.url, topic.start_message.team, channel, p, 'hours')
-                        # TODO: parameter-ize the duration unit
-                if viz_topics:
-                    image_loader.upload()
-                else:
-                    # Create a sdb item that records '0' images for that particular channel and duration
-                    image_loader.updateImageCount(team, channel, p, 'hours')
-                logger.info(
-                    'Updloaded {} Images for channel {} and '
-                    'duration: {} {}'.format(viz_topics, channel, p, 'hour(s)'))
-            for p in xrange(1, 8, 1):
-                min_topic_length = 3 if p < 4 else 5
-                msg_stream = casdb.get_messages(type_of_query='day', periods=p, channel=channel, min_words=5)
-                classifier = SimpleClassifier(message_similarity=msg_sim)
-                classified_window = classifier.classify_stream(msg_stream, low_threshold=.4, high_threshold=.7, low_step=.05, high_step=.02, max_messages=10000, verbose=False)
-                image_loader = OutputHelper()
-                if len(classified_window) == 0:
-                    # Create a sdb item that records '0' images for that particular channel and duration
-                    image_loader.updateImageCount(team, channel, p, 'days')
-                    continue
-
-                # Create a model using the corpus
-                uni_model = Model(window=classified_window, cleaner=nt.SimpleCleaner(), n_grams=2)
-                # bigram_model = Model(window=classified_window, cleaner=nt.SimpleCleaner(), n_grams=2)  # if we wanted a bigram model
-
-                viz_topics = 0
-                for t, topic in enumerate(classified_window):  # one(?) per topic
-                    if len(topic) >= min_topic_length:
-                        try:
-                            viz = Wordcloud(model=uni_model, document_id=t, max_words=(10, 5), font=FONT_PATH, multi_plot=True)
-                        except:
-                            # logger.warning("Failed to generate word cloud for",exc_info=True)
-                            continue
-                        viz_topics += 1
-                        logger.info('topic {} for {} duration {} day(s) has length {}'.format(t, channel, p, len(topic)))
-                        viz_path = IMG_FOLDER + 'cloud_topic_{}_{}_{}_{}.png'.format(channel, 'days', p, viz_topics)
-                        viz.save_png(viz_path, title='Topic {}'.format(viz_topics))
-
-                        # Call image_loader with: img_path + starter_message_url + team + channel + duration + duration_unit
-                        image_loader.add_viz(viz_path, topic.start_message.url, topic.start_message.team, channel, p, 'days')
-                        # TODO: parameter-ize the duration unit
-                if viz_topics:
-                    image_loader.upload()
-                else:
-                    # Create a sdb item that records '0' images for that particular channel and duration
-                    image_loader.updateImageCount(team, channel, p, 'days')
-                logger.info(
-                    'Updloaded {} Images for channel {} and '
-                    'duration: {} {}'.format(viz_topics, channel, p, 'day(s)'))
-            for p in xrange(1, 7, 1):
-                min_topic_length = 5 if p < 2 else 10
-                msg_stream = casdb.get_messages(type_of_query='week', periods=p, channel=channel, min_words=5)
-                classifier = SimpleClassifier(message_similarity=msg_sim)
-                classified_window = classifier.classify_stream(
-                    msg_stream, low_threshold=.4, high_threshold=.7,
-                    low_step=.05, high_step=.02, max_messages=10000, verbose=False)
-                image_loader = OutputHelper()
-                if len(classified_window) == 0:
-                    image_loader.updateImageCount(team, channel, p, 'weeks')
-                    continue        
-                # Create a model using the corpus
-                uni_model = Model(window=classified_window, cleaner=nt.SimpleCleaner(), n_grams=2)
-                # bigram_model = Model(window=classified_window, cleaner=nt.SimpleCleaner(), n_grams=2)  # if we wanted a bigram model
-
-                viz_topics = 0
-                for t, topic in enumerate(classified_window):  # one(?) per topic
-                    if len(topic) >= min_topic_length:
-                        try:
-                            viz = Wordcloud(model=uni_model, document_id=t, max_words=(10, 5), font=FONT_PATH, multi_plot=True)
-                        except:
-                            logger.warning("Failed to generate word cloud for",exc_info=True)
-                            continue
-                        viz_topics += 1
-                        # logger.info('topic {} for {} duration {} week(s) has length {}'.format(t, channel, p, len(topic)))
-                        viz_path = IMG_FOLDER + 'cloud_topic_{}_{}_{}_{}.png'.format(channel, 'weeks', p, viz_topics)
-                        viz.save_png(viz_path, title='Topic {}'.format(viz_topics))
-
-                        # Call image_loader with: img_path + starter_message_url + team + channel + duration + duration_unit
-                        image_loader.add_viz(viz_path, topic.start_message.url, topic.start_message.team, channel, p, 'weeks')
-                        # TODO: parameter-ize the duration unit
-                if viz_topics:
-                    image_loader.upload()
-                else:
-                    # Create a sdb item that records '0' images for that particular channel and duration
-                    image_loader.updateImageCount(team, channel, p, 'weeks')
-                logger.info(
-                    'Updloaded {} Images for channel {} and '
-                    'duration: {} {}'.format(viz_topics, channel, p, 'week(s)'))
+
+    if args.processes > 1:
+        run_parallel(teams, channels, msg_sim, args.processes, incremental=args.incremental)
+    else:
+        for team in teams:
+            for channel in channels:
+                run_channel(casdb, msg_sim, team, channel, incremental=args.incremental)
+
+    PNGCache(CLOUD_CACHE_FOLDER).prune()
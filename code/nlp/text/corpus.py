@@ -14,6 +14,7 @@
 """
 
 from collections import Counter
+from itertools import chain
 import cPickle as pk
 from gensim import corpora
 
@@ -61,13 +62,13 @@ def from_window(window, cleaner=None, n_grams=1):
     """
     cleaner = cleaner if cleaner is not None else lambda x: x
 
+    # One token iterator per topic (chaining the tokens of its messages)
     if n_grams == 1:
-        _corpus = Corpus([ ' '.join( map(lambda msg: cleaner(msg.text), tpc) ).lower().split() for tpc in window ])
+        documents = ( chain.from_iterable( cleaner(msg.text).lower().split() for msg in tpc ) for tpc in window )
     else:
-        _corpus = Corpus([ reduce(lambda x,y: x+y,
-                                  map(lambda msg: get_ngrams( cleaner( msg.text.lower() ), n_grams), tpc) ) for tpc in window ])
+        documents = ( chain.from_iterable( get_ngrams( cleaner( msg.text.lower() ), n_grams) for msg in tpc ) for tpc in window )
 
-    return _corpus
+    return Corpus(documents)
 
 
 def from_documents(documents):
@@ -105,20 +106,49 @@ def load_corpus(filepath):
 
 
 class Corpus(object):
-    """docstring for Corpus"""
-    def __init__(self, document_wordlist, min_count=0):
-        self.document_wordlist = document_wordlist  # word list for every topic
+    """Bag-of-words corpus with one document per topic
+
+    The token counter, the dictionary and the bag-of-words of every document are built in a single pass over the
+    documents (a second pass over the materialized documents is only needed to filter by `min_count`)
 
-        # Generate a word counter
-        self.token_count = Counter( reduce(lambda x,y: x+y, self.document_wordlist) )  # the flatenned list of words
+    Attributes
+    ----------
+    document_wordlist : list[list[str]]
+        Tokens of every document
+    token_count : Counter
+        Number of occurrences of each token in the corpus (before filtering)
+    dictionary : `gensim.corpora.dictionary<https://radimrehurek.com/gensim/corpora/dictionary.html>`_
+        Dictionary of the tokens in the corpus
+    corpus : list[list[tuple(int, int)]]
+        Bag-of-words of every document
+    """
+    def __init__(self, document_wordlist, min_count=0):
+        """
+        Parameters
+        ----------
+        document_wordlist : iterable of iterables of str
+            Tokens of every document (e.g. lists or token iterators)
+        min_count : int, optional
+            Remove the tokens with fewer occurrences in the corpus (defaults to 0, no filtering)
+        """
+        self.document_wordlist = []  # word list for every topic
+        self.token_count = Counter()
+        self.dictionary = corpora.Dictionary()
+        self.corpus = []
+
+        for document in document_wordlist:
+            tokens = list(document)
+            self.token_count.update(tokens)
+            self.document_wordlist.append(tokens)
+            if not min_count:
+                self.corpus.append( self.dictionary.doc2bow(tokens, allow_update=True) )
 
         # Remove infrequent words if specified
         if min_count:
-            self.document_wordlist = map(lambda doc: filter(lambda token: self.token_count[token] >= min_count, doc), self.document_wordlist)
-
-        # Generate corpus
-        self.dictionary = corpora.Dictionary(self.document_wordlist)
-        self.corpus = [ self.dictionary.doc2bow(tpc) for tpc in self.document_wordlist ]
+            token_count = self.token_count
+            self.document_wordlist = [ [ token for token in doc if token_count[token] >= min_count ]
+                                       for doc in self.document_wordlist ]
+            self.corpus = [ self.dictionary.doc2bow(doc, allow_update=True) for doc in self.document_wordlist ]
 
     def __getitem__(self, item):
         return self.corpus[item]
@@ -13,7 +13,10 @@ from abc import ABCMeta, abstractmethod
 import pendulum as pm
 import warnings
 
+import io
+import os
 import json
+from glob import glob
 from cassandra import ConsistencyLevel
 from cassandra.cluster import Cluster
 from cassandra.query import SimpleStatement
@@ -36,13 +39,79 @@ class Extractor(with_metaclass(ABCMeta, object)):
         pass
 
 
+def iter_json_array(file_name, chunk_size=65536):
+    """Streams the elements of a top-level JSON array one at a time (without loading the whole file)
+
+    Parameters
+    ----------
+    file_name : str
+        Path to the JSON file containing an array
+    chunk_size : int, optional
+        Amount of characters read at once (defaults to 64K)
+
+    Yields
+    ------
+    object
+        Next (decoded) element of the array
+
+    Raises
+    ------
+    ValueError
+        If the file is not a well-formed JSON array
+    """
+    decoder = json.JSONDecoder()
+
+    with io.open(file_name, encoding='utf-8') as data_file:
+        buffer, pos, eof = u'', 0, False
+        in_array = False
+
+        while True:
+            # Skip whitespace and separators
+            while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == u',')):
+                pos += 1
+
+            if pos < len(buffer):
+                if not in_array:
+                    if buffer[pos] != u'[':
+                        raise ValueError('{} does not contain a JSON array'.format(file_name))
+                    in_array = True
+                    pos += 1
+                    continue
+
+                if buffer[pos] == u']':
+                    return
+
+                # An element is only complete if something follows it (or the file is over)
+                try:
+                    element, end = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    if eof:
+                        raise
+                else:
+                    if (end < len(buffer)) or eof:
+                        pos = end
+                        yield element
+                        continue
+
+            elif eof:
+                raise ValueError('Unexpected end of the JSON array in {}'.format(file_name))
+
+            # Read more (dropping what was already consumed)
+            chunk = data_file.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+
+
 class JSONExtractor(Extractor):
     """Parser of the raw JSON Slack generated history files
 
     Parameters
     ----------
     file_name : str or IOBuffer
-        Path to the JSON object with the messages
+        Path to the JSON object with the messages, or to a directory of (per-day) Slack export JSON files
+    streaming : bool, optional
+        Stream the messages one at a time instead of loading the whole file on instantiation (defaults to False).
+        Directories are always streamed
 
     Attributes
     ----------
@@ -58,9 +127,10 @@ class JSONExtractor(Extractor):
     TEXT = u'text'
     TIMESTAMP = u'ts'
 
-    def __init__(self, file_name, logger=None):
+    def __init__(self, file_name, logger=None, streaming=False):
         self.file_name = file_name
-        self.jsonObject = self.parse()
+        self.streaming = streaming or os.path.isdir(file_name)
+        self.jsonObject = None if self.streaming else self.parse()
         self.logger = False
         if logger is not None:
             self.set_logger(logger)
@@ -70,6 +140,31 @@ class JSONExtractor(Extractor):
         with open(self.file_name) as data_file:
             return json.load(data_file)
 
+    def iter_json(self):
+        """Streams the raw JSON messages, reading the per-day files one after another if `file_name` is a directory
+
+        Only the date-named files (``YYYY-MM-DD.json``) of the directory are read, and messages of those without a
+        timestamp are skipped
+
+        Yields
+        ------
+        dict
+            Next raw JSON message
+        """
+        if not os.path.isdir(self.file_name):
+            for message in iter_json_array(self.file_name):
+                yield message
+            return
+
+        # Each file holds a different day, so sorting the names keeps the messages in timestamp order
+        for file_name in sorted(glob(os.path.join(self.file_name, '????-??-??.json'))):
+            for message in iter_json_array(file_name):
+                try:
+                    float(message[self.TIMESTAMP])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                yield message
+
     def get_messages(self):
         """Gets the stream of messages
 
@@ -78,7 +173,9 @@ class JSONExtractor(Extractor):
         iterator(|message|)
             Stream of messages
         """
-        for message in self.jsonObject:
+        messages = self.iter_json() if self.streaming else self.jsonObject
+
+        for message in messages:
             try:
                 id_ = message[self.TIMESTAMP]
                 user = message[self.USER]
@@ -89,7 +186,7 @@ class JSONExtractor(Extractor):
                     logging.error("Failed to parse message", exc_info=True)
                 continue
 
-            yield Message(id_, text, user, timestamp)
+            yield Message(id_, text, user, timestamp=timestamp)
 
     def set_logger(self, logfile):
         # Logging
@@ -127,6 +224,8 @@ class CassandraExtractor(Extractor):
         Keyspace on which to connect in the Cassandra cluster
     table_name : str
         Name of the main table to be queried
+    fetch_size : int, optional
+        Amount of rows fetched per page (defaults to 1000)
 
     Attributes
     ----------
@@ -140,17 +239,70 @@ class CassandraExtractor(Extractor):
                    'all': lambda: 0,
                  }
 
-    BASE_QUERY = "SELECT * FROM {tb} WHERE ts > '{ts}' AND channel = '{c}' ALLOW FILTERING;"
+    # Range query within the channel partition (the tables are keyed by `PRIMARY KEY (channel, ts)`)
+    BASE_QUERY = "SELECT * FROM {tb} WHERE channel = ? AND ts > ?;"
 
 
-    def __init__(self, cluster_ips, session_keyspace, table_name):
+    def __init__(self, cluster_ips, session_keyspace, table_name, fetch_size=1000):
         self.cluster = Cluster(cluster_ips)
         self.session = self.cluster.connect(session_keyspace)
         self.table_name = table_name
+        self.fetch_size = fetch_size
 
         self.CUSTOM_QUERIES = {}
         self.__channels = None
         self.__teams = None
+        self.__prepared = {}
+
+    def get_prepared(self, table):
+        """Prepares (once per table) the base range query
+
+        Parameters
+        ----------
+        table : str
+            Table to be queried
+
+        Returns
+        -------
+        `PreparedStatement <https://datastax.github.io/python-driver/api/cassandra/query.html#cassandra.query.PreparedStatement>`_
+            Prepared base query of the table
+        """
+        if table not in self.__prepared:
+            self.__prepared[table] = self.session.prepare( self.BASE_QUERY.format(tb=table) )
+        return self.__prepared[table]
+
+    def iter_rows(self, statement, parameters=None):
+        """Streams the rows of a query page by page, fetching the next page asynchronously while the current one is consumed
+
+        Parameters
+        ----------
+        statement : str or Statement
+            Query to be executed
+        parameters : list, optional
+            Parameters of the statement
+
+        Yields
+        ------
+        Row
+            Next row of the query
+        """
+        if isinstance(statement, basestring):
+            statement = SimpleStatement(statement, fetch_size=self.fetch_size)
+        else:
+            statement.fetch_size = self.fetch_size
+
+        future = self.session.execute_async(statement, parameters)
+        while True:
+            rows = future.result().current_rows  # waits for the current page
+            has_more_pages = future.has_more_pages
+            if has_more_pages:
+                future.start_fetching_next_page()  # prefetch the next page
+
+            for row in rows:
+                yield row
+
+            if not has_more_pages:
+                break
 
     def add_query(self, label, query):
         """Adds a custom query to the QUERIES dictionary
@@ -245,7 +397,7 @@ class CassandraExtractor(Extractor):
         # If the type_of_query is one of the base
         if type_of_query in self.TIME_CALLS:
             qtimestamp = self.TIME_CALLS[type_of_query](periods)
-            rows = self.session.execute( self.BASE_QUERY.format(tb=qtable, ts=qtimestamp, c=channel) )
+            rows = self.iter_rows( self.get_prepared(qtable).bind( (channel, str(qtimestamp)) ) )
 
         # Else, fetch query from CUSTOM_QUERIES
         else:
@@ -255,12 +407,12 @@ class CassandraExtractor(Extractor):
                 error_msg = 'The specific type_of_query ({}) was not found. Queries can be added with `add_query`'
                 raise KeyError(error_msg.format(type_of_query))
 
-            rows = self.session.execute(query)
-
-        if not rows:
-            warnings.warn('No messages were returned from the query specified')
+            rows = self.iter_rows(query)
 
+        empty = True
         for r in rows:
+            empty = False
+
             # Only stream messages with more than the specified amount of minimum words
             if len(r.message_text.split()) < min_words:
                 continue
@@ -279,4 +431,7 @@ class CassandraExtractor(Extractor):
                                url=r.message_url,
                                timestamp=timestamp) )
 
+        if empty:
+            warnings.warn('No messages were returned from the query specified')
+
 
@@ -33,14 +33,19 @@ class Message(object):
         Timestamp of the message
         .. note::
             In fact it is a `Pendulum <https://pendulum.eustace.io/>`_ object, (which is an extension of datetime.datetime)
+    clean_text : str
+        Message's cleaned text (only if processed with a cleaner)
     text_repr : tuple(float)
         Message's word embedding representation
+    repr_id : str
+        ID of the processor that produced the `text_repr` (the message is only reprocessed if the processor changes)
 
     """
 
     def __init__(self, id, text, author, team=None, url=None, timestamp=None):
         self.id = id
         self.text = text
+        self.clean_text = None
         self.text_repr = None
         self.repr_id = None
         self.author = author
@@ -52,20 +57,26 @@ class Message(object):
     def is_processed(self):
         return self.text_repr is not None
 
-    def process(self, processor, verbose=False):
+    def process(self, processor, cleaner=None, verbose=False):
         """Processes the message text
 
+        Note
+        ----
+        The representation is cached in the message: it is only recomputed if the `processor_id` attribute of the processor
+        differs from the one that produced the current representation. Processors without `processor_id` are never cached.
+
         Parameters
         ----------
         processor : callable
             Message processor to create the text representation
+        cleaner : callable, optional
+            Text cleaner applied (and cached in `clean_text`) before the processor
         verbose : bool, optional
             Warn if processing is unnecessary
 
         """
-        try:
-            processor_id = processor.__id
-        except AttributeError:
+        processor_id = getattr(processor, 'processor_id', None)
+        if processor_id is None:
             # In case the processor_id is not specified defaults to the `now()` timestamp
             processor_id = pm.now()
 
@@ -74,6 +85,9 @@ class Message(object):
                 warnings.warn('Message will not be reprocessed')
         else:
             # process and save representation
-            self.text_repr = processor(self.text)
+            if cleaner is not None:
+                self.clean_text = cleaner(self.text)
+                self.text_repr = processor(self.clean_text)
+            else:
+                self.text_repr = processor(self.text)
             self.repr_id = processor_id
-
@@ -11,6 +11,8 @@
 
 """
 
+import numpy as np
+
 
 class Topic:
     """Slack conversation topic: subset of highly-related messages
@@ -23,6 +25,12 @@ class Topic:
         List of Message was added to the topic
     reasons : list[str]
         List of the rationales why the messages were added to the topic
+    repr_id : str
+        ID of the processor that produced the cached representations (None if they need to be rebuilt)
+    embeddings : np.array(float)
+        Growable matrix with the normalized representation of each message (only the first `len(topic)` rows are valid)
+    repr_sum : np.array(float)
+        Running sum of the representations of the messages (for the centroid)
 
     """
 
@@ -33,6 +41,13 @@ class Topic:
         self.last_timestamp = start_message.timestamp
         # TODO: possible summary
 
+        # Cached representations (maintained incrementally while the messages share the processor)
+        self.repr_id = start_message.repr_id if start_message.is_processed else None
+        self.embeddings = None
+        self.repr_sum = None
+        if self.repr_id is not None:
+            self._add_representations([start_message])
+
     def append_message(self, message, reason):
         """Add a message into the topic
 
@@ -47,6 +62,7 @@ class Topic:
         self.messages.append(message)
         self.reasons.append(reason)
         self.last_timestamp = message.timestamp
+        self._add_representations([message])
 
     @property
     def size(self):
@@ -68,9 +84,107 @@ class Topic:
             Topic to be absorbed
 
         """
-        self.messages = self.messages + other.messages
-        self.messages.sort(key=lambda msg: msg.id)
-        self.reasons.extend( other.reasons )  # append reasons from other topic
+        messages = self.messages + other_topic.messages
+        order = sorted( range(len(messages)), key=lambda i: messages[i].id )
+        self.messages = [ messages[i] for i in order ]
+        self.reasons.extend( other_topic.reasons )  # append reasons from other topic
+
+        # Merge the cached representations (in the new message order) if both were produced by the same processor
+        if (self.repr_id is not None) and (self.repr_id == other_topic.repr_id):
+            self.embeddings = np.concatenate([ self.embeddings[:len(messages) - len(other_topic)],
+                                               other_topic.embeddings[:len(other_topic)] ])[order]
+            self.repr_sum = self.repr_sum + other_topic.repr_sum
+        else:
+            self._clear_representations()
+
+    def process(self, processor, cleaner=None):
+        """Processes every message of the topic and rebuilds the cached representations if the processor changed
+
+        Parameters
+        ----------
+        processor : callable
+            Message processor to create the text representation (see |message| `process`)
+        cleaner : callable, optional
+            Text cleaner applied before the processor
+        """
+        processor_id = getattr(processor, 'processor_id', None)
+        if (processor_id is not None) and (processor_id == self.repr_id):
+            return
+
+        for message in self.messages:
+            message.process(processor, cleaner=cleaner)
+
+        self._clear_representations()
+        self.repr_id = processor_id
+        self._add_representations(self.messages, force=True)
+
+    def get_embeddings(self, processor, cleaner=None):
+        """Matrix with the normalized representations of the messages of the topic
+
+        Parameters
+        ----------
+        processor : callable
+            Message processor to create the text representation (see |message| `process`)
+        cleaner : callable, optional
+            Text cleaner applied before the processor
+
+        Returns
+        -------
+        np.array(float)
+            Matrix (len(topic) x dim) with a unit-norm row per message, in message order
+        """
+        self.process(processor, cleaner=cleaner)
+        return self.embeddings[:len(self.messages)]
+
+    def get_centroid(self, processor, cleaner=None):
+        """Geometric centroid of the representations of the messages of the topic
+
+        Parameters
+        ----------
+        processor : callable
+            Message processor to create the text representation (see |message| `process`)
+        cleaner : callable, optional
+            Text cleaner applied before the processor
+
+        Returns
+        -------
+        np.array(float)
+            Mean of the message representations (maintained incrementally, no need to re-sum the messages)
+        """
+        self.process(processor, cleaner=cleaner)
+        return self.repr_sum / len(self.messages)
+
+    def _clear_representations(self):
+        self.repr_id = None
+        self.embeddings = None
+        self.repr_sum = None
+
+    def _add_representations(self, messages, force=False):
+        """Appends the representations of the messages to the cached ones (invalidates the cache if they were processed differently)
+        """
+        if not force:
+            if self.repr_id is None:
+                return
+            if any( (not m.is_processed) or (m.repr_id != self.repr_id) for m in messages ):
+                self._clear_representations()
+                return
+
+        rows = np.array([ m.text_repr for m in messages ], dtype=np.float64)
+        self.repr_sum = rows.sum(axis=0) if self.repr_sum is None else self.repr_sum + rows.sum(axis=0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rows /= np.linalg.norm(rows, axis=1)[:, None]
+
+        # Grow the matrix (doubling its capacity) whenever it is full
+        size = len(self.messages) - len(messages)
+        if self.embeddings is None:
+            self.embeddings = np.empty( (max(len(messages), 4), rows.shape[1]), dtype=np.float64 )
+        elif size + len(messages) > len(self.embeddings):
+            grown = np.empty( (2 * (size + len(messages)), rows.shape[1]), dtype=np.float64 )
+            grown[:size] = self.embeddings[:size]
+            self.embeddings = grown
+
+        self.embeddings[size:size + len(messages)] = rows
 
     def get_starter_url(self):
         """Returns the topic's starter message URL for go-to link creation
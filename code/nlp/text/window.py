@@ -184,6 +184,40 @@ class Window:
         if not force_inactive:
             self.activate_topic( self.topics[topic_index] )
 
+    def snapshot(self):
+        """Records the current size of each topic (to later obtain only the messages inserted afterwards with `since`)
+
+        Returns
+        -------
+        dict
+            Size of each of the |topic|s in the window
+        """
+        return dict( (topic, len(topic)) for topic in self.topics )
+
+    def since(self, snapshot, until=None):
+        """Generates a Window with only the messages inserted after a snapshot was taken
+
+        Parameters
+        ----------
+        snapshot : dict
+            Snapshot of the window (see `snapshot`)
+        until : dict, optional
+            Later snapshot of the window, the messages inserted after it are left out (defaults to None, all of them are kept)
+
+        Returns
+        -------
+        :class:`nlp.text.window.Window`
+            Window with the topics that received messages after the snapshot (most recent first), restricted to those messages
+        """
+        topic_list = []
+        for topic in self.topics:
+            start = snapshot.get(topic, 0)
+            end = len(topic) if until is None else until.get(topic, 0)
+            if end > start:
+                topic_list.append( zip(topic.messages[start:end], topic.reasons[start:end]) )
+
+        return from_topic_list(topic_list)
+
     def report_topics(self):
         """Prints out a report of the amount of topics and the size (in messages) of each topic
         """
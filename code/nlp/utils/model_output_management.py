@@ -2,8 +2,11 @@ import os
 import sys
 import boto3
 import logging
+import logging.handlers
+from io import BytesIO
 from Queue import PriorityQueue
 from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
 
 logger = logging.getLogger('model_output_handler_log')
@@ -31,7 +34,7 @@ logger.addHandler(fh)
 
 class OutputHelper(object):
 
-    Viz = namedtuple('Viz', 'viz_path message_url team channel duration duration_unit')
+    Viz = namedtuple('Viz', 'viz_path message_url team channel duration duration_unit viz_data')
 
     def __init__(self):
         self.output_ojects = PriorityQueue(0)
@@ -77,7 +80,7 @@ class OutputHelper(object):
         None
         """
         try:
-            self.s3 = boto3.resource('s3')
+            self.s3 = boto3.client('s3')
         except:
             # logger.error(
             #     "Failed to connect to AWS. Have you configured "
@@ -88,68 +91,120 @@ class OutputHelper(object):
         return
 
 
-    def add_viz(self, viz_path, starter_message_url, team, channel, duration, duration_unit):
-        new_viz = self.Viz(viz_path, starter_message_url, team, channel, duration, duration_unit)
+    def add_viz(self, viz_path, starter_message_url, team, channel, duration, duration_unit, viz_data=None):
+        new_viz = self.Viz(viz_path, starter_message_url, team, channel, duration, duration_unit, viz_data)
         priority_ts = starter_message_url.split('/')[-1].replace('p', '')
         self.output_ojects.put((priority_ts, new_viz))
         return
 
     
-    def upload(self, s3_bucket='awaybot_test', simple_db_domain='awaybot'):
+    def upload_viz(self, viz, s3_bucket, s3_viz_name):
+        """
+        Function that uploads the image of a viz to s3 as a public object.
+        The image is streamed from memory if the viz has its png bytes,
+        otherwise it is read from its path.
+
+        Parameters:
+        -----------
+        viz: Viz
+            The viz to upload
+        s3_bucket: str
+            The name of the s3 bucket
+        s3_viz_name: str
+            The key of the image in the bucket
+
+        Returns:
+        ----------
+        str
+            The public url of the image
+        """
+        if viz.viz_data is not None:
+            self.s3.upload_fileobj(
+                BytesIO(viz.viz_data), s3_bucket, s3_viz_name,
+                ExtraArgs={'ACL': 'public-read', 'ContentType': 'image/png'})
+        else:
+            self.s3.upload_file(
+                viz.viz_path, s3_bucket, s3_viz_name,
+                ExtraArgs={'ACL': 'public-read'})
+        s3_viz_url = 'https://s3.amazonaws.com/{}/{}'.format(
+            s3_bucket, s3_viz_name)
+        logger.info('Uploaded image to s3: {}'.format(s3_viz_url))
+        return s3_viz_url
+
+
+    def upload(self, s3_bucket='awaybot_test', simple_db_domain='awaybot',
+               processes=8, sdb_batch_size=25):
+        """
+        Function that uploads the queued vizes to s3 concurrently and
+        records them (and their count) in SimpleDB with batched writes.
+
+        Parameters:
+        -----------
+        s3_bucket: str
+            The name of the s3 bucket
+            Default: 'awaybot_test'
+        simple_db_domain: str
+            The name of the SimpleDB domain
+            Default: 'awaybot'
+        processes: int
+            Maximum amount of concurrent s3 uploads
+            Default: 8
+        sdb_batch_size: int
+            Amount of items per batch_put_attributes call (at most 25)
+            Default: 25
+
+        Returns:
+        ----------
+        None
+        """
         if not self.s3_status:
             self.s3Connect()
         if not self.sdb_status:
             self.simpledbConnect()
 
-        sdb_payload = {
-            'archiveURL': '',
-            'modelURL': '',
-            'numMessages': '0'
-        }
-        vizes = 0
+        vizes = []
         while not self.output_ojects.empty():
-            viz = self.output_ojects.get()[1]
-
-            # Upload to s3 and make public
-            s3_viz_name = '{}_{}_{}_{}_{}.png'.format(
-                viz.team, viz.channel, viz.duration, viz.duration_unit, vizes)
-            viz_obj = self.s3.Object(s3_bucket, s3_viz_name)
-            upload_viz_to_s3 = viz_obj.upload_file(viz.viz_path)
-            viz_obj.Acl().put(ACL='public-read')
-            s3_viz_url = 'https://s3.amazonaws.com/{}/{}'.format(
-                s3_bucket, s3_viz_name)
-            logger.info('Uploaded image to s3: {}'.format(s3_viz_url))
-            
-            vizes += 1
-            # Update SimpleDB
+            vizes.append(self.output_ojects.get()[1])
+        if not vizes:
+            return
+
+        # Upload to s3 and make public
+        s3_viz_names = [
+            '{}_{}_{}_{}_{}.png'.format(
+                viz.team, viz.channel, viz.duration, viz.duration_unit, i)
+            for i, viz in enumerate(vizes)]
+        pool = ThreadPool(max(1, min(processes, len(vizes))))
+        try:
+            s3_viz_urls = pool.map(
+                lambda args: self.upload_viz(args[0], s3_bucket, args[1]),
+                zip(vizes, s3_viz_names))
+        finally:
+            pool.close()
+
+        # Update SimpleDB, the count of the duration goes last
+        items = []
+        for i, (viz, s3_viz_url) in enumerate(zip(vizes, s3_viz_urls), 1):
             viz_sdb_key = '{}_{}_{}_{}_{}'.format(
-                viz.team, viz.channel, viz.duration, viz.duration_unit, vizes)
-            duration_sdb_key = '{}_{}_{}_{}'.format(
-                viz.team, viz.channel, viz.duration, viz.duration_unit)
-            sdb_payload['archiveURL'] = viz.message_url
-            sdb_payload['modelURL'] = s3_viz_url
-            
-            sdb_payload['numMessages'] = str(vizes)
-            item_attrs = [
-                    {'Name': 'modelURL', 'Value': str(sdb_payload['modelURL']), 'Replace': True},
-                    {'Name': 'archiveURL', 'Value': sdb_payload['archiveURL'], 'Replace': True}
-                    ]
-            self.sdb.put_attributes(
-                DomainName=simple_db_domain,
-                ItemName=viz_sdb_key,
-                Attributes=item_attrs)
-            logger.info("Created SimpleDB item {}".format(viz_sdb_key))
-            # logger.info(response)
-
-        num_message_attrs = [
-            {'Name': 'numMessages', 'Value': str(sdb_payload['numMessages']), 'Replace': True},
-            ]
-        self.sdb.put_attributes(
-                DomainName=simple_db_domain,
-                ItemName=duration_sdb_key,
-                Attributes=num_message_attrs)
-        logger.info("Created SimpleDB item {}".format(duration_sdb_key))
-        # logger.info(response)
+                viz.team, viz.channel, viz.duration, viz.duration_unit, i)
+            items.append({
+                'Name': viz_sdb_key,
+                'Attributes': [
+                    {'Name': 'modelURL', 'Value': str(s3_viz_url), 'Replace': True},
+                    {'Name': 'archiveURL', 'Value': viz.message_url, 'Replace': True}
+                ]})
+        duration_sdb_key = '{}_{}_{}_{}'.format(
+            viz.team, viz.channel, viz.duration, viz.duration_unit)
+        items.append({
+            'Name': duration_sdb_key,
+            'Attributes': [
+                {'Name': 'numMessages', 'Value': str(len(vizes)), 'Replace': True},
+            ]})
+        for start in xrange(0, len(items), sdb_batch_size):
+            batch = items[start:start + sdb_batch_size]
+            self.sdb.batch_put_attributes(
+                DomainName=simple_db_domain, Items=batch)
+            logger.info("Created SimpleDB items {}".format(
+                ', '.join(item['Name'] for item in batch)))
         return
 
     def updateImageCount(self, team, channel, duration, duration_unit, simple_db_domain='awaybot'):
@@ -16,12 +16,86 @@
 import matplotlib.pyplot as plt
 import wordcloud as wc
 import random
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from PIL import Image, ImageDraw, ImageFont
 
 
 
+class PNGCache(object):
+    """Directory of rendered wordclouds named after their content hash (see `Wordcloud.content_hash`)
+
+    Attributes
+    ----------
+    folder : str
+        Directory where the png images are stored
+    max_files : int
+        Maximum number of images kept by `prune`
+    """
+
+    def __init__(self, folder, max_files=5000):
+        """
+        Parameters
+        ----------
+        folder : str
+            Directory where the png images are stored (created if missing)
+        max_files : int, optional
+            Maximum number of images kept by `prune`
+        """
+        self.folder = folder
+        self.max_files = max_files
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.png')
+
+    def get(self, key):
+        """Returns the bytes of the png image of the hash `key` (None if it was never stored)
+
+        A hit refreshes the modification time of the image, so `prune` removes the least recently used images
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+        except IOError:
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Pruned by a concurrent runner in the meantime
+            pass
+        return png
+
+    def put(self, key, png):
+        """Stores the bytes of the png image of the hash `key`
+
+        The image is written to a temporary file and renamed, so concurrent runners never read a partial image
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.rename(tmp_path, self.path(key))
+
+    def prune(self):
+        """Removes the least recently used images beyond `max_files`
+        """
+        paths = [ os.path.join(self.folder, name) for name in os.listdir(self.folder) if name.endswith('.png') ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.max_files:]:
+            os.remove(path)
+
+
 class Wordcloud(object):
     """Collection of most significant words in a topic with size proporational to significance
 
+    The top terms are obtained on instantiation, the wordclouds are only laid out when an image is needed
+    (so that a cached image of the same content can be reused, see `to_png`). The layout and the coloring
+    are seeded, the same content always renders the same image.
+
     Attributes
     ----------
     document : list[tuples(int,int)]
@@ -32,9 +106,15 @@ class Wordcloud(object):
         `wordcloud` object from the package `word_cloud<https://github.com/amueller/word_cloud>`_
     max_words : int
         Maximum number of words to be shown on the wordcloud
+    word_score : list[tuple(str, float)]
+        Top terms (and their scores) of the wordcloud
+    uni_word_score : list[tuple(str, float)]
+        Top unigrams (and their scores) of the secondary wordcloud (if `multi_plot`)
+    seed : int
+        Seed of the layout and the coloring of the wordclouds
     """
 
-    def __init__(self, model, document_id, max_words=10, background='#FFFFFF',font=None, multi_plot=False):
+    def __init__(self, model, document_id, max_words=10, background='#FFFFFF',font=None, multi_plot=False, seed=0):
         """Summary
 
         Parameters
@@ -51,69 +131,99 @@ class Wordcloud(object):
             Path to the font specification
         multi_plot : bool, optional
             Whether to create side by side plots with the unigram wordcloud as well
+        seed : int, optional
+            Seed of the layout and the coloring of the wordclouds
         """
         self.model = model
         self.document_id = document_id
         self.max_words = max_words
         self.multi_plot = multi_plot
+        self.background = background
+        self.font = font
+        self.seed = seed
+        self.rendered = False
 
         # initialize the word cloud depending on whether a font path exists
         if font is not None:
-            self.wcloud = wc.WordCloud(font_path=font, background_color=background)
+            self.wcloud = wc.WordCloud(font_path=font, background_color=background, random_state=seed)
 
         else:
-            self.wcloud = wc.WordCloud(background_color=background)
+            self.wcloud = wc.WordCloud(background_color=background, random_state=seed)
 
-        # generate the word cloud
-        self.generate_wordcloud()
+        # obtain the top terms of the word cloud
+        try:
+            max_words = self.max_words[0]
+        except:
+            max_words = self.max_words
+        self.word_score = self.model.get_top_terms(self.document_id, top=max_words)
 
         # If multi_plot add a secondary unigram wordcloud
         if multi_plot:
             if font is not None:
-                self.uni_wcloud = wc.WordCloud(font_path=font, background_color=background)
+                self.uni_wcloud = wc.WordCloud(font_path=font, background_color=background, random_state=seed)
 
             else:
-                self.uni_wcloud = wc.WordCloud(background_color=background)
+                self.uni_wcloud = wc.WordCloud(background_color=background, random_state=seed)
 
-            self.generate_uni_wordcloud()
+            try:
+                max_words = self.max_words[1]
+            except:
+                max_words = self.max_words
+            self.uni_word_score = self.model.get_top_terms(self.document_id, top=max_words, unigram=True)
 
+    def render(self):
+        """Lays out the wordcloud(s), only the first time it is called
+        """
+        if not self.rendered:
+            self.generate_wordcloud()
+            if self.multi_plot:
+                self.generate_uni_wordcloud()
+            self.rendered = True
 
     def generate_wordcloud(self):
-        """Generates the wordcloud internally by obtaining the tokens from the model (on instantiation)
+        """Generates the wordcloud internally out of the top terms of the model
         """
-        try:
-            max_words = self.max_words[0]
-        except:
-            max_words = self.max_words
-
-        word_score = self.model.get_top_terms(self.document_id, top=max_words)
-        # word_score = [ (t, val) for t, val in zip(data.term, data.score) ]
-        self.cloud_img = self.wcloud.generate_from_frequencies( word_score )
-        self.wcloud.recolor(color_func=self.slack_colorize)
+        self.cloud_img = self.wcloud.generate_from_frequencies( self.word_score )
+        self.wcloud.recolor(color_func=self.slack_colorize, random_state=self.seed)
 
     def generate_uni_wordcloud(self):
-        """Generates the second wordcloud internally by obtaining the tokens from the model (on instantiation)
+        """Generates the second wordcloud internally out of the top unigrams of the model
         """
-        try:
-            max_words = self.max_words[1]
-        except:
-            max_words = self.max_words
+        self.uni_cloud_img = self.uni_wcloud.generate_from_frequencies( self.uni_word_score )
+        self.uni_wcloud.recolor(color_func=self.slack_colorize, random_state=self.seed)
+
+    def content_hash(self, title=None):
+        """Hash of everything that determines the rendered image
 
-        word_score = self.model.get_top_terms(self.document_id, top=max_words, unigram=True)
-        # word_score = [ (t, val) for t, val in zip(data.term, data.score) ]
-        self.uni_cloud_img = self.uni_wcloud.generate_from_frequencies( word_score )
-        self.uni_wcloud.recolor(color_func=self.slack_colorize)
+        Parameters
+        ----------
+        title : str, optional
+            Title of the wordcloud (optional)
+
+        Returns
+        -------
+        str
+            Hexadecimal SHA-1 of the top terms and scores (rounded), font, size, background, seed and title
+        """
+        word_scores = [ self.word_score ] + ([ self.uni_word_score ] if self.multi_plot else [])
+        content = (
+            [ [ (term, round(score, 6)) for term, score in scores ] for scores in word_scores ],
+            self.font, self.wcloud.width, self.wcloud.height, self.background, self.seed, title
+        )
+        return hashlib.sha1(repr(content)).hexdigest()
 
     @staticmethod
     def slack_colorize(word, font_size, position, orientation, random_state=None, **kwargs):
         """Recolorizes the word cloud based on slack colors (used for slackifying the wordcloud)
+
+        The color is drawn from `random_state` (the seeded generator supplied by `WordCloud.recolor`)
         """
 
         # slack colors
         slack_colors = ["#361137","#DE1D64","#24927D","#72CADB","#E7A733"]
 
         # generate a random number between 0 and 4 (inclusive)
-        rand_int = random.randint(0,len(slack_colors)-1)
+        rand_int = (random_state or random).randint(0,len(slack_colors)-1)
 
         return slack_colors[rand_int]
 
@@ -126,6 +236,8 @@ class Wordcloud(object):
         title : str, optional
             Title of the wordcloud (optional)
         """
+        self.render()
+
         # Create figure
         num_plots = 2 if self.multi_plot else 1
 
@@ -149,38 +261,85 @@ class Wordcloud(object):
         plt.subplots_adjust(left=0.02, right=.98, top=.9, bottom=0.1)
         plt.show()
 
-    def save_png(self, filepath, title=None):
-        """Saves the wordcloud as a png image to the specified filepath
+    def to_image(self, title=None, title_height=30):
+        """Composes the wordcloud(s) and the title in a single image (without a matplotlib figure)
 
         Parameters
         ----------
-        filepath : str
-            Path to the file where the wordcloud will be stored to
         title : str, optional
             Title of the wordcloud (optional)
+        title_height : int, optional
+            Height in pixels of the band above the wordclouds where the title is drawn
+
+        Returns
+        -------
+        PIL.Image.Image
+            The wordcloud image, the unigram wordcloud is placed on the left if `multi_plot`
         """
-        # Create figure
-        num_plots = 2 if self.multi_plot else 1
+        self.render()
+        clouds = [self.uni_wcloud, self.wcloud] if self.multi_plot else [self.wcloud]
+        images = [ cloud.to_image() for cloud in clouds ]
+
+        top = title_height if title is not None else 0
+        width = sum( image.size[0] for image in images )
+        height = max( image.size[1] for image in images ) + top
+        canvas = Image.new('RGB', (width, height), self.background)
+
+        left = 0
+        for image in images:
+            canvas.paste(image, (left, top))
+            left += image.size[0]
+
+        if title is not None:
+            draw = ImageDraw.Draw(canvas)
+            if self.font is not None:
+                font = ImageFont.truetype(self.font, int(title_height * .6))
+            else:
+                font = ImageFont.load_default()
+            text_width, text_height = draw.textsize(title, font=font)
+            draw.text(((width - text_width) // 2, (title_height - text_height) // 2),
+                      title, fill='#000000', font=font)
 
-        fig, ax = plt.subplots(1, num_plots, figsize=(2.7 * num_plots, 2))
+        return canvas
 
-        if num_plots == 1:
-            ax.imshow( self.wcloud.to_array() )
-            if title is not None:
-                plt.title(title, fontsize=10, fontweight='bold')
-            plt.axis('off')
+    def to_png(self, title=None, cache=None):
+        """Renders the wordcloud as an in-memory png image
 
-        else:
-            ax[0].imshow( self.uni_wcloud.to_array() )
-            ax[0].axis('off')  # remove axes
-            ax[1].imshow( self.wcloud.to_array() )
-            ax[1].axis('off')  # remove axes
+        Parameters
+        ----------
+        title : str, optional
+            Title of the wordcloud (optional)
+        cache : PNGCache, optional
+            Cache of rendered images, the image is only rendered if no image with the same `content_hash` is cached
 
-            if title is not None:
-                plt.suptitle(title, fontsize=10, fontweight='bold')
+        Returns
+        -------
+        str
+            The bytes of the png image
+        """
+        if cache is not None:
+            key = self.content_hash(title=title)
+            png = cache.get(key)
+            if png is not None:
+                return png
 
-        plt.subplots_adjust(left=0.02, right=.98, top=.9, bottom=0.1)
+        png = BytesIO()
+        self.to_image(title=title).save(png, format='PNG')
+        png = png.getvalue()
+
+        if cache is not None:
+            cache.put(key, png)
+        return png
 
-        # Save to path
-        plt.savefig(filepath)
-        plt.close()
+    def save_png(self, filepath, title=None):
+        """Saves the wordcloud as a png image to the specified filepath
+
+        Parameters
+        ----------
+        filepath : str
+            Path to the file where the wordcloud will be stored to
+        title : str, optional
+            Title of the wordcloud (optional)
+        """
+        with open(filepath, 'wb') as f:
+            f.write(self.to_png(title=title))
@@ -31,7 +31,17 @@ import boto3
 import sys
 import uuid
 import datetime
+import decimal
 import json
+import select
+import threading
+from itertools import izip
+from multiprocessing.pool import ThreadPool
+
+# For our internal toolbox imports
+path_to_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(path_to_here, '..', 'Avro'))
+from avroSerializer import AvroCodec
 
 logger = logging.getLogger('awaybot_producer_logger')
 logger.setLevel(logging.DEBUG)
@@ -56,6 +66,183 @@ logger.addHandler(ch)
 logger.addHandler(fh)
 
 
+class TimestampCheckpoint:
+
+    """A class that coalesces the latest-timestamp updates of each team
+    and flushes them to SimpleDB.
+
+    Only the timestamps of messages acknowledged by kafka are recorded,
+    the maximum timestamp of each team is kept in memory and written to
+    SimpleDB every `flush_count` messages or `flush_interval` seconds
+    (and on shutdown), instead of on every message.
+
+    Messages that kafka failed to deliver are kept and resent on every
+    flush. Until they are acknowledged the timestamp written for their
+    team stays just below the oldest of them, so that they are fetched
+    again from the slack history if the producer restarts.
+    """
+
+    def __init__(self, producer, domain='awaybot',
+                 flush_interval=30, flush_count=500):
+        """
+        Constructor for TimestampCheckpoint class
+
+        Paramaters:
+        -----------
+        producer: AwaybotProducer
+            Producer whose kafka messages and SimpleDB client are used
+        domain: str
+            The name of the domain stored in simpleDB
+            Default: 'awaybot'
+        flush_interval: int or float
+            Maximum amount of seconds between flushes
+            Default: 30
+        flush_count: int
+            Maximum amount of messages sent between flushes
+            Default: 500
+        """
+        self.producer = producer
+        self.domain = domain
+        self.flush_interval = flush_interval
+        self.flush_count = flush_count
+        self.pending = {}
+        self.failed = {}
+        self.count = 0
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+
+
+    def acknowledge(self, team_name, ts, record_metadata=None):
+        """
+        Callback of the kafka send futures, records the timestamp of an
+        acknowledged message if it is the latest of the team.
+
+        Parameters:
+        -----------
+        team_name: str
+            The name of the slack team of the message
+        ts: str
+            The timestamp value of the message
+        record_metadata: RecordMetadata
+            Metadata of the acknowledged kafka record (unused)
+
+        Returns:
+            None
+        """
+        with self.lock:
+            failed = self.failed.get(team_name, {})
+            if ts in failed:
+                del failed[ts]
+                if not failed:
+                    del self.failed[team_name]
+            if (team_name not in self.pending
+                    or float(ts) > float(self.pending[team_name])):
+                self.pending[team_name] = ts
+        return
+
+
+    def fail(self, message_topic, message_value):
+        """
+        Function that records a message kafka failed to deliver, to be
+        resent on the next flush.
+
+        Parameters:
+        -----------
+        message_topic: str
+            The name of the topic the message belongs to
+        message_value: dict
+            The failed message, with its 'team' and 'ts'
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.failed.setdefault(message_value['team'], {})[
+                message_value['ts']] = (message_topic, message_value)
+        return
+
+
+    @staticmethod
+    def previousTimestamp(ts):
+        """
+        Function that returns the timestamp right before the supplied
+        one (slack timestamps have microsecond precision).
+
+        Parameters:
+        -----------
+        ts: str
+            Unix timestamp as string
+
+        Returns:
+        ---------
+        timestamp: str
+            Unix timestamp as string, one microsecond before `ts`
+        """
+        return str(decimal.Decimal(ts) - decimal.Decimal('0.000001'))
+
+
+    def sent(self):
+        """
+        Function that counts a sent message and flushes if either the
+        count or the time interval has been reached.
+
+        Parameters:
+            None
+        Returns:
+            None
+        """
+        self.count += 1
+        if (self.count >= self.flush_count
+                or time.time() - self.last_flush >= self.flush_interval):
+            self.flush()
+        return
+
+
+    def flush(self):
+        """
+        Function that waits until kafka has acknowledged every sent
+        message, resends the failed ones and writes the latest timestamp
+        of each team to SimpleDB (capped below its oldest failed message).
+
+        Parameters:
+            None
+        Returns:
+            None
+        """
+        self.count = 0
+        if self.producer.kafka_status:
+            self.producer.flushMessages()
+
+            # every send has settled, resend the failed messages
+            with self.lock:
+                retries = [message for failed in self.failed.itervalues()
+                           for message in failed.itervalues()]
+            if retries:
+                logger.info('Resending {} failed messages'.format(
+                    len(retries)))
+                for message_topic, message_value in retries:
+                    self.producer.sendMessage(message_topic, message_value)
+                self.producer.flushMessages()
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            for team_name, failed in self.failed.iteritems():
+                oldest = min(failed, key=float)
+                if (team_name in pending
+                        and float(pending[team_name]) >= float(oldest)):
+                    # keep the acknowledged timestamp for a later flush
+                    self.pending[team_name] = pending[team_name]
+                    pending[team_name] = self.previousTimestamp(oldest)
+        for team_name, ts in pending.iteritems():
+            try:
+                self.producer.updateLatestTimestamp(self.domain, team_name, ts)
+            except:
+                logger.error('Failed to update timestamp for {}'.format(
+                    team_name), exc_info=True)
+        self.last_flush = time.time()
+        return
+
+
 class AwaybotProducer:
 
     """A class for producing messages from the Slack RTM api to
@@ -71,7 +258,10 @@ class AwaybotProducer:
     7. Produce messages from the RTM api to kafka.
     """
 
-    def __init__(self, token=None, kafka_ip=None):
+    def __init__(self, token=None, kafka_ip=None,
+                 checkpoint_interval=30, checkpoint_count=500,
+                 linger_ms=20, batch_size=65536, compression_type='gzip',
+                 max_in_flight=10000, flush_timeout=60):
         """
         Constructor for AwaybotProducer class
 
@@ -82,6 +272,27 @@ class AwaybotProducer:
         kafka_ip: str, list
             String representing host:port of the kafka server(s). 
             If a list is supplied, format is ['h:p', 'h:p', ...]
+        checkpoint_interval: int or float
+            Maximum amount of seconds between latest-timestamp updates
+            Default: 30
+        checkpoint_count: int
+            Maximum amount of messages between latest-timestamp updates
+            Default: 500
+        linger_ms: int
+            Milliseconds the kafka producer waits to fill a batch
+            Default: 20
+        batch_size: int
+            Maximum size in bytes of a kafka batch per partition
+            Default: 65536
+        compression_type: str or None
+            Compression of the kafka batches ('gzip', 'snappy', 'lz4')
+            Default: 'gzip'
+        max_in_flight: int
+            Maximum amount of unacknowledged messages before flushing
+            Default: 10000
+        flush_timeout: int or float
+            Maximum amount of seconds to wait on a flush
+            Default: 60
         """
 
         self.token = token
@@ -90,6 +301,22 @@ class AwaybotProducer:
         self.slack_status = False
         self.kafka_status = False
         self.sdb_status = False
+        self.linger_ms = linger_ms
+        self.batch_size = batch_size
+        self.compression_type = compression_type
+        self.max_in_flight = max_in_flight
+        self.flush_timeout = flush_timeout
+        self.in_flight = 0
+        self.acked = 0
+        self.failed = 0
+        self.send_lock = threading.Lock()
+        self.codec = AvroCodec()
+        self.ingest_count = 0
+        self.ingest_latency = 0.0
+        self.ingest_latency_max = 0.0
+        self.checkpoint = TimestampCheckpoint(
+            self, flush_interval=checkpoint_interval,
+            flush_count=checkpoint_count)
 
     
     def getTokenFromFile(self, auth_file):
@@ -162,7 +389,7 @@ class AwaybotProducer:
             List with each channel represnted as a string.
         """
         if not self.slack_status:
-            self.slackConnect(self.token)
+            self.slackConnect()
         channel_list = [
             {channel_dict['id']:channel_dict['name']}  for channel_dict in 
             self.sc.api_call("channels.list")['channels']]
@@ -314,12 +541,84 @@ class AwaybotProducer:
             return
 
     
+    def fetchChannelHistory(self, channel_id, timestamp='0', count=1000,
+                            max_retries=5, backoff=1):
+        """
+        Function that fetches the whole history of a channel after a
+        timestamp, following the pagination of channels.history and
+        backing off exponentially when the api rate limits the requests.
+        Any other api error (eg. channel_not_found, not_in_channel)
+        stops the fetch of the channel.
+
+        Parameters:
+        -----------
+        channel_id: str
+            The id of the channel
+        timestamp: str
+            The unix timestamp (as string) after which we will retrieve
+            messages.
+            Default: '0'
+        count: int
+            Amount of messages fetched per page
+            Default: 1000
+        max_retries: int
+            Maximum amount of consecutive retries of a rate limited page
+            Default: 5
+        backoff: int or float
+            Seconds to wait on the first retry, doubled on each retry
+            Default: 1
+
+        Returns:
+        --------
+        list
+            The messages of the channel in timestamp order
+        """
+        messages = []
+        latest = None
+        retries = 0
+        while True:
+            kwargs = dict(channel=channel_id, oldest=timestamp, count=count)
+            if latest is not None:
+                kwargs['latest'] = latest
+            channel_history = self.sc.api_call("channels.history", **kwargs)
+            if not channel_history.get('ok', True):
+                error = channel_history.get('error')
+                if error != 'ratelimited' or retries >= max_retries:
+                    logger.error(
+                        'Giving up fetching history of channel {}: {}'.format(
+                            channel_id, error))
+                    break
+                # slackclient only returns the body of the response, so
+                # the Retry-After header is not available
+                wait = backoff * 2 ** retries
+                logger.warning(
+                    'Rate limited fetching history of channel {}, retrying '
+                    'in {} seconds'.format(channel_id, wait))
+                time.sleep(wait)
+                retries += 1
+                continue
+
+            retries = 0
+            page = channel_history.get('messages', [])
+            messages.extend(page)
+            if not (channel_history.get('has_more') and page):
+                break
+            # pages are returned newest first, continue before the oldest
+            latest = min(page, key=lambda m: float(m['ts']))['ts']
+
+        messages.sort(key=lambda m: float(m['ts']))
+        return messages
+
+
     def fetchSlackHistory(self, team_name, archive_url,
-        channel_list, timestamp = '0'):
+        channel_list, timestamp = '0', processes=4):
         """
         Generator function that fetches messages from the
         slack api using the channel.history method for each channel
         and yields each message.
+        The channels are fetched concurrently by a pool of `processes`
+        threads, the messages of each channel are yielded in timestamp
+        order.
         NOTES: 
         1. This method only fetches the text of messages and
         not reactions.
@@ -339,6 +638,9 @@ class AwaybotProducer:
             The unix timestamp (as string) after which we will retrieve
             messages. 
             Default: '0'
+        processes: int
+            Amount of channels fetched concurrently
+            Default: 4
 
         Yields:
         message_dict: dict
@@ -352,22 +654,26 @@ class AwaybotProducer:
                 message_url: URL to the archived version of the message
         """
         if not self.slack_status:
-            self.slackConnect(self.token)
-        for channel in channel_list:
-            channel_history = self.sc.api_call(
-                "channels.history", channel=channel.keys()[0],
-                oldest = timestamp, count="1000")
-            for message_dict in channel_history['messages']:
-                if (
-                    sorted(['user', 'text', 'type', 'ts'])
-                        == sorted(message_dict.keys())):
-                    message_dict['channel'] = channel.values()[0]
-                    message_dict['team'] = team_name
-                    message_dict['message_url'] = '{}{}/p{}'.format(
-                        archive_url, message_dict['channel'],
-                        message_dict['ts'].replace('.', ''))
-                    message_dict['uuid'] = str(uuid.uuid1())
-                    yield message_dict
+            self.slackConnect()
+        message_keys = sorted(['user', 'text', 'type', 'ts'])
+        pool = ThreadPool(max(1, min(processes, len(channel_list))))
+        try:
+            histories = pool.imap(
+                lambda channel: self.fetchChannelHistory(
+                    channel.keys()[0], timestamp),
+                channel_list)
+            for channel, channel_history in izip(channel_list, histories):
+                for message_dict in channel_history:
+                    if message_keys == sorted(message_dict.keys()):
+                        message_dict['channel'] = channel.values()[0]
+                        message_dict['team'] = team_name
+                        message_dict['message_url'] = '{}{}/p{}'.format(
+                            archive_url, message_dict['channel'],
+                            message_dict['ts'].replace('.', ''))
+                        message_dict['uuid'] = str(uuid.uuid1())
+                        yield message_dict
+        finally:
+            pool.terminate()
 
     
     def connectKafkaProducer(self):
@@ -381,7 +687,12 @@ class AwaybotProducer:
             None
         """
         try:
-            self.kp = KafkaProducer(bootstrap_servers=self.kafka_ip)
+            self.kp = KafkaProducer(
+                bootstrap_servers=self.kafka_ip,
+                value_serializer=self.codec.encode,
+                linger_ms=self.linger_ms,
+                batch_size=self.batch_size,
+                compression_type=self.compression_type)
         except:
             logger.error(
                 'Could not connect to Kafka cluster. '
@@ -392,10 +703,73 @@ class AwaybotProducer:
         return
 
 
+    def onSendSuccess(self, record_metadata):
+        """
+        Callback of the kafka send futures for acknowledged messages.
+
+        Parameters:
+            record_metadata: RecordMetadata
+                Metadata of the acknowledged kafka record
+        Returns:
+            None
+        """
+        with self.send_lock:
+            self.in_flight -= 1
+            self.acked += 1
+        return
+
+
+    def onSendError(self, message_topic, message_value, exception):
+        """
+        Errback of the kafka send futures for failed messages. Slack
+        messages are recorded in the checkpoint to be resent.
+
+        Parameters:
+            message_topic: str
+                The name of the topic the message belongs to
+            message_value: dict
+                The message that failed to be delivered
+            exception: Exception
+                The exception raised by the kafka producer
+        Returns:
+            None
+        """
+        with self.send_lock:
+            self.in_flight -= 1
+            self.failed += 1
+        logger.error('Failed to deliver message of topic {}: {}'.format(
+            message_topic, exception))
+        if 'team' in message_value and 'ts' in message_value:
+            self.checkpoint.fail(message_topic, message_value)
+        return
+
+
+    def getSendStats(self):
+        """
+        Function that returns the delivery counters of the producer.
+
+        Parameters:
+            None
+        Returns:
+            dict
+                Amount of in flight, acknowledged and failed messages
+        """
+        with self.send_lock:
+            return {'in_flight': self.in_flight,
+                    'acked': self.acked,
+                    'failed': self.failed}
+
+
     def produceMessage(self, message_topic, message_value):
         """
         Function that sends a message to the remote kafka server.
-        Messages are serialized as json before sending.
+        Messages are serialized as avro by the kafka producer and sent
+        asynchronously in batches, events that do not fit the message
+        schema (eg. presence changes) are skipped; deliveries are tracked with callbacks
+        and the producer is flushed once `max_in_flight` messages are
+        pending. Once kafka acknowledges the message its timestamp is
+        recorded in the checkpoint, which is periodically flushed to
+        SimpleDB.
 
         Parameters:
             message_topic: str
@@ -408,40 +782,163 @@ class AwaybotProducer:
         """ 
         if not self.kafka_status:
             self.connectKafkaProducer()
+        if not self.codec.accepts(message_value):
+            logger.debug('Skipping event {}'.format(message_value))
+            return
 
-        if ('team' in message_value and 'ts' in message_value):
-            try:
-                self.updateLatestTimestamp(
-                    'awaybot', message_value['team'], 
-                    message_value['ts'])
-            except:
-                logger.error('Failed to update timestamp for {}'.format(
-                    message_value), exc_info=True)
+        self.sendMessage(message_topic, message_value)
+        self.checkpoint.sent()
+        return
+
+
+    def sendMessage(self, message_topic, message_value):
+        """
+        Function that hands a message to the kafka producer and tracks
+        its delivery (also used to resend failed messages).
+
+        Parameters:
+            message_topic: str
+                The name of the topic the message belongs to
+            message_value: dict
+                Dictionary that defines the message of it's metadata.
+
+        Returns:
+            None
+        """
         try:
-            self.kp.send(message_topic, json.dumps(message_value))
+            future = self.kp.send(message_topic, message_value)
         except:
+            with self.send_lock:
+                self.failed += 1
             logger.error(
                 'Failed to send message of topic:\n\t{}'
                 ' and value:\n\t{}'.format(message_topic, message_value),
                 exc_info=True)
+            if 'team' in message_value and 'ts' in message_value:
+                self.checkpoint.fail(message_topic, message_value)
+        else:
+            with self.send_lock:
+                self.in_flight += 1
+            future.add_callback(self.onSendSuccess)
+            future.add_errback(self.onSendError, message_topic, message_value)
+            if ('team' in message_value and 'ts' in message_value):
+                future.add_callback(
+                    self.checkpoint.acknowledge,
+                    message_value['team'], message_value['ts'])
+            if self.in_flight >= self.max_in_flight:
+                self.flushMessages()
         return
 
 
-    def openRtmConnection(self, team_name):
+    def flushMessages(self):
+        """
+        Function that blocks until every pending message is acknowledged
+        or failed, waiting at most `flush_timeout` seconds.
+
+        Parameters:
+            None
+        Returns:
+            None
+        """
+        try:
+            self.kp.flush(timeout=self.flush_timeout)
+        except:
+            logger.error('Kafka flush timed out with {} messages in '
+                         'flight'.format(self.in_flight), exc_info=True)
+        logger.info('Kafka delivery stats: {}'.format(self.getSendStats()))
+        return
+
+
+    def close(self):
+        """
+        Function that flushes the pending messages and timestamps and
+        closes the kafka producer.
+
+        Parameters:
+            None
+        Returns:
+            None
+        """
+        self.checkpoint.flush()
+        if self.kafka_status:
+            self.kp.close()
+            self.kafka_status = False
+        return
+
+
+    def recordIngestLatency(self, message, received):
+        """
+        Function that records the time elapsed between a message being
+        sent on slack and it being read from the RTM API.
+
+        Parameters:
+        -----------
+        message: dict
+            The RTM event
+        received: float
+            The unix timestamp when the event was read
+
+        Returns:
+        --------
+        None
+        """
+        try:
+            latency = received - float(message['ts'])
+        except (KeyError, TypeError, ValueError):
+            return
+        self.ingest_count += 1
+        self.ingest_latency += latency
+        self.ingest_latency_max = max(self.ingest_latency_max, latency)
+        logger.debug('Ingest latency of {}: {:.3f}s'.format(
+            message['ts'], latency))
+        return
+
+
+    def getIngestLatency(self):
+        """
+        Function that returns the ingest latency statistics of the
+        RTM connection.
+
+        Parameters:
+        -----------
+        None
+
+        Returns:
+        --------
+        dict
+            Amount of events, mean and maximum latency in seconds
+        """
+        return {
+            'count': self.ingest_count,
+            'mean': self.ingest_latency / max(self.ingest_count, 1),
+            'max': self.ingest_latency_max}
+
+
+    def openRtmConnection(self, team_name, ping_interval=30,
+                          max_backoff=300):
         """
         Generator function that fetches messages from the
         slack RTM API. 
 
-        TODO:
-        -------
-        If there is an error, returns None.
-        This is done to give the RTM a chance to reconnect.
-        I'm not sure this is the right way to do this, as it
-        doesn't always seem to resolve websocket closing.
+        The websocket is waited on with select, so events are read as
+        soon as they arrive. rtm_read returns a single frame per call, so
+        once the socket is readable it is read until no event is left,
+        and select is skipped while the ssl layer holds buffered data
+        (which does not make the socket readable). When the connection
+        is idle for `ping_interval` seconds a ping is sent and the
+        pending timestamp checkpoint is flushed. On errors the connection is reopened with
+        an exponential backoff bounded by `max_backoff` seconds.
 
         Parameters:
         ----------
-        None
+        team_name: str
+            The name of the slack team the messages belong to
+        ping_interval: int or float
+            Seconds without events before pinging the RTM API
+            Default: 30
+        max_backoff: int or float
+            Maximum amount of seconds to wait before reconnecting
+            Default: 300
 
         Yields:
         ---------
@@ -454,30 +951,57 @@ class AwaybotProducer:
                 channel: The channel the message was senf from
         """
         if not self.slack_status:
-            self.slackConnect(self.token)
-        if self.sc.rtm_connect():
-            logger.info('Connected to Slack RTM API!')
-            while True:
-                time.sleep(5)
-                try:
-                    message_dict = self.sc.rtm_read()
-                except Exception as e:
-                    logger.info(
-                        'Failed to fetch latest message.', exc_info=True)
-                    time.sleep(500)
-                    return
-                else:
-                    if message_dict:
-                        for message in message_dict:
-                            if message:
-                                message['uuid'] = str(uuid.uuid1())
-                                message['team'] = team_name
-                                yield message
-        else:
+            self.slackConnect()
+        if not self.sc.rtm_connect():
             raise ValueError(
                 "Could not connect to Slack RTM API. "
                 "Check that token is valid and you have "
                 "permission to access RTM API.")
+        logger.info('Connected to Slack RTM API!')
+
+        failures = 0
+        draining = False
+        while True:
+            try:
+                sock = self.sc.server.websocket.sock
+                pending = getattr(sock, 'pending', None)
+                if not (draining or (pending is not None and pending())):
+                    readable, _, _ = select.select(
+                        [sock], [], [], ping_interval)
+                    if not readable:
+                        self.sc.server.ping()
+                        if self.checkpoint.pending:
+                            self.checkpoint.flush()
+                        continue
+                message_dict = self.sc.rtm_read()
+            except Exception:
+                draining = False
+                failures += 1
+                wait = min(max_backoff, 2 ** failures)
+                logger.warning(
+                    'Failed to fetch latest message, reconnecting in {} '
+                    'seconds.'.format(wait), exc_info=True)
+                time.sleep(wait)
+                try:
+                    if self.sc.rtm_connect():
+                        logger.info(
+                            'Reconnected to Slack RTM API after {} '
+                            'failure(s)'.format(failures))
+                except Exception:
+                    logger.error(
+                        'Failed to reconnect to Slack RTM API.', exc_info=True)
+                continue
+
+            failures = 0
+            # keep reading until the buffered frames are consumed
+            draining = bool(message_dict)
+            received = time.time()
+            for message in message_dict:
+                if message:
+                    self.recordIngestLatency(message, received)
+                    message['uuid'] = str(uuid.uuid1())
+                    message['team'] = team_name
+                    yield message
 
 
 if __name__ == "__main__":
@@ -508,6 +1032,7 @@ if __name__ == "__main__":
     for msg in history:
         logger.info(msg)
         ap.produceMessage("test_topic", msg)
+    ap.checkpoint.flush()
 
 
     message_keys = sorted(
@@ -517,23 +1042,26 @@ if __name__ == "__main__":
                     u'channel', u'uuid'
                 ])
     c = 0
-    while True:
-        if c:
-            logger.info('Reconnected to RTM API {} time(s)'.format(c))
-        real_time_messages = ap.openRtmConnection(team_name=team_id)
-        for msg in real_time_messages:
-            if 'channel' in msg:
-                if not msg['channel'] in channel_dict:
-                    continue
-                msg['channel'] = channel_dict[msg['channel']]
-
-            if sorted(msg.keys()) == message_keys:
-                msg['message_url'] = '{}{}/p{}'.format(
-                    team_archive_url, msg['channel'],
-                    msg['ts'].replace('.', ''))
-
-            logger.info(msg)
-            ap.produceMessage("test_topic", msg)
-        c += 1
+    try:
+        while True:
+            if c:
+                logger.info('Reconnected to RTM API {} time(s)'.format(c))
+            real_time_messages = ap.openRtmConnection(team_name=team_id)
+            for msg in real_time_messages:
+                if 'channel' in msg:
+                    if not msg['channel'] in channel_dict:
+                        continue
+                    msg['channel'] = channel_dict[msg['channel']]
+
+                if sorted(msg.keys()) == message_keys:
+                    msg['message_url'] = '{}{}/p{}'.format(
+                        team_archive_url, msg['channel'],
+                        msg['ts'].replace('.', ''))
+
+                logger.info(msg)
+                ap.produceMessage("test_topic", msg)
+            c += 1
+    finally:
+        ap.close()
 
 
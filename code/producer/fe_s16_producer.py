@@ -61,3 +61,5 @@ c = 0
 for msg in history:
     logger.info(msg)
     ap.produceMessage("fe_s16_topic", msg)
+
+ap.close()
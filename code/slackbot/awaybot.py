@@ -26,7 +26,10 @@
 
 
 import os
+import sys
+import json
 import time
+from collections import OrderedDict
 from slackclient import SlackClient
 import boto3
 import logging
@@ -55,6 +58,66 @@ fh.suffix = '%Y-%m-%d_%H-%M-%S.log'
 logger.addHandler(ch)
 logger.addHandler(fh)
 
+# maximum number of attachments slack accepts in a single message
+MAX_ATTACHMENTS = 100
+
+
+class SummaryCache:
+    """
+    A TTL/LRU cache for the summaries fetched from SimpleDB
+    """
+    def __init__(self, ttl=300, max_size=256):
+        """
+        Constructor for SummaryCache class
+
+        Parameters
+        ----------
+        ttl : int or float
+            Seconds a summary is served from the cache
+        max_size : int
+            Maximum number of summaries kept, the least recently used
+            ones are evicted first
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns the cached summary for the key, or None if it is
+        missing or expired
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            self.misses += 1
+            return None
+        # reinsert to mark it as the most recently used
+        self.entries[key] = entry
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, summary):
+        """
+        Caches the summary for the key
+        """
+        self.entries.pop(key, None)
+        self.entries[key] = (time.time(), summary)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Drops the summary for the key, or every summary if no key is
+        given (eg. once the runner has published new results)
+        """
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+
 class Slackbot:
     """
     A class for our slackbot
@@ -63,7 +126,9 @@ class Slackbot:
                  slack_client,
                  bot_name,
                  command,
-                 domain):
+                 domain,
+                 cache_ttl=300,
+                 cache_size=256):
         """
         Constructor for Slackbot class
         
@@ -75,6 +140,12 @@ class Slackbot:
             The name (not ID) of the slackbot for the relevant slack team
         command : str
             The command to invoke the slackbot
+        domain : str
+            The SimpleDB domain the runner publishes the summaries to
+        cache_ttl : int or float
+            Seconds a summary is served from the cache
+        cache_size : int
+            Maximum number of summaries kept in the cache
         """
         try:
             logger.info("""Initializing bot with parameters:
@@ -86,6 +157,7 @@ class Slackbot:
             self.bot_name = bot_name
             self.sdb_status = False
             self.sdb_domain = domain
+            self.summary_cache = SummaryCache(cache_ttl, cache_size)
             api_call = self.slack_client.api_call("users.list")
             if api_call.get('ok'):
                 # retrieve all users so we can find our bot
@@ -128,6 +200,55 @@ class Slackbot:
             self.sdb_status = True
         return
 
+    def fetch_summary(self, sdbItem):
+        """
+        Fetches the number of topics and the topic items of a summary
+        with a single (paginated) SimpleDB select, going through the
+        summary cache.
+
+        Parameters
+        ----------
+        sdbItem : str
+            The summary item, of the form [team]_[channel]_[duration]_[time unit]
+
+        Returns
+        -------
+        tuple(int, list[dict]) or None
+            The number of topics and the attributes (archiveURL, modelURL)
+            of each topic in order, None if the summary does not exist
+        """
+        if not self.sdb_status:
+            self.simpledbConnect()
+        summary = self.summary_cache.get(sdbItem)
+        if summary is not None:
+            return summary
+
+        query = "select * from `{}` where itemName() like '{}%'".format(
+            self.sdb_domain, sdbItem.replace("'", "''"))
+        items = {}
+        kwargs = {}
+        while True:
+            response = self.sdb.select(
+                SelectExpression=query, ConsistentRead=True, **kwargs)
+            for item in response.get('Items', []):
+                items[item['Name']] = dict(
+                    (i['Name'], i['Value']) for i in item['Attributes'])
+            if 'NextToken' not in response:
+                break
+            kwargs['NextToken'] = response['NextToken']
+
+        if 'numMessages' not in items.get(sdbItem, {}):
+            return None
+        num_topics = int(items[sdbItem]['numMessages'])
+        topics = [items.get('{}_{}'.format(sdbItem, topic))
+                  for topic in xrange(1, num_topics + 1)]
+        summary = (num_topics, topics)
+        # the runner writes the topic count last, only cache summaries
+        # whose topics have all been published
+        if all(topics):
+            self.summary_cache.put(sdbItem, summary)
+        return summary
+
     def handle_command(self, team, command):
         """
         Receives commands directed at the bot and determines if they
@@ -156,19 +277,18 @@ class Slackbot:
             command_duration_units = split_command[3]
             channel_name = command_channel.split('|')[-1][:-1]
             sdbItem = '{}_{}_{}_{}'.format(
-                team_name, channel_name,
+                team, channel_name,
                 command_duration, command_duration_units)
             try:
-                fetch_num_topics = self.sdb.get_attributes(
-                    DomainName=self.sdb_domain, ItemName=sdbItem, ConsistentRead=True)
+                summary = self.fetch_summary(sdbItem)
             except:
                 logger.error(
-                    'Failed to fetch number of topics for sdb Item {}'.format(sdbItem),
+                    'Failed to fetch summary for sdb Item {}'.format(sdbItem),
                     exc_info=True)
                 sys.exit(1)
 
             ## CASE ONE: VALID COMMAND BUT INVALID TIME RANGE
-            if fetch_num_topics.get('Attributes') is None:
+            if summary is None:
                 logger.info("Could not fetch number of topics from Simple DB for COMMAND '%s'" % (command))
                 response = ("""Not sure what you mean. Use the */summarize* command with the *channel name* and the *duration*. 
                     For example, if you want to see 3 weeks of history in the #general channel, type: */summarize #general 3 weeks*.
@@ -180,7 +300,7 @@ class Slackbot:
                                            text=response,
                                            as_user=True)
             else:
-                num_topics = fetch_num_topics['Attributes'][0]['Value']
+                num_topics, topics = summary
                 logger.info("""COMMAND %s has a valid format for processing:
                 command_channel : %s
                 command_duration : %s
@@ -200,41 +320,34 @@ class Slackbot:
                 else:
                     ## CASE THREE: VALID COMMAND AND WORDCLOUDS WERE GENERATED.
                     
-                    # Respond with the summary and how many topics
+                    # Respond with the summary and how many topics,
+                    # with an attachment linking to each topic
                     response = "Your summary for {} for {} {} ({} topics).".format(
                         command_channel, command_duration, command_duration_units, num_topics)
 
-                    self.slack_client.api_call("chat.postMessage",
-                                           channel=channel,
-                                           text=response,
-                                           as_user=True)
-
-
-                    # Respond for each topic
-                    for topic in xrange(1, int(num_topics) + 1, 1):
-                        sdbImageItem = '{}_{}_{}_{}_{}'.format(
-                            team_name, channel_name,
-                            command_duration, command_duration_units, topic)
-
-                        fetch_image = self.sdb.get_attributes(
-                            DomainName=self.sdb_domain, ItemName=sdbImageItem, ConsistentRead=True)
-                        topic_url = [i['Value'] for i in fetch_image['Attributes'] if i['Name'] == 'archiveURL'][0]
-                        topic_wordcloud = [i['Value'] for i in fetch_image['Attributes'] if i['Name'] == 'modelURL'][0]
-
-
-                        response = '<{}|Go To Topic {}>'.format(topic_url, topic)
-                        # set the attachment which is the duration with the url to the word cloud
-                        attachment = '[{"title": "Topic '+ str(topic) + '" , "image_url":"'+ topic_wordcloud +'"}]'
-
-                        # send the response with the image
+                    attachments = []
+                    for topic, topic_attributes in enumerate(topics, 1):
+                        if not topic_attributes:
+                            continue
+                        # set the attachment which is the topic with the url to the word cloud
+                        attachments.append({
+                            'fallback': 'Go To Topic {}'.format(topic),
+                            'title': 'Topic {}'.format(topic),
+                            'title_link': topic_attributes['archiveURL'],
+                            'image_url': topic_attributes['modelURL']})
+
+                    # send the response in as few messages as slack allows
+                    for start in xrange(0, max(len(attachments), 1), MAX_ATTACHMENTS):
+                        attachment = json.dumps(attachments[start:start + MAX_ATTACHMENTS])
                         logger.info("""Sending:
                         \tchannel : %s
                         \ttext : %s
-                        \timage_url : %s""" % (channel, response, attachment))
-                        self.slack_client.api_call("chat.postMessage", channel=channel, 
-                                              text=response, 
+                        \tattachments : %s""" % (channel, response, attachment))
+                        self.slack_client.api_call("chat.postMessage", channel=channel,
+                                              text=response,
                                               attachments=attachment,
                                               as_user=True)
+                        response = ''
 
         # otherwise post our response to help the user our
         else:
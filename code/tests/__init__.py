@@ -0,0 +1,7 @@
+"""Tests of the slack-pack services and nlp toolbox
+
+Run from the `code` folder with::
+
+    python -m unittest discover -s tests -t .
+
+"""
@@ -0,0 +1,96 @@
+"""Helpers shared by the tests
+
+The clients of the external services (slack, kafka, cassandra, aws) are always replaced with fakes in the tests, so the
+client libraries are only needed to import the modules under test: if one is not installed an empty placeholder module
+is registered in its place.
+"""
+
+import os
+import sys
+import types
+import atexit
+import shutil
+import logging
+import tempfile
+import importlib
+
+CODE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Client libraries and the names imported from them by the modules under test
+PLACEHOLDERS = {
+    'boto3': [],
+    'cassandra': ['ConsistencyLevel'],
+    'cassandra.cluster': ['Cluster'],
+    'cassandra.query': ['SimpleStatement', 'BatchStatement', 'BatchType'],
+    'kafka': ['KafkaClient', 'KafkaConsumer', 'KafkaProducer'],
+    'slackclient': ['SlackClient'],
+}
+
+
+class Placeholder(object):
+    """Stand-in for the classes of a missing client library (keeps the keyword arguments as attributes)"""
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.__dict__.update(kwargs)
+
+
+def placeholder_dependencies():
+    """Registers a placeholder module for each client library that is not installed"""
+    for name in sorted(PLACEHOLDERS):
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            module = types.ModuleType(name)
+            for attribute in PLACEHOLDERS[name]:
+                setattr(module, attribute, type(attribute, (Placeholder,), {}))
+            sys.modules[name] = module
+            if '.' in name:
+                parent, child = name.rsplit('.', 1)
+                setattr(sys.modules[parent], child, module)
+
+
+def _import(name, path, cwd):
+    placeholder_dependencies()
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    previous = os.getcwd()
+    os.chdir(cwd)
+    try:
+        return importlib.import_module(name)
+    finally:
+        os.chdir(previous)
+
+
+def import_nlp(name):
+    """Imports a module of the nlp toolbox (which locates the `code` folder from the working directory)"""
+    return _import(name, CODE_PATH, CODE_PATH)
+
+
+def import_service(folder, name):
+    """Imports a producer/consumer module, keeping the log files it opens on import in a temporary folder"""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    log_folder = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, log_folder, True)
+    os.mkdir(os.path.join(log_folder, 'log'))
+    module = _import(name, os.path.join(CODE_PATH, folder), log_folder)
+
+    # Only keep the log files
+    for handler in module.logger.handlers:
+        if not isinstance(handler, logging.FileHandler):
+            handler.setLevel(logging.CRITICAL)
+    return module
+
+
+def import_checkout(name):
+    """Imports a module of the nlp toolbox that locates its data folders from the `slack-pack` checkout in the working
+    directory (they point to an empty temporary checkout)"""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    checkout = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, checkout, True)
+    code_folder = os.path.join(checkout, 'slack-pack', 'code')
+    os.makedirs(code_folder)
+    return _import(name, CODE_PATH, code_folder)
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fakes import import_nlp
+
+cloud = import_nlp('nlp.viz.cloud')
+
+
+class PNGCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = cloud.PNGCache(self.folder, max_files=2)
+        # Stored one minute apart, oldest first
+        for order, key in enumerate(['c', 'b', 'a']):
+            self.cache.put(key, key * 4)
+            mtime = 1000000 + 60 * order
+            os.utime(self.cache.path(key), (mtime, mtime))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, True)
+
+    def stored(self):
+        return sorted( name[:-len('.png')] for name in os.listdir(self.folder) )
+
+    def test_get_returns_stored_image(self):
+        self.assertEqual(self.cache.get('a'), 'aaaa')
+        self.assertIsNone(self.cache.get('missing'))
+
+    def test_prune_removes_least_recently_stored(self):
+        self.cache.prune()
+        self.assertEqual(self.stored(), ['a', 'b'])
+
+    def test_prune_keeps_recently_read_images(self):
+        self.assertEqual(self.cache.get('c'), 'cccc')
+        self.cache.prune()
+        self.assertEqual(self.stored(), ['a', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import json
+import unittest
+
+from tests import fakes
+
+consumer = fakes.import_service('consumer', 'awaybot_consumer')
+
+
+class StopConsuming(Exception):
+    pass
+
+
+class FakeRecord(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeKafkaConsumer(object):
+    """KafkaConsumer of kafka-python 1.3.1: `poll` only takes `timeout_ms`"""
+    def __init__(self, log):
+        self.polls = []
+        self.log = log
+
+    def poll(self, timeout_ms=0):
+        if not self.polls:
+            raise StopConsuming()
+        return self.polls.pop(0)
+
+    def commit(self):
+        self.log.append('commit')
+
+
+class FakeCluster(object):
+    def __init__(self, session):
+        self.session = session
+
+    def connect(self, keyspace):
+        return self.session
+
+
+class FakeBatchStatement(object):
+    def __init__(self, batch_type=None):
+        self.statements = []
+
+    def add(self, statement, parameters):
+        self.statements.append(parameters)
+
+
+class FakeBatchType(object):
+    UNLOGGED = 'UNLOGGED'
+
+
+class FakeFuture(object):
+    def __init__(self, log, batch):
+        self.log = log
+        self.batch = batch
+
+    def result(self):
+        self.log.append(('ack', len(self.batch.statements)))
+
+
+class FakeSession(object):
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, query):
+        pass
+
+    def prepare(self, query):
+        return query
+
+    def execute_async(self, batch):
+        self.log.append(('write', len(batch.statements)))
+        return FakeFuture(self.log, batch)
+
+
+def message(i, channel='general'):
+    return {'text': u'message {}'.format(i), 'ts': u'{}.000100'.format(i), 'user': u'U1', 'team': u'T1',
+            'type': u'message', 'channel': channel, 'uuid': u'uuid-{}'.format(i),
+            'message_url': u'https://team.slack.com/archives/{}/p{}000100'.format(channel, i)}
+
+
+class AwaybotConsumerTest(unittest.TestCase):
+    def setUp(self):
+        self.log = []
+        self.kafka = FakeKafkaConsumer(self.log)
+        self.session = FakeSession(self.log)
+        self.patched = dict((name, getattr(consumer, name))
+                            for name in ('Cluster', 'KafkaConsumer', 'BatchStatement', 'BatchType'))
+        consumer.Cluster = lambda ips: FakeCluster(self.session)
+        consumer.KafkaConsumer = lambda topic, **kwargs: self.kafka
+        consumer.BatchStatement = FakeBatchStatement
+        consumer.BatchType = FakeBatchType
+
+        self.consumer = consumer.AwaybotConsumer('127.0.0.1:9092', 'topic', ['127.0.0.1'], 'keyspace',
+                                                 group_id='group')
+
+    def tearDown(self):
+        for name, value in self.patched.iteritems():
+            setattr(consumer, name, value)
+
+    def consume(self, polls, **kwargs):
+        self.kafka.polls = list(polls)
+        with self.assertRaises(StopConsuming):
+            self.consumer.consume('messages', **kwargs)
+
+    def records(self, messages):
+        return [ FakeRecord(self.consumer.codec.encode(m)) for m in messages ]
+
+    def test_poll_records_are_written_in_slices_then_committed(self):
+        polls = [ {'p0': self.records([ message(i) for i in range(5) ]),
+                   'p1': self.records([ message(i, 'random') for i in range(5, 7) ])},
+                  {} ]
+        self.consume(polls, batch_size=3)
+
+        writes = [ entry for entry in self.log if entry[0] == 'write' ]
+        self.assertEqual(sum(n for _, n in writes), 7)
+        self.assertEqual(self.log.count('commit'), 1)
+        self.assertEqual(self.log[-1], 'commit')
+        self.assertEqual(len([ entry for entry in self.log if entry[0] == 'ack' ]), len(writes))
+
+    def test_json_records_and_foreign_events_are_handled(self):
+        polls = [ {'p0': [ FakeRecord(json.dumps(message(1))), FakeRecord(json.dumps({'type': 'presence_change'})) ]} ]
+        self.consume(polls)
+        self.assertEqual(self.log, [ ('write', 1), ('ack', 1), 'commit' ])
+
+    def test_no_commit_without_group(self):
+        self.consumer.group_id = None
+        self.consume([ {'p0': self.records([ message(1) ])} ])
+        self.assertNotIn('commit', self.log)
+
+
+if __name__ == '__main__':
+    unittest.main()
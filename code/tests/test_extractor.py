@@ -0,0 +1,141 @@
+import time
+import unittest
+
+from tests import fakes
+
+extractor = fakes.import_nlp('nlp.text.extractor')
+
+
+class FakeRow(object):
+    def __init__(self, ts, text):
+        self.ts = ts
+        self.message_text = text
+        self.user = 'U1'
+        self.team = 'T1'
+        self.message_url = 'https://team.slack.com/archives/general/p{}'.format(ts.replace('.', ''))
+
+
+class FakeBoundStatement(object):
+    def __init__(self, prepared, values):
+        self.prepared = prepared
+        self.values = values
+        self.fetch_size = None
+
+
+class FakePreparedStatement(object):
+    def __init__(self, query):
+        self.query = query
+
+    def bind(self, values):
+        return FakeBoundStatement(self, values)
+
+
+class FakeResponseFuture(object):
+    """Pages of rows behind the paging interface of the driver's ResponseFuture"""
+    def __init__(self, pages):
+        self.pages = pages
+        self.page = 0
+        self.fetches = 0
+
+    def result(self):
+        return self
+
+    @property
+    def current_rows(self):
+        return list(self.pages[self.page])
+
+    @property
+    def has_more_pages(self):
+        return self.page + 1 < len(self.pages)
+
+    def start_fetching_next_page(self):
+        self.fetches += 1
+        self.page += 1
+
+
+class FakeSession(object):
+    def __init__(self, pages):
+        self.pages = pages
+        self.prepared = []
+        self.executed = []
+        self.futures = []
+
+    def prepare(self, query):
+        self.prepared.append(FakePreparedStatement(query))
+        return self.prepared[-1]
+
+    def execute_async(self, statement, parameters=None):
+        self.executed.append((statement, parameters))
+        self.futures.append(FakeResponseFuture(self.pages))
+        return self.futures[-1]
+
+
+class FakeCluster(object):
+    def __init__(self, session):
+        self.session = session
+
+    def connect(self, keyspace):
+        return self.session
+
+
+def rows(*timestamps):
+    return [ FakeRow(ts, 'message number {} with enough words'.format(ts)) for ts in timestamps ]
+
+
+class CassandraExtractorTest(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession([ rows('1.0', '2.0'), rows('3.0'), rows('4.0', '5.0') ])
+        self.cluster = extractor.Cluster
+        extractor.Cluster = lambda ips: FakeCluster(self.session)
+        self.extractor = extractor.CassandraExtractor(['127.0.0.1'], 'keyspace', 'messages', fetch_size=2)
+
+    def tearDown(self):
+        extractor.Cluster = self.cluster
+
+    def test_range_query_is_prepared_once_and_bound(self):
+        list(self.extractor.get_messages('day', channel='general'))
+        list(self.extractor.get_messages('hour', periods=3, channel='random'))
+
+        self.assertEqual(len(self.session.prepared), 1)
+        self.assertEqual(self.session.prepared[0].query, 'SELECT * FROM messages WHERE channel = ? AND ts > ?;')
+
+        (day, _), (hours, _) = self.session.executed
+        self.assertIs(day.prepared, self.session.prepared[0])
+        self.assertEqual(day.values[0], 'general')
+        self.assertAlmostEqual(float(day.values[1]), time.time() - 86400, delta=60)
+        self.assertEqual(hours.values[0], 'random')
+        self.assertAlmostEqual(float(hours.values[1]), time.time() - 3 * 3600, delta=60)
+        self.assertEqual(day.fetch_size, 2)
+
+    def test_prepared_per_table(self):
+        list(self.extractor.get_messages('day', channel='general', table='other'))
+        list(self.extractor.get_messages('day', channel='general'))
+        self.assertEqual([ p.query.split()[3] for p in self.session.prepared ], ['other', 'messages'])
+
+    def test_pages_are_streamed_in_order(self):
+        messages = list(self.extractor.get_messages('day', channel='general'))
+        self.assertEqual([ m.id for m in messages ], ['1.0', '2.0', '3.0', '4.0', '5.0'])
+        self.assertEqual(self.session.futures[0].fetches, 2)
+
+    def test_next_page_is_fetched_before_consuming_the_current_one(self):
+        stream = self.extractor.get_messages('day', channel='general')
+        next(stream)
+        self.assertEqual(self.session.futures[0].fetches, 1)
+        list(stream)
+
+    def test_custom_queries_are_paged(self):
+        self.extractor.add_query('everything', 'SELECT * FROM messages;')
+        messages = list(self.extractor.get_messages('everything'))
+        statement, parameters = self.session.executed[0]
+        self.assertEqual(statement.fetch_size, 2)
+        self.assertIsNone(parameters)
+        self.assertEqual(len(messages), 5)
+
+    def test_short_messages_are_skipped(self):
+        self.session.pages = [ [ FakeRow('1.0', 'too short') ] + rows('2.0') ]
+        messages = list(self.extractor.get_messages('day', channel='general'))
+        self.assertEqual([ m.id for m in messages ], ['2.0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
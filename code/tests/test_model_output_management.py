@@ -0,0 +1,111 @@
+import time
+import threading
+import unittest
+
+from tests import fakes
+
+mom = fakes.import_service('nlp/utils', 'model_output_management')
+
+
+class FakeS3(object):
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.uploads = []
+        self.lock = threading.Lock()
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    def _upload(self, data, bucket, key, extra_args):
+        with self.lock:
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        time.sleep(self.delay)
+        with self.lock:
+            self.concurrent -= 1
+            self.uploads.append((data, bucket, key, extra_args))
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None):
+        self._upload(fileobj.read(), bucket, key, ExtraArgs)
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None):
+        self._upload(path, bucket, key, ExtraArgs)
+
+
+class FakeSimpleDB(object):
+    def __init__(self):
+        self.batches = []
+
+    def batch_put_attributes(self, DomainName, Items):
+        self.batches.append((DomainName, Items))
+
+
+class OutputHelperTest(unittest.TestCase):
+    def setUp(self):
+        self.helper = mom.OutputHelper()
+        self.helper.s3 = FakeS3()
+        self.helper.sdb = FakeSimpleDB()
+        self.helper.s3_status = self.helper.sdb_status = True
+
+    def add_vizes(self, n, data=True):
+        for i in range(n):
+            url = 'https://team.slack.com/archives/general/p14761234{:02d}000100'.format(i)
+            self.helper.add_viz('/tmp/viz_{}.png'.format(i), url, 'T1', 'general', 1, 'days',
+                                viz_data=b'png {}'.format(i) if data else None)
+
+    def items(self):
+        return [ item for _, batch in self.helper.sdb.batches for item in batch ]
+
+    def test_images_are_uploaded_from_memory_as_public(self):
+        self.add_vizes(3)
+        self.helper.upload(s3_bucket='bucket')
+
+        uploads = sorted(self.helper.s3.uploads, key=lambda u: u[2])
+        self.assertEqual([ (data, bucket, key) for data, bucket, key, _ in uploads ],
+                         [ (b'png {}'.format(i), 'bucket', 'T1_general_1_days_{}.png'.format(i)) for i in range(3) ])
+        for _, _, _, extra_args in uploads:
+            self.assertEqual(extra_args, {'ACL': 'public-read', 'ContentType': 'image/png'})
+
+    def test_images_without_data_are_uploaded_from_their_path(self):
+        self.add_vizes(1, data=False)
+        self.helper.upload(s3_bucket='bucket')
+        self.assertEqual(self.helper.s3.uploads,
+                         [ ('/tmp/viz_0.png', 'bucket', 'T1_general_1_days_0.png', {'ACL': 'public-read'}) ])
+
+    def test_uploads_are_concurrent(self):
+        self.helper.s3.delay = 0.05
+        self.add_vizes(8)
+        self.helper.upload(processes=4)
+        self.assertEqual(len(self.helper.s3.uploads), 8)
+        self.assertGreater(self.helper.s3.max_concurrent, 1)
+        self.assertLessEqual(self.helper.s3.max_concurrent, 4)
+
+    def test_simpledb_items_are_batched_with_the_count_last(self):
+        self.add_vizes(60)
+        self.helper.upload(simple_db_domain='domain')
+
+        self.assertEqual([ len(batch) for _, batch in self.helper.sdb.batches ], [25, 25, 11])
+        self.assertEqual(set(domain for domain, _ in self.helper.sdb.batches), set(['domain']))
+
+        items = self.items()
+        self.assertEqual([ item['Name'] for item in items[:-1] ],
+                         [ 'T1_general_1_days_{}'.format(i) for i in range(1, 61) ])
+        self.assertEqual(items[-1], {'Name': 'T1_general_1_days',
+                                     'Attributes': [{'Name': 'numMessages', 'Value': '60', 'Replace': True}]})
+
+        first = dict((a['Name'], a['Value']) for a in items[0]['Attributes'])
+        self.assertEqual(first, {'modelURL': 'https://s3.amazonaws.com/awaybot_test/T1_general_1_days_0.png',
+                                 'archiveURL': 'https://team.slack.com/archives/general/p1476123400000100'})
+
+    def test_count_is_last_on_a_full_batch(self):
+        self.add_vizes(24)
+        self.helper.upload()
+        self.assertEqual([ len(batch) for _, batch in self.helper.sdb.batches ], [25])
+        self.assertEqual(self.items()[-1]['Name'], 'T1_general_1_days')
+
+    def test_nothing_is_written_without_vizes(self):
+        self.helper.upload()
+        self.assertEqual((self.helper.s3.uploads, self.helper.sdb.batches), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
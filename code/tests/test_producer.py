@@ -0,0 +1,466 @@
+import time
+import socket
+import unittest
+
+from tests import fakes
+
+producer = fakes.import_service('producer', 'awaybot_producer')
+
+
+class FakeKafkaTimeoutError(Exception):
+    pass
+
+
+class FakeFuture(object):
+    """Send future that resolves when the producer is flushed (callbacks get the result appended to their args)"""
+    def __init__(self, value):
+        self.value = value
+        self.callbacks = []
+        self.errbacks = []
+
+    def add_callback(self, f, *args):
+        self.callbacks.append((f, args))
+
+    def add_errback(self, f, *args):
+        self.errbacks.append((f, args))
+
+    def succeed(self):
+        for f, args in self.callbacks:
+            f(*(args + ('metadata',)))
+
+    def fail(self, exception):
+        for f, args in self.errbacks:
+            f(*(args + (exception,)))
+
+
+class FakeKafkaProducer(object):
+    """KafkaProducer whose sends succeed on flush, unless their ts is in `failing` (or in `stuck`, never resolved)"""
+    def __init__(self, **configs):
+        self.configs = configs
+        self.sent = []
+        self.futures = []
+        self.failing = set()
+        self.stuck = set()
+        self.rejecting = set()
+        self.flush_timeouts = []
+        self.closed = False
+
+    def send(self, topic, value):
+        if value['ts'] in self.rejecting:
+            raise FakeKafkaTimeoutError('buffer full')
+        self.configs['value_serializer'](value)
+        self.sent.append(value['ts'])
+        self.futures.append(FakeFuture(value))
+        return self.futures[-1]
+
+    def flush(self, timeout=None):
+        self.flush_timeouts.append(timeout)
+        futures, self.futures = self.futures, []
+        for future in futures:
+            if future.value['ts'] in self.stuck:
+                self.futures.append(future)
+            elif future.value['ts'] in self.failing:
+                future.fail(Exception('delivery failed'))
+            else:
+                future.succeed()
+        if self.futures:
+            raise FakeKafkaTimeoutError('{} messages not delivered in {}s'.format(len(self.futures), timeout))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSimpleDB(object):
+    def __init__(self):
+        self.items = {}
+        self.puts = []
+
+    def get_attributes(self, DomainName, ItemName, AttributeNames, ConsistentRead):
+        if (DomainName, ItemName) not in self.items:
+            return {}
+        return {'Attributes': [{'Name': 'ts', 'Value': self.items[(DomainName, ItemName)]}]}
+
+    def put_attributes(self, DomainName, ItemName, Attributes):
+        ts = [ a['Value'] for a in Attributes if a['Name'] == 'ts' ][0]
+        self.items[(DomainName, ItemName)] = ts
+        self.puts.append((ItemName, ts))
+
+
+def message(ts, team='T1'):
+    return {'user': u'U1', 'type': u'message', 'text': u'hello', 'channel': u'general', 'ts': ts, 'team': team,
+            'message_url': u'https://team.slack.com/archives/general/p{}'.format(ts.replace('.', '')),
+            'uuid': u'uuid-{}'.format(ts)}
+
+
+class ProducerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.kafka_producer = producer.KafkaProducer
+        producer.KafkaProducer = FakeKafkaProducer
+
+    def tearDown(self):
+        producer.KafkaProducer = self.kafka_producer
+
+    def make_producer(self, **kwargs):
+        p = producer.AwaybotProducer(kafka_ip='127.0.0.1:9092', **kwargs)
+        p.sdb = FakeSimpleDB()
+        p.sdb_status = True
+        p.connectKafkaProducer()
+        return p
+
+    def latest(self, p, team='T1'):
+        return p.sdb.items.get(('awaybot', team))
+
+
+class TimestampCheckpointTest(ProducerTestCase):
+    def test_writes_are_coalesced(self):
+        p = self.make_producer(checkpoint_count=3, checkpoint_interval=3600)
+        for ts in ['1500000000.000300', '1500000000.000100', '1500000000.000200']:
+            p.produceMessage('topic', message(ts))
+        self.assertEqual(p.sdb.puts, [('T1', '1500000000.000300')])
+
+        p.produceMessage('topic', message('1500000000.000500'))
+        p.produceMessage('topic', message('1500000000.000400'))
+        self.assertEqual(len(p.sdb.puts), 1)
+
+        p.close()
+        self.assertEqual(p.sdb.puts, [('T1', '1500000000.000300'), ('T1', '1500000000.000500')])
+        self.assertTrue(p.kp.closed)
+
+    def test_unacknowledged_messages_are_not_checkpointed(self):
+        p = self.make_producer(checkpoint_count=100)
+        p.produceMessage('topic', message('1500000000.000100'))
+        self.assertEqual(p.checkpoint.pending, {})
+        p.checkpoint.flush()
+        self.assertEqual(self.latest(p), '1500000000.000100')
+
+    def test_checkpoint_never_passes_a_failed_send(self):
+        p = self.make_producer(checkpoint_count=100)
+        p.kp.failing.add('1500000000.000200')
+        for ts in ['1500000000.000100', '1500000000.000200', '1500000000.000300']:
+            p.produceMessage('topic', message(ts))
+        p.produceMessage('topic', message('1500000000.000900', team='T2'))
+
+        p.checkpoint.flush()
+        self.assertEqual(self.latest(p), '1500000000.000199')
+        self.assertEqual(self.latest(p, 'T2'), '1500000000.000900')
+
+        # still failing: later acknowledgements do not move it either
+        p.produceMessage('topic', message('1500000000.000400'))
+        p.checkpoint.flush()
+        self.assertEqual(self.latest(p), '1500000000.000199')
+
+    def test_failed_messages_are_resent(self):
+        p = self.make_producer(checkpoint_count=100)
+        p.kp.failing.add('1500000000.000200')
+        for ts in ['1500000000.000100', '1500000000.000200', '1500000000.000300']:
+            p.produceMessage('topic', message(ts))
+        p.checkpoint.flush()
+        self.assertEqual(p.kp.sent.count('1500000000.000200'), 2)
+        self.assertIn('T1', p.checkpoint.failed)
+
+        # the next resend is delivered: the acknowledged timestamp is written
+        p.kp.failing.clear()
+        p.checkpoint.flush()
+        self.assertEqual(p.kp.sent.count('1500000000.000200'), 3)
+        self.assertEqual(p.checkpoint.failed, {})
+        self.assertEqual(self.latest(p), '1500000000.000300')
+
+    def test_rejected_sends_are_resent(self):
+        p = self.make_producer(checkpoint_count=100)
+        p.kp.rejecting.add('1500000000.000100')
+        p.produceMessage('topic', message('1500000000.000100'))
+        p.produceMessage('topic', message('1500000000.000200'))
+        p.kp.rejecting.clear()
+
+        p.checkpoint.flush()
+        self.assertEqual(p.kp.sent, ['1500000000.000200', '1500000000.000100'])
+        self.assertEqual(p.checkpoint.failed, {})
+
+    def test_previous_timestamp(self):
+        self.assertEqual(producer.TimestampCheckpoint.previousTimestamp('1476123456.000100'), '1476123456.000099')
+        self.assertEqual(producer.TimestampCheckpoint.previousTimestamp('1476123456.000000'), '1476123455.999999')
+
+
+class DeliveryTest(ProducerTestCase):
+    def test_producer_configuration(self):
+        p = self.make_producer(linger_ms=20, batch_size=32768, compression_type='gzip')
+        configs = p.kp.configs
+        self.assertEqual((configs['linger_ms'], configs['batch_size'], configs['compression_type']), (20, 32768, 'gzip'))
+        self.assertEqual(configs['value_serializer'], p.codec.encode)
+
+    def test_counters_follow_the_send_futures(self):
+        p = self.make_producer(checkpoint_count=100)
+        p.kp.failing.add('1500000000.000200')
+        for ts in ['1500000000.000100', '1500000000.000200', '1500000000.000300']:
+            p.produceMessage('topic', message(ts))
+        self.assertEqual(p.getSendStats(), {'in_flight': 3, 'acked': 0, 'failed': 0})
+
+        p.flushMessages()
+        self.assertEqual(p.getSendStats(), {'in_flight': 0, 'acked': 2, 'failed': 1})
+
+    def test_rejected_sends_are_counted_as_failed(self):
+        p = self.make_producer(checkpoint_count=100)
+        p.kp.rejecting.add('1500000000.000100')
+        p.produceMessage('topic', message('1500000000.000100'))
+        self.assertEqual(p.getSendStats(), {'in_flight': 0, 'acked': 0, 'failed': 1})
+
+    def test_events_outside_the_schema_are_skipped(self):
+        p = self.make_producer(checkpoint_count=100)
+        p.produceMessage('topic', {'type': 'presence_change', 'user': 'U1'})
+        self.assertEqual(p.kp.sent, [])
+        self.assertEqual(p.getSendStats(), {'in_flight': 0, 'acked': 0, 'failed': 0})
+
+    def test_flush_when_too_many_messages_are_in_flight(self):
+        p = self.make_producer(max_in_flight=2, checkpoint_count=100)
+        p.produceMessage('topic', message('1500000000.000100'))
+        self.assertEqual(p.kp.flush_timeouts, [])
+        p.produceMessage('topic', message('1500000000.000200'))
+        self.assertEqual(len(p.kp.flush_timeouts), 1)
+        self.assertEqual(p.getSendStats(), {'in_flight': 0, 'acked': 2, 'failed': 0})
+
+    def test_flush_is_bounded_by_its_timeout(self):
+        p = self.make_producer(flush_timeout=5, checkpoint_count=100)
+        p.kp.stuck.add('1500000000.000200')
+        p.produceMessage('topic', message('1500000000.000100'))
+        p.produceMessage('topic', message('1500000000.000200'))
+
+        # the timeout error of the producer is logged, not raised
+        p.flushMessages()
+        self.assertEqual(p.kp.flush_timeouts, [5])
+        self.assertEqual(p.getSendStats(), {'in_flight': 1, 'acked': 1, 'failed': 0})
+
+
+class FakeSlackClient(object):
+    """SlackClient serving channels.history pages (newest first) of scripted channels
+
+    `errors` maps a channel to the list of errors returned by its next calls (before its pages)
+    """
+    def __init__(self, channels, errors=None):
+        self.channels = channels
+        self.errors = errors or {}
+        self.calls = []
+
+    def api_call(self, method, timeout=None, **kwargs):
+        self.calls.append((method, kwargs))
+        channel = kwargs['channel']
+        if self.errors.get(channel):
+            return {'ok': False, 'error': self.errors[channel].pop(0)}
+        if channel not in self.channels:
+            return {'ok': False, 'error': 'channel_not_found'}
+
+        history = [ m for m in self.channels[channel] if float(m['ts']) > float(kwargs['oldest']) ]
+        if 'latest' in kwargs:
+            history = [ m for m in history if float(m['ts']) < float(kwargs['latest']) ]
+        history.sort(key=lambda m: -float(m['ts']))
+        count = kwargs['count']
+        return {'ok': True, 'messages': [ dict(m) for m in history[:count] ], 'has_more': len(history) > count}
+
+
+def history(*timestamps):
+    return [ {'user': u'U1', 'type': u'message', 'text': u'hello', 'ts': u'{}.000100'.format(ts)} for ts in timestamps ]
+
+
+class SlackHistoryTest(ProducerTestCase):
+    def setUp(self):
+        super(SlackHistoryTest, self).setUp()
+        self.sleeps = []
+        self.sleep = producer.time.sleep
+        producer.time.sleep = self.sleeps.append
+
+    def tearDown(self):
+        producer.time.sleep = self.sleep
+        super(SlackHistoryTest, self).tearDown()
+
+    def make_producer(self, **kwargs):
+        p = super(SlackHistoryTest, self).make_producer(**kwargs)
+        p.slack_status = True
+        return p
+
+    def test_pages_are_followed(self):
+        p = self.make_producer()
+        p.sc = FakeSlackClient({'C1': history(*range(1, 25))})
+        messages = p.fetchChannelHistory('C1', '3.000100', count=7)
+        self.assertEqual([ m['ts'] for m in messages ], [ u'{}.000100'.format(ts) for ts in range(4, 25) ])
+        self.assertEqual(len(p.sc.calls), 3)
+        self.assertNotIn('latest', p.sc.calls[0][1])
+        self.assertEqual(p.sc.calls[1][1]['latest'], u'18.000100')
+
+    def test_rate_limits_back_off_exponentially(self):
+        p = self.make_producer()
+        p.sc = FakeSlackClient({'C1': history(1, 2, 3)}, errors={'C1': ['ratelimited', 'ratelimited']})
+        messages = p.fetchChannelHistory('C1', count=2, backoff=1)
+        self.assertEqual(self.sleeps, [1, 2])
+        self.assertEqual(len(messages), 3)
+
+    def test_rate_limit_retries_are_bounded(self):
+        p = self.make_producer()
+        p.sc = FakeSlackClient({'C1': history(1)}, errors={'C1': ['ratelimited'] * 10})
+        self.assertEqual(p.fetchChannelHistory('C1', max_retries=3, backoff=0.5), [])
+        self.assertEqual(self.sleeps, [0.5, 1.0, 2.0])
+
+    def test_other_errors_are_not_retried(self):
+        p = self.make_producer()
+        for error in ['channel_not_found', 'not_in_channel', 'invalid_auth']:
+            p.sc = FakeSlackClient({'C1': history(1)}, errors={'C1': [error]})
+            self.assertEqual(p.fetchChannelHistory('C1'), [])
+            self.assertEqual(len(p.sc.calls), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_channels_are_fetched_concurrently_in_order(self):
+        p = self.make_producer()
+        p.sc = FakeSlackClient({'C1': history(5, 1, 3), 'C3': history(2, 4)})
+        channels = [{'C1': 'general'}, {'C2': 'missing'}, {'C3': 'random'}]
+        messages = list(p.fetchSlackHistory('T1', 'https://team.slack.com/archives/', channels, '0'))
+
+        self.assertEqual([ (m['channel'], m['ts']) for m in messages ],
+                         [ ('general', u'1.000100'), ('general', u'3.000100'), ('general', u'5.000100'),
+                           ('random', u'2.000100'), ('random', u'4.000100') ])
+        self.assertEqual(messages[0]['team'], 'T1')
+        self.assertEqual(messages[0]['message_url'], 'https://team.slack.com/archives/general/p1000100')
+        self.assertTrue(all(p.codec.accepts(m) for m in messages))
+
+
+class FakeSSLSocket(object):
+    """One end of a socket pair; `buffered` frames are held by the ssl layer (reported by `pending`)"""
+    def __init__(self, sock, ssl_buffer):
+        self.sock = sock
+        self.ssl_buffer = ssl_buffer
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def pending(self):
+        return len(self.ssl_buffer)
+
+
+class TooManyPings(BaseException):
+    """Stops an RTM loop stuck pinging (not an Exception, which the loop handles by reconnecting)"""
+
+
+class FakeRtmServer(object):
+    def __init__(self, client, max_pings=1):
+        self.client = client
+        self.pings = 0
+        self.max_pings = max_pings
+
+    def ping(self):
+        self.pings += 1
+        if self.pings > self.max_pings:
+            raise TooManyPings()
+        self.client.on_ping(self)
+
+
+class FakeRtmClient(object):
+    """SlackClient whose rtm_read returns one frame per call, like slackclient 1.0.2's `websocket_safe_read`
+
+    Frames are either held by the ssl layer (`ssl_buffer`, the socket is not readable) or by websocket-client
+    (`ws_buffer`, the socket is readable once, when they arrive)
+    """
+    def __init__(self, pending=True):
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(0)
+        self.ssl_buffer = []
+        self.ws_buffer = []
+        self.server = FakeRtmServer(self)
+        self.server.websocket = type('WebSocket', (object,), {})()
+        self.server.websocket.sock = FakeSSLSocket(self.reader, self.ssl_buffer) if pending else self.reader
+        self.connections = 0
+        self.reads = 0
+        self.errors = []
+        self.on_ping = lambda server: None
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+    def rtm_connect(self):
+        self.connections += 1
+        return True
+
+    def arrive(self, *texts):
+        """Frames arriving together in a single tcp segment"""
+        self.ws_buffer.extend(texts)
+        self.writer.send(b'x')
+
+    def rtm_read(self):
+        self.reads += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.ws_buffer:
+            try:
+                self.reader.recv(1)
+            except socket.error:
+                pass  # the tcp segment was already read
+            return [ self.event(self.ws_buffer.pop(0)) ]
+        if self.ssl_buffer:
+            return [ self.event(self.ssl_buffer.pop(0)) ]
+        return []
+
+    @staticmethod
+    def event(text):
+        return {'type': 'message', 'text': text, 'ts': '{:.6f}'.format(time.time()), 'user': 'U1'}
+
+
+class RtmConnectionTest(ProducerTestCase):
+    def setUp(self):
+        super(RtmConnectionTest, self).setUp()
+        self.sleeps = []
+        self.sleep = producer.time.sleep
+        producer.time.sleep = self.sleeps.append
+
+    def tearDown(self):
+        producer.time.sleep = self.sleep
+        super(RtmConnectionTest, self).tearDown()
+
+    def open(self, client, **kwargs):
+        p = self.make_producer()
+        p.sc = client
+        p.slack_status = True
+        self.addCleanup(client.close)
+        return p, p.openRtmConnection('T1', **kwargs)
+
+    def test_frames_arriving_together_are_read_without_waiting(self):
+        client = FakeRtmClient(pending=False)
+        p, events = self.open(client, ping_interval=1)
+        client.arrive('a', 'b', 'c')
+
+        start = time.time()
+        self.assertEqual([ next(events)['text'] for _ in range(3) ], ['a', 'b', 'c'])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(client.server.pings, 0)
+
+    def test_frames_buffered_by_ssl_are_read_without_waiting(self):
+        client = FakeRtmClient()
+        p, events = self.open(client, ping_interval=1)
+        client.ssl_buffer.extend(['a', 'b'])
+
+        start = time.time()
+        self.assertEqual([ next(events)['text'] for _ in range(2) ], ['a', 'b'])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(client.server.pings, 0)
+
+    def test_idle_connections_are_pinged_and_checkpointed(self):
+        client = FakeRtmClient()
+        p, events = self.open(client, ping_interval=0.01)
+        p.checkpoint.pending['T1'] = '1500000000.000100'
+        client.on_ping = lambda server: client.arrive('after ping')
+
+        event = next(events)
+        self.assertEqual(event['text'], 'after ping')
+        self.assertEqual((event['team'], client.server.pings), ('T1', 1))
+        self.assertEqual(self.latest(p), '1500000000.000100')
+
+    def test_errors_reconnect_with_backoff(self):
+        client = FakeRtmClient()
+        p, events = self.open(client, ping_interval=1, max_backoff=3)
+        client.errors.extend([IOError('closed')] * 3)
+        client.arrive('a')
+
+        self.assertEqual(next(events)['text'], 'a')
+        self.assertEqual(self.sleeps, [2, 3, 3])
+        self.assertEqual(client.connections, 4)
+        self.assertEqual(p.getIngestLatency()['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
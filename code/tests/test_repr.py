@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+
+from fakes import import_checkout
+
+representation = import_checkout('nlp.geometry.repr')
+
+
+class FakeVocab(object):
+    def __init__(self, index):
+        self.index = index
+
+
+class FakeWord2VecModel(object):
+    """Stand-in for gensim's Word2Vec with a fixed vector per word"""
+    vector_size = 3
+
+    def __init__(self, words):
+        self.vocab = dict( (w, FakeVocab(i)) for i, w in enumerate(words) )
+        self.syn0 = np.arange(3. * len(words)).reshape(len(words), 3)
+
+    def __getitem__(self, word):
+        return self.syn0[self.vocab[word].index]
+
+
+def glove(vocab):
+    model = representation.GloVe.__new__(representation.GloVe)
+    model.mmap = False
+    model.vocab = dict( (w, np.array(v, dtype=float)) for w, v in vocab.items() )
+    return model
+
+
+def word2vec(words):
+    model = representation.Word2Vec.__new__(representation.Word2Vec)
+    model.model = FakeWord2VecModel(words)
+    return model
+
+
+class EmbedBatchTest(unittest.TestCase):
+    TEXTS = ['hello world', '', 'World unknown', '   ', 'hello']
+
+    def test_glove_batch_matches_every_call(self):
+        model = glove({'hello': [1, 0], 'world': [0, 1], '<unk>': [-1, -1]})
+        np.testing.assert_allclose(model.embed_batch(self.TEXTS), [ model(text) for text in self.TEXTS ])
+
+    def test_word2vec_batch_matches_every_call_with_known_words(self):
+        model = word2vec(['hello', 'world'])
+        texts = ['hello world', 'World', 'hello']
+        np.testing.assert_allclose(model.embed_batch(texts), [ model(text) for text in texts ])
+
+    def test_word2vec_gives_each_empty_text_its_own_random_vector(self):
+        model = word2vec(['hello', 'world'])
+        np.random.seed(0)
+        batch = model.embed_batch(['', 'hello', '', ''])
+        np.random.seed(0)
+        expected = [ model(text) for text in ['', '', ''] ]
+        np.testing.assert_allclose(batch[[0, 2, 3]], expected)
+        self.assertFalse(np.allclose(batch[0], batch[2]))
+        np.testing.assert_allclose(batch[1], model('hello'))
+
+    def test_empty_batch(self):
+        model = glove({'hello': [1, 0], '<unk>': [-1, -1]})
+        self.assertEqual(model.embed_batch([]).shape, (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from fakes import import_nlp
+
+summarization = import_nlp('nlp.models.summarization')
+
+
+class FakeMessage(object):
+    def __init__(self, text):
+        self.text = text
+
+
+def window(*topics):
+    return [ [ FakeMessage(text) for text in topic ] for topic in topics ]
+
+
+# No word is in every topic and no n-gram repeats a word: the scores of TFIDF are well defined
+WINDOW = window(['kafka producer sends avro records', 'producer batches kafka records quickly'],
+                ['cassandra cluster stores slack messages', 'cluster replicates cassandra rows', 'slack messages arrive'],
+                ['wordcloud renders top terms', 'wordcloud cache keeps rendered images', 'images of slack terms'])
+
+
+class SparseTFIDFTest(unittest.TestCase):
+    def assertSameTopTerms(self, expected, got):
+        self.assertEqual([ term for term, _ in expected ], [ term for term, _ in got ])
+        for (_, expected_score), (_, score) in zip(expected, got):
+            self.assertAlmostEqual(expected_score, score, places=12)
+
+    def test_unigram_top_terms_match_tfidf(self):
+        expected, model = summarization.TFIDF(WINDOW), summarization.SparseTFIDF(WINDOW)
+        for document_id in xrange(len(WINDOW)):
+            for top in (1, 3, 100):
+                self.assertSameTopTerms(expected.get_top_terms(document_id, top=top),
+                                        model.get_top_terms(document_id, top=top))
+
+    def test_n_gram_top_terms_match_tfidf(self):
+        expected, model = summarization.TFIDF(WINDOW, n_grams=2), summarization.SparseTFIDF(WINDOW, n_grams=2)
+        for document_id in xrange(len(WINDOW)):
+            for top in (1, 3, 100):
+                self.assertSameTopTerms(expected.get_top_terms(document_id, top=top),
+                                        model.get_top_terms(document_id, top=top))
+                self.assertSameTopTerms(expected.get_top_terms(document_id, top=top, unigram=True),
+                                        model.get_top_terms(document_id, top=top, unigram=True))
+
+    def test_n_grams_without_a_score_are_dropped(self):
+        # 'very very' repeats its word and every word of 'shared words' is in every topic
+        model = summarization.SparseTFIDF(window(['very very kafka', 'shared words'], ['shared words cassandra']),
+                                          n_grams=2)
+        terms = [ term for term, _ in model.get_top_terms(0, top=100) ]
+        self.assertEqual(terms, ['very kafka'])
+
+    def test_rank_rows_keeps_ties_in_column_order(self):
+        matrix = sparse.csr_matrix(np.array([[.5, .2, .5, .5, .1],
+                                             [0., .3, 0., .3, .3],
+                                             [0., 0., 0., 0., 0.]]))
+        ranked = summarization.SparseTFIDF.rank_rows(matrix, 2)
+        self.assertEqual([ cols.tolist() for cols, _ in ranked ], [[0, 2], [1, 3], []])
+        self.assertEqual([ values.tolist() for _, values in ranked ], [[.5, .5], [.3, .3], []])
+
+    def test_rank_rows_matches_a_stable_sort(self):
+        rnd = np.random.RandomState(0)
+        # Few distinct values, so that most rows have ties at the cut-off
+        matrix = sparse.csr_matrix(rnd.randint(0, 4, size=(30, 12)) / 4.)
+        for block_size in (1, 20, 2 ** 20):
+            model = type('BlockedSparseTFIDF', (summarization.SparseTFIDF,), {'BLOCK_SIZE': block_size})
+            for top in (1, 3, 12, 50):
+                for row, (cols, values) in zip(matrix.toarray(), model.rank_rows(matrix, top)):
+                    expected = sorted([ (col, value) for col, value in enumerate(row) if value > 0 ],
+                                      key=lambda x: x[1], reverse=True)[:top]
+                    self.assertEqual(zip(cols.tolist(), values.tolist()), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from fakes import import_nlp
+
+window = import_nlp('nlp.text.window')
+topic = import_nlp('nlp.text.topic')
+
+
+class FakeMessage(object):
+    """Unprocessed message, only identified by its text"""
+    is_processed = False
+    repr_id = None
+
+    def __init__(self, text):
+        self.text = text
+        self.timestamp = text
+
+
+class WindowSinceTest(unittest.TestCase):
+    def setUp(self):
+        self.window = window.Window()
+        self.window.activate_topic(topic.Topic(start_message=FakeMessage('a0'), reason='start'))
+
+    def insert(self, *messages):
+        for message in messages:
+            self.window.insert_message(FakeMessage(message), 'similar')
+
+    def messages(self, since_window):
+        return [ [ m.text for m in t.messages ] for t in since_window ]
+
+    def test_since_keeps_messages_after_the_snapshot(self):
+        start = self.window.snapshot()
+        self.insert('a1', 'a2')
+        self.assertEqual(self.messages(self.window.since(start)), [['a1', 'a2']])
+
+    def test_since_until_leaves_out_later_messages(self):
+        start = self.window.snapshot()
+        self.insert('a1')
+        end = self.window.snapshot()
+        self.insert('a2')
+        self.assertEqual(self.messages(self.window.since(start, until=end)), [['a1']])
+
+    def test_since_until_leaves_out_later_topics(self):
+        start = self.window.snapshot()
+        self.insert('a1')
+        end = self.window.snapshot()
+        self.window.activate_topic(topic.Topic(start_message=FakeMessage('b0'), reason='start'))
+        self.assertEqual(self.messages(self.window.since(start, until=end)), [['a1']])
+
+
+if __name__ == '__main__':
+    unittest.main()